@@ -1,4 +1,4 @@
-import os.path, json, time, traceback
+import os.path, json, time, traceback, struct, weakref, zlib
 import random # import random only so art scripts don't have to
 import numpy as np
 
@@ -13,6 +13,9 @@ VERT_STRIDE = 4 * VERT_LENGTH
 ELEM_STRIDE = 6
 # UVs: 2 floats per vert * 4 verts in a quad
 UV_STRIDE = 2 * 4
+# tile char/color/transform indices are stored once per tile as this type,
+# and only expanded to per-vertex data when uploaded for rendering
+TILE_DTYPE = np.uint16
 
 # starting document defaults
 DEFAULT_CHARSET = 'c64_petscii'
@@ -27,10 +30,24 @@ DEFAULT_LAYER_Z_OFFSET = 0.5
 ART_DIR = 'art/'
 ART_FILE_EXTENSION = 'psci'
 
+# .psci save format versions:
+# 1 = JSON dict, one sub-dict per tile
+# 2 = binary: small JSON header + zlib compressed per-frame tile arrays
+ART_SAVE_VERSION = 2
+# version 2+ files start with magic bytes, save version, JSON header length
+PSCI_MAGIC = b'PSCI'
+PSCI_HEADER_FORMAT = '<4sHI'
+# order of per-tile attribute planes within each binary frame
+PSCI_TILE_ATTRIBUTES = ['chars', 'fgs', 'bgs', 'xforms']
+PSCI_TILE_DTYPE = np.uint16
+
 THUMBNAIL_CACHE_DIR = 'thumbnails/'
 
 ART_SCRIPT_DIR = 'artscripts/'
 SCRIPT_FILE_EXTENSION = 'arsc'
+# if a script defines a function with this name, scripts running at a regular
+# rate run their body once and then only call this function, with Art as arg
+SCRIPT_UPDATE_FUNCTION_NAME = 'update'
 
 # flip/rotate UV constants
 UV_NORMAL = 0
@@ -78,6 +95,108 @@ uv_types_reverse = {
     uv_types[UV_FLIP270]: UV_FLIP270
 }
 
+# uv_types as an array indexed by transform, for bulk UV lookups
+uv_types_array = np.array([uv_types[i] for i in range(len(uv_types))],
+                          dtype=np.float32)
+
+
+# {(width, height, layers, quad_width, quad_height): (verts, elements)}
+# shared by all Arts with the same dimensions; arrays are read-only
+geo_cache = {}
+GEO_CACHE_MAX_SIZE = 32
+
+def get_geo_arrays(width, height, layers, quad_width, quad_height):
+    """
+    Return (vertex array, element array) tuple of quad geometry for an Art
+    of given dimensions, from cache if an Art of the same size built it.
+    """
+    key = (width, height, layers, quad_width, quad_height)
+    if key in geo_cache:
+        return geo_cache[key]
+    # vertices: top left, top right, bottom left, bottom right of each tile
+    tile_y, tile_x = np.mgrid[0:height, 0:width]
+    left_x = tile_x * quad_width
+    top_y = tile_y * -quad_height
+    right_x = left_x + quad_width
+    bottom_y = top_y - quad_height
+    # Z of all layers is 0, layer Z set in shader
+    verts = np.zeros((height, width, 4, VERT_LENGTH), dtype=np.float32)
+    verts[:, :, 0, 0], verts[:, :, 0, 1] = left_x, top_y
+    verts[:, :, 1, 0], verts[:, :, 1, 1] = right_x, top_y
+    verts[:, :, 2, 0], verts[:, :, 2, 1] = left_x, bottom_y
+    verts[:, :, 3, 0], verts[:, :, 3, 1] = right_x, bottom_y
+    verts = verts.reshape(height, width, VERT_STRIDE)
+    # all layers have identical verts
+    vert_array = np.repeat(verts[np.newaxis], layers, 0)
+    # vertex elements: 2 tris per quad, 4 verts per quad
+    first_verts = np.arange(layers * height * width, dtype=np.uint32) * 4
+    quad_elems = np.array([0, 1, 2, 1, 2, 3], dtype=np.uint32)
+    elem_array = (first_verts[:, np.newaxis] + quad_elems).flatten()
+    vert_array.flags.writeable = False
+    elem_array.flags.writeable = False
+    # don't let cache grow forever, eg during lots of resizing
+    if len(geo_cache) >= GEO_CACHE_MAX_SIZE:
+        geo_cache.pop(next(iter(geo_cache)))
+    geo_cache[key] = vert_array, elem_array
+    return vert_array, elem_array
+
+# {script filename: (file modified time, compiled code object)}
+script_code_cache = {}
+
+def get_script_code(script_filename):
+    """
+    Return compiled code for given art script, only reading and compiling
+    it if it's not cached or has changed on disk since it was.
+    """
+    mod_time = os.path.getmtime(script_filename)
+    cached = script_code_cache.get(script_filename)
+    if cached and cached[0] == mod_time:
+        return cached[1]
+    # compile with filename so tracebacks point into the script
+    code = compile(open(script_filename).read(), script_filename, 'exec')
+    script_code_cache[script_filename] = mod_time, code
+    return code
+
+def read_art_file(filename, load_tiles=True):
+    """
+    Return dict of data stored in given .psci file, laid out as in save
+    version 1 (JSON) with an added 'version' key. Layers from version 2+
+    files hold tile data as 2D arrays in 'chars', 'fgs', 'bgs' and 'xforms'
+    rather than as a list of tile dicts in 'tiles'.
+    If load_tiles is False, don't read version 2+ tile data.
+    """
+    f = open(filename, 'rb')
+    data = f.read(struct.calcsize(PSCI_HEADER_FORMAT))
+    # no magic bytes = version 1, entire file is JSON
+    if not data.startswith(PSCI_MAGIC):
+        data += f.read()
+        f.close()
+        d = json.loads(data.decode('utf-8'))
+        d['version'] = 1
+        return d
+    magic, version, header_size = struct.unpack(PSCI_HEADER_FORMAT, data)
+    if version > ART_SAVE_VERSION:
+        f.close()
+        raise ValueError('%s has unsupported save version %s' % (filename, version))
+    d = json.loads(f.read(header_size).decode('utf-8'))
+    d['version'] = version
+    # layer properties are stored once, not per-frame
+    layers = d.pop('layers')
+    shape = (len(PSCI_TILE_ATTRIBUTES), len(layers), d['height'], d['width'])
+    for frame in d['frames']:
+        frame_size = frame.pop('size')
+        frame['layers'] = [dict(layer) for layer in layers]
+        if not load_tiles:
+            continue
+        tiles = np.frombuffer(zlib.decompress(f.read(frame_size)),
+                              dtype=PSCI_TILE_DTYPE).reshape(shape)
+        for layer_index,layer in enumerate(frame['layers']):
+            for i,attr in enumerate(PSCI_TILE_ATTRIBUTES):
+                layer[attr] = tiles[i][layer_index]
+    f.close()
+    return d
+
+
 
 class Art:
     """
@@ -98,6 +217,8 @@ class Art:
     log_size_changes = False
     recalc_quad_height = True
     log_creation = False
+    save_as_json = False
+    "If True, save in old (version 1) JSON format instead of binary."
     
     def __init__(self, filename, app, charset, palette, width, height):
         "Creates a new, blank document with given parameters."
@@ -124,17 +245,22 @@ class Art:
         # cached camera position from before "zoom extents" invoked
         self.non_extents_camera_x = self.non_extents_camera_y = 0
         self.non_extents_camera_z = self.app.camera.start_zoom
-        # list of char/fg/bg arrays, one for each frame
+        # list of (layers, height, width) char/fg/bg arrays, one for each frame
         self.chars, self.fg_colors, self.bg_colors = [], [], []
-        # char transforms: UV coords, plus map (unused by renderer) for fast access
-        self.uv_mods, self.uv_maps = [], []
+        # char transforms, same layout; renderables look up UVs from these
+        self.uv_maps = []
         # table of {frame_number: bool} changed frames, processed each update()
         self.char_changed_frames, self.uv_changed_frames = {}, {}
         self.fg_changed_frames, self.bg_changed_frames = {}, {}
+        # table of {frame_number: [first, last]} changed tile rows, counting
+        # rows down through all layers; lets renderables upload only those
+        self.dirty_rows = {}
         self.renderables = []
         "List of TileRenderables using us - each new Renderable adds itself"
-        self.instances = []
-        "List of ArtInstances using us as their source"
+        self.instances = weakref.WeakSet()
+        "Set of ArtInstances using us as their source, held weakly"
+        self.instance_shared_arrays = set()
+        "ids of our tile data arrays that ArtInstances hold read-only views of"
         # init frames and layers - ArtFromDisk has its own logic for this
         self.init_layers()
         self.init_frames()
@@ -146,6 +272,8 @@ class Art:
         self.scripts = []
         self.script_rates = []
         self.scripts_next_exec_time = []
+        # (code, update function) for each running script, set on first run
+        self.script_update_functions = []
         # tell renderables to rebind vert and element buffers next update
         self.geo_changed = True
         # run update once before renderables initialize so they have
@@ -190,22 +318,19 @@ class Art:
         "Add a blank frame at the specified index (len+1 to add to end)."
         self.frames += 1
         self.frame_delays.insert(index, delay)
-        tiles = self.layers * self.width * self.height
-        shape = (self.layers, self.height, self.width, 4)
+        shape = (self.layers, self.height, self.width)
         fg, bg = 0, 0
         if self.app.ui:
             fg = self.app.ui.selected_fg_color
             bg = self.app.ui.selected_bg_color
-        new_char = np.zeros(shape, dtype=np.float32)
-        new_fg = np.full(shape, fg, dtype=np.float32)
-        new_bg = np.full(shape, bg, dtype=np.float32)
-        new_uv = np.full(shape, UV_NORMAL, dtype=np.uint32)
+        new_char = np.zeros(shape, dtype=TILE_DTYPE)
+        new_fg = np.full(shape, fg, dtype=TILE_DTYPE)
+        new_bg = np.full(shape, bg, dtype=TILE_DTYPE)
+        new_uv = np.full(shape, UV_NORMAL, dtype=TILE_DTYPE)
         self.chars.insert(index, new_char)
         self.fg_colors.insert(index, new_fg)
         self.bg_colors.insert(index, new_bg)
         self.uv_maps.insert(index, new_uv)
-        # UV init is more complex than just all zeroes
-        self.uv_mods.insert(index, self.new_uv_layers(self.layers))
         # all but lowest layer = transparent
         for l in range(1, self.layers):
             self.clear_frame_layer(index, l, 0, fg)
@@ -230,7 +355,6 @@ class Art:
         self.frame_delays.insert(dest_frame_index, delay)
         # copy source frame's char/color arrays
         self.chars.insert(dest_frame_index, self.chars[src_frame_index].copy())
-        self.uv_mods.insert(dest_frame_index, self.uv_mods[src_frame_index].copy())
         self.uv_maps.insert(dest_frame_index, self.uv_maps[src_frame_index].copy())
         self.fg_colors.insert(dest_frame_index, self.fg_colors[src_frame_index].copy())
         self.bg_colors.insert(dest_frame_index, self.bg_colors[src_frame_index].copy())
@@ -245,7 +369,6 @@ class Art:
         self.chars.pop(index)
         self.fg_colors.pop(index)
         self.bg_colors.pop(index)
-        self.uv_mods.pop(index)
         self.uv_maps.pop(index)
         self.frames -= 1
         self.mark_all_frames_changed()
@@ -257,12 +380,10 @@ class Art:
         char_data = self.chars.pop(src_index)
         fg_data = self.fg_colors.pop(src_index)
         bg_data = self.bg_colors.pop(src_index)
-        uv_data = self.uv_mods.pop(src_index)
         uv_map_data = self.uv_maps.pop(src_index)
         self.chars.insert(dest_index, char_data)
         self.fg_colors.insert(dest_index, fg_data)
         self.bg_colors.insert(dest_index, bg_data)
-        self.uv_mods.insert(dest_index, uv_data)
         self.uv_maps.insert(dest_index, uv_map_data)
         self.mark_all_frames_changed()
     
@@ -289,7 +410,6 @@ class Art:
             self.chars[frame] = duplicate_layer_array(self.chars[frame])
             self.fg_colors[frame] = duplicate_layer_array(self.fg_colors[frame])
             self.bg_colors[frame] = duplicate_layer_array(self.bg_colors[frame])
-            self.uv_mods[frame] = duplicate_layer_array(self.uv_mods[frame])
             self.uv_maps[frame] = duplicate_layer_array(self.uv_maps[frame])
         self.layers += 1
         z = z if z is not None else self.layers_z[src_index]
@@ -310,18 +430,49 @@ class Art:
     def clear_frame_layer(self, frame, layer, bg_color=0, fg_color=None):
         "Clear given layer of given frame to transparent BG + no characters."
         # "clear" UVs to UV_NORMAL
-        for y in range(self.height):
-            for x in range(self.width):
-                self.uv_mods[frame][layer][y][x] = uv_types[UV_NORMAL]
-                self.uv_maps[frame][layer][y][x] = UV_NORMAL
-                self.chars[frame][layer][y][x] = 0
-                self.fg_colors[frame][layer][y][x] = fg_color or 0
-                self.bg_colors[frame][layer][y][x] = bg_color
-        # tell this frame to update
-        self.char_changed_frames[frame] = True
-        self.fg_changed_frames[frame] = True
-        self.bg_changed_frames[frame] = True
-        self.uv_changed_frames[frame] = True
+        self.fill_region(frame, layer, 0, 0, self.width, self.height,
+                         0, fg_color or 0, bg_color, UV_NORMAL)
+    
+    def fill_region(self, frame, layer, x0, y0, x1, y1, char=None, fg=None,
+                    bg=None, xform=None):
+        """
+        Set given tile attributes for all tiles in given frame/layer, from
+        x0,y0 up to but not including x1,y1. Attributes given as None are
+        left unchanged.
+        """
+        self.unshare_frame(frame)
+        region = (layer, slice(y0, y1), slice(x0, x1))
+        if min(y1, self.height) > y0:
+            self.mark_rows_dirty(frame, layer, y0, min(y1, self.height) - 1)
+        if char is not None:
+            self.chars[frame][region] = char
+            self.char_changed_frames[frame] = True
+        if fg is not None:
+            self.fg_colors[frame][region] = fg
+            self.fg_changed_frames[frame] = True
+        if bg is not None:
+            self.bg_colors[frame][region] = bg
+            self.bg_changed_frames[frame] = True
+        if xform is not None:
+            self.uv_maps[frame][region] = xform
+            self.uv_changed_frames[frame] = True
+    
+    def unshare_frame(self, frame):
+        """
+        Give this Art its own copy of given frame's tile data if it's shared
+        between an ArtInstance and its source, before writing to it.
+        Instances hold read-only views of the source's arrays, and the
+        source's arrays stay writable, so either side copies on first write.
+        """
+        for array_list in [self.chars, self.fg_colors, self.bg_colors, self.uv_maps]:
+            array = array_list[frame]
+            if not array.flags.writeable:
+                array_list[frame] = array.copy()
+            elif id(array) in self.instance_shared_arrays:
+                # instances keep the old array, unchanged; a stale id here
+                # (array since freed and id reused) just costs a copy
+                self.instance_shared_arrays.discard(id(array))
+                array_list[frame] = array.copy()
     
     def delete_layer(self, index):
         "Delete layer at given index."
@@ -329,7 +480,6 @@ class Art:
             self.chars[frame] = np.delete(self.chars[frame], index, 0)
             self.fg_colors[frame] = np.delete(self.fg_colors[frame], index, 0)
             self.bg_colors[frame] = np.delete(self.bg_colors[frame], index, 0)
-            self.uv_mods[frame] = np.delete(self.uv_mods[frame], index, 0)
             self.uv_maps[frame] = np.delete(self.uv_maps[frame], index, 0)
         self.layers_z.pop(index)
         self.layers_visibility.pop(index)
@@ -397,7 +547,7 @@ class Art:
         crop_y = new_height < self.height
         for frame in range(self.frames):
             for array in [self.chars, self.fg_colors, self.bg_colors,
-                          self.uv_mods, self.uv_maps]:
+                          self.uv_maps]:
                 if crop_x:
                     array[frame] = array[frame].take(range(x0, x1), axis=2)
                 if crop_y:
@@ -408,24 +558,24 @@ class Art:
         y_add = new_height - self.height
         #print('%s expand: %sw + %s = %s, %sh + %s = %s' % (self.filename,
         #    self.width, x_add, new_width, self.height, y_add, new_height))
-        def expand_array(array, fill_value, stride):
+        def expand_array(array, fill_value):
             # add columns (increasing width)
             if x_add > 0:
                 # before height has changed, take care not to append
                 # incorrectly sized columns
                 h = new_height if new_height < self.height else self.height
-                add_shape = (self.layers, h, x_add, stride)
-                add = np.full(add_shape, fill_value, dtype=np.float32)
+                add_shape = (self.layers, h, x_add)
+                add = np.full(add_shape, fill_value, dtype=TILE_DTYPE)
                 array = np.append(array, add, 2)
             # add rows (increasing height)
             if y_add > 0:
-                add_shape = (self.layers, y_add, new_width, stride)
-                add = np.full(add_shape, fill_value, dtype=np.float32)
+                add_shape = (self.layers, y_add, new_width)
+                add = np.full(add_shape, fill_value, dtype=TILE_DTYPE)
                 array = np.append(array, add, 1)
             # can't modify passed array in-place
             return array
         for frame in range(self.frames):
-            self.chars[frame] = expand_array(self.chars[frame], 0, 4)
+            self.chars[frame] = expand_array(self.chars[frame], 0)
             fg, bg = 0, 0
             if self.app.ui:
                 fg = self.app.ui.selected_fg_color
@@ -433,10 +583,9 @@ class Art:
                 # if not, blank bg for all new tiles (original default behavior)
                 if bg_fill:
                     bg = self.app.ui.selected_bg_color
-            self.fg_colors[frame] = expand_array(self.fg_colors[frame], fg, 4)
-            self.bg_colors[frame] = expand_array(self.bg_colors[frame], bg, 4)
-            self.uv_mods[frame] = expand_array(self.uv_mods[frame], uv_types[UV_NORMAL], UV_STRIDE)
-            self.uv_maps[frame] = expand_array(self.uv_maps[frame], UV_NORMAL, 4)
+            self.fg_colors[frame] = expand_array(self.fg_colors[frame], fg)
+            self.bg_colors[frame] = expand_array(self.bg_colors[frame], bg)
+            self.uv_maps[frame] = expand_array(self.uv_maps[frame], UV_NORMAL)
     
     def mark_frame_changed(self, frame):
         "Given frame at given index as changed for next render."
@@ -444,6 +593,31 @@ class Art:
         self.fg_changed_frames[frame] = True
         self.bg_changed_frames[frame] = True
         self.uv_changed_frames[frame] = True
+        self.dirty_rows[frame] = [0, self.layers * self.height - 1]
+    
+    def mark_rows_dirty(self, frame, layer, first_y, last_y):
+        "Add given range of rows on given frame/layer to the frame's dirty rows."
+        # resolve negative indices, eg -1 for bottom line
+        base = (layer % self.layers) * self.height
+        first = base + first_y % self.height
+        last = base + last_y % self.height
+        rows = self.dirty_rows.get(frame)
+        if rows:
+            rows[0] = min(rows[0], first)
+            rows[1] = max(rows[1], last)
+        else:
+            self.dirty_rows[frame] = [first, last]
+    
+    def get_dirty_byte_range(self, frame, tile_nbytes):
+        """
+        Return (offset, size) in bytes of given frame's dirty rows within a
+        buffer that holds given # of bytes per tile, or None if none tracked.
+        """
+        rows = self.dirty_rows.get(frame)
+        if not rows:
+            return None
+        row_nbytes = self.width * tile_nbytes
+        return rows[0] * row_nbytes, (rows[1] - rows[0] + 1) * row_nbytes
     
     def mark_all_frames_changed(self):
         "Mark all frames as changed for next render."
@@ -470,52 +644,10 @@ class Art:
         (Re)build the vertex and element arrays used by all layers.
         Run if the Art has untracked changes to size or layer count.
         """
-        shape = (self.layers, self.height, self.width, VERT_STRIDE)
-        self.vert_array = np.empty(shape, dtype=np.float32)
-        all_elems_size = self.layers * self.width * self.height * ELEM_STRIDE
-        self.elem_array = np.empty(shape=all_elems_size, dtype=np.uint32)
-        # generate geo according to art size
-        # vert_index corresponds to # of verts, loc_index to position in array
-        # (given that each vert has 3 components)
-        vert_index = 0
-        elem_index = 0
-        for layer in range(self.layers):
-            for tile_y in range(self.height):
-                for tile_x in range(self.width):
-                    # vertices
-                    left_x = tile_x * self.quad_width
-                    top_y = tile_y * -self.quad_height
-                    right_x = left_x + self.quad_width
-                    bottom_y = top_y - self.quad_height
-                    x0,y0 = left_x, top_y
-                    x1,y1 = right_x, top_y
-                    x2,y2 = left_x, bottom_y
-                    x3,y3 = right_x, bottom_y
-                    # Z of all layers is 0, layer Z set in shader
-                    verts = [x0, y0, 0]
-                    verts += [x1, y1, 0]
-                    verts += [x2, y2, 0]
-                    verts += [x3, y3, 0]
-                    self.vert_array[layer][tile_y][tile_x] = verts
-                    # vertex elements
-                    elements = [vert_index, vert_index+1, vert_index+2]
-                    elements += [vert_index+1, vert_index+2, vert_index+3]
-                    self.elem_array[elem_index:elem_index+ELEM_STRIDE] = elements
-                    elem_index += ELEM_STRIDE
-                    # 4 verts in a quad
-                    vert_index += 4
-    
-    def new_uv_layers(self, layers):
-        "Return given # of layer's worth of vanilla UV array data."
-        shape = (layers, self.height, self.width, UV_STRIDE)
-        array = np.zeros(shape, dtype=np.float32)
-        # default new layer of UVs to "normal" transform
-        uvs = uv_types[UV_NORMAL]
-        for layer in range(layers):
-            for y in range(self.height):
-                for x in range(self.width):
-                    array[layer][y][x] = uvs
-        return array
+        self.vert_array, self.elem_array = get_geo_arrays(self.width, self.height,
+                                                          self.layers,
+                                                          self.quad_width,
+                                                          self.quad_height)
     
     def is_tile_inside(self, x, y):
         "Return True if given x,y tile coord is within our bounds."
@@ -524,20 +656,19 @@ class Art:
     # get methods
     def get_char_index_at(self, frame, layer, x, y):
         "Return character index for given frame/layer/x,y tile."
-        return int(self.chars[frame][layer][y][x][0])
+        return int(self.chars[frame][layer][y][x])
     
     def get_fg_color_index_at(self, frame, layer, x, y):
         "Return foreground color index for given frame/layer/x,y tile."
-        return int(self.fg_colors[frame][layer][y][x][0])
+        return int(self.fg_colors[frame][layer][y][x])
     
     def get_bg_color_index_at(self, frame, layer, x, y):
         "Return background color index for given frame/layer/x,y tile."
-        return int(self.bg_colors[frame][layer][y][x][0])
+        return int(self.bg_colors[frame][layer][y][x])
     
     def get_char_transform_at(self, frame, layer, x, y):
         "Return character transform enum for given frame/layer/x,y tile."
-        # read from mapping, rather than casting raw UV coords for tuple key
-        return self.uv_maps[frame][layer][y][x][0]
+        return int(self.uv_maps[frame][layer][y][x])
     
     def get_tile_at(self, frame, layer, x, y):
         """
@@ -553,9 +684,11 @@ class Art:
     # set methods
     def set_char_index_at(self, frame, layer, x, y, char_index):
         "Set character index for given frame/layer/x,y tile."
+        self.unshare_frame(frame)
         self.chars[frame][layer][y][x] = char_index
         # next update, tell renderables on the changed frame to update buffers
         self.char_changed_frames[frame] = True
+        self.mark_rows_dirty(frame, layer, y, y)
     
     def set_color_at(self, frame, layer, x, y, color_index, fg=True):
         """
@@ -566,12 +699,14 @@ class Art:
         # modulo to resolve any negative indices
         if 0 < color_index >= len(self.palette.colors):
             color_index %= len(self.palette.colors)
+        self.unshare_frame(frame)
         # no functional differences between fg and bg color update,
         # so use the same code path with different parameters
         update_array = self.fg_colors[frame] if fg else self.bg_colors[frame]
         update_array[layer][y][x] = color_index
         self.fg_changed_frames[frame] = True
         self.bg_changed_frames[frame] = True
+        self.mark_rows_dirty(frame, layer, y, y)
     
     def set_all_non_transparent_colors(self, new_color_index):
         """
@@ -597,10 +732,10 @@ class Art:
         Set character transform (X/Y flip, 0/90/180/270 rotate) for given
         frame/layer/x,y tile.
         """
-        self.uv_mods[frame][layer][y][x] = uv_types[transform]
-        # keep mapping, used only for quick access, in sync
+        self.unshare_frame(frame)
         self.uv_maps[frame][layer][y][x] = transform
         self.uv_changed_frames[frame] = True
+        self.mark_rows_dirty(frame, layer, y, y)
     
     def set_tile_at(self, frame, layer, x, y, char_index=None, fg=None, bg=None,
                     transform=None, set_all=False):
@@ -638,7 +773,8 @@ class Art:
         "Mirrors Art left-to-right."
         command = EntireArtCommand(self)
         command.save_tiles(before=True)
-        for a in [self.chars, self.fg_colors, self.bg_colors, self.uv_mods, self.uv_maps]:
+        self.unshare_frame(frame)
+        for a in [self.chars, self.fg_colors, self.bg_colors, self.uv_maps]:
             a[frame][layer] = np.fliplr(a[frame][layer])
         if self.app.ui.flip_affects_xforms:
             flips = {
@@ -661,7 +797,8 @@ class Art:
         "Flips Art upside down."
         command = EntireArtCommand(self)
         command.save_tiles(before=True)
-        for a in [self.chars, self.fg_colors, self.bg_colors, self.uv_mods, self.uv_maps]:
+        self.unshare_frame(frame)
+        for a in [self.chars, self.fg_colors, self.bg_colors, self.uv_maps]:
             a[frame][layer] = np.flipud(a[frame][layer])
         if self.app.ui.flip_affects_xforms:
             flips = {
@@ -683,7 +820,8 @@ class Art:
     
     def shift(self, frame, layer, amount_x, amount_y):
         "Shift + wrap art on given frame and layer by given amount in X and Y."
-        for a in [self.chars, self.fg_colors, self.bg_colors, self.uv_mods, self.uv_maps]:
+        self.unshare_frame(frame)
+        for a in [self.chars, self.fg_colors, self.bg_colors, self.uv_maps]:
             a[frame][layer] = np.roll(a[frame][layer], amount_x, 1)
             a[frame][layer] = np.roll(a[frame][layer], amount_y, 0)
         self.mark_frame_changed(frame)
@@ -728,7 +866,8 @@ class Art:
             do_fg = self.fg_changed_frames[r.frame]
             do_bg = self.bg_changed_frames[r.frame]
             if do_char or do_fg or do_bg or do_uvs:
-                r.update_tile_buffers(do_char, do_uvs, do_fg, do_bg)
+                r.update_tile_buffers(do_char, do_uvs, do_fg, do_bg,
+                                      self.dirty_rows.get(r.frame))
         # update instances if we chaned
         if self.changed_this_frame() and self.instances:
             for instance in self.instances:
@@ -740,6 +879,7 @@ class Art:
             self.fg_changed_frames[f] = False
             self.bg_changed_frames[f] = False
             self.uv_changed_frames[f] = False
+        self.dirty_rows = {}
         self.updated_this_tick = True
     
     def save_to_file(self):
@@ -768,39 +908,17 @@ class Art:
              'selected_bg_color': int(self.selected_bg_color),
              'selected_xform': int(self.selected_xform)
         }
-        # preferred character set and palette, default used if not found
-        # remember camera location
-        # frames and layers are dicts w/ lists of their data + a few properties
-        frames = []
-        for frame_index in range(self.frames):
-            frame = { 'delay': self.frame_delays[frame_index] }
-            layers = []
-            for layer_index in range(self.layers):
-                layer = {'z': self.layers_z[layer_index],
-                         'visible': int(self.layers_visibility[layer_index]),
-                         'name': self.layer_names[layer_index]
-                }
-                tiles = []
-                for y in range(self.height):
-                    for x in range(self.width):
-                        char = int(self.chars[frame_index][layer_index][y][x][0])
-                        fg = int(self.fg_colors[frame_index][layer_index][y][x][0])
-                        bg = int(self.bg_colors[frame_index][layer_index][y][x][0])
-                        # use get method for transform, data's not simply an int
-                        xform = int(self.get_char_transform_at(frame_index, layer_index, x, y))
-                        tiles.append({'char': char, 'fg': fg, 'bg': bg, 'xform': xform})
-                layer['tiles'] = tiles
-                layers.append(layer)
-            frame['layers'] = layers
-            frames.append(frame)
-        d['frames'] = frames
-        # MAYBE-TODO: below gives not-so-pretty-printing, find out way to control
-        # formatting for better output
-        json.dump(d, open(self.filename, 'w'), sort_keys=True, indent=1)
+        if self.save_as_json:
+            self.write_json_file(d)
+        else:
+            self.write_binary_file(d)
         end_time = time.time()
         self.set_unsaved_changes(False)
         #self.app.log('saved %s to disk in %.5f seconds' % (self.filename, end_time - start_time))
         self.app.log('saved %s' % self.filename)
+        # headless apps (eg batch conversion) may not keep a thumbnail cache
+        if not self.app.cache_dir:
+            return
         # remove old thumbnail
         thumb_dir = self.app.cache_dir + THUMBNAIL_CACHE_DIR
         if os.path.exists(self.filename):
@@ -811,23 +929,11 @@ class Art:
         new_thumb_filename = thumb_dir + self.app.get_file_hash(self.filename) + '.png'
         write_thumbnail(self.app, self.filename, new_thumb_filename)
     
-    def ALT_save_to_file(self):
-        # TEST alt save format research
-        # main idea: save flat lists of char/fg/bg/xform per-frame-per-layer
-        # savetest.psci: 500x300x5, 38s vs 8.6s save, 63MB vs 33MB (vs 11MB w/ indent=None)
-        # TODO:
-        # - test read perf too
-        # - save version checking (if none found in PSCI, assume v1)
-        # - support multiple save+load code paths for different save versions
-        def get_flat_int_list(layer_array):
-            return list(map(int, layer_array.flatten()))[::4]
-        start_time = time.time()
-        d = {'width': self.width, 'height': self.height,
-             'charset': self.charset.name, 'palette': self.palette.name,
-             'active_frame': self.active_frame,
-             'active_layer': self.active_layer,
-             'camera': (self.camera_x, self.camera_y, self.camera_z)
-        }
+    def write_json_file(self, d):
+        "Write given header dict plus all tile data in version 1 JSON format."
+        # preferred character set and palette, default used if not found
+        # remember camera location
+        # frames and layers are dicts w/ lists of their data + a few properties
         frames = []
         for frame_index in range(self.frames):
             frame = { 'delay': self.frame_delays[frame_index] }
@@ -837,18 +943,60 @@ class Art:
                          'visible': int(self.layers_visibility[layer_index]),
                          'name': self.layer_names[layer_index]
                 }
-                # compile lists-of-ints for chars, colors, xforms
-                layer['chars'] = get_flat_int_list(self.chars[frame_index][layer_index])
-                layer['fgs'] = get_flat_int_list(self.fg_colors[frame_index][layer_index])
-                layer['bgs'] = get_flat_int_list(self.bg_colors[frame_index][layer_index])
-                layer['xforms'] = get_flat_int_list(self.uv_maps[frame_index][layer_index])
+                tiles = []
+                for y in range(self.height):
+                    for x in range(self.width):
+                        char = int(self.chars[frame_index][layer_index][y][x])
+                        fg = int(self.fg_colors[frame_index][layer_index][y][x])
+                        bg = int(self.bg_colors[frame_index][layer_index][y][x])
+                        xform = int(self.uv_maps[frame_index][layer_index][y][x])
+                        tiles.append({'char': char, 'fg': fg, 'bg': bg, 'xform': xform})
+                layer['tiles'] = tiles
                 layers.append(layer)
             frame['layers'] = layers
             frames.append(frame)
         d['frames'] = frames
-        json.dump(d, open(self.filename + '2', 'w'), sort_keys=True, indent=None)
-        end_time = time.time()
-        self.app.log('ALT saved %s to disk in %.5f seconds' % (self.filename, end_time - start_time))
+        # MAYBE-TODO: below gives not-so-pretty-printing, find out way to control
+        # formatting for better output
+        json.dump(d, open(self.filename, 'w'), sort_keys=True, indent=1)
+    
+    def get_frame_tile_data(self, frame_index):
+        """
+        Return (attribute, layer, height, width) array of given frame's tile
+        data, with attributes in PSCI_TILE_ATTRIBUTES order.
+        """
+        return np.array([self.chars[frame_index],
+                         self.fg_colors[frame_index],
+                         self.bg_colors[frame_index],
+                         self.uv_maps[frame_index]],
+                        dtype=PSCI_TILE_DTYPE)
+    
+    def write_binary_file(self, d):
+        """
+        Write given header dict plus all tile data in version 2 binary format:
+        magic bytes, version and header size, then JSON header, then one
+        zlib compressed block of tile data per frame.
+        """
+        d['layers'] = []
+        for layer_index in range(self.layers):
+            d['layers'].append({'z': self.layers_z[layer_index],
+                                'visible': int(self.layers_visibility[layer_index]),
+                                'name': self.layer_names[layer_index]})
+        frame_blocks = []
+        d['frames'] = []
+        for frame_index in range(self.frames):
+            block = zlib.compress(self.get_frame_tile_data(frame_index).tobytes())
+            frame_blocks.append(block)
+            d['frames'].append({'delay': self.frame_delays[frame_index],
+                                'size': len(block)})
+        header = json.dumps(d, sort_keys=True).encode('utf-8')
+        f = open(self.filename, 'wb')
+        f.write(struct.pack(PSCI_HEADER_FORMAT, PSCI_MAGIC, ART_SAVE_VERSION,
+                            len(header)))
+        f.write(header)
+        for block in frame_blocks:
+            f.write(block)
+        f.close()
     
     def set_unsaved_changes(self, new_status):
         "Mark this Art as having unsaved changes in Art Mode."
@@ -891,8 +1039,12 @@ class Art:
             command.save_tiles(before=True)
         # catch and log any exception
         try:
-            # run script
-            exec(open(script_filename).read())
+            # run script, and its update function once if it has one
+            namespace = self.get_script_namespace()
+            exec(get_script_code(script_filename), namespace)
+            update_function = namespace.get(SCRIPT_UPDATE_FUNCTION_NAME)
+            if callable(update_function):
+                update_function(self)
             # (assume script changed art)
             self.unsaved_changes = True
             logline = 'Executed %s' % script_filename
@@ -901,17 +1053,30 @@ class Art:
         except Exception as e:
             error = True
             logline = 'Error executing %s:' % script_filename
-            self.app.log(logline)
-            # skip first 3 lines of callstack before artscript exec
-            for line in traceback.format_exc().split('\n')[3:]:
-                if line.strip():
-                    self.app.log(line.rstrip())
+            self.log_script_error(script_filename, e)
         # write "after" state of command and commit
         if allow_undo:
             command.save_tiles(before=False)
             self.command_stack.commit_commands([command])
         self.app.ui.message_line.post_line(logline, error=error)
     
+    def get_script_namespace(self):
+        "Return a new namespace for an art script to run in, with us as self."
+        namespace = globals().copy()
+        namespace['self'] = self
+        return namespace
+    
+    def log_script_error(self, script_filename, e):
+        "Log given exception raised running given script, with its traceback."
+        self.app.log('Error executing %s:' % script_filename)
+        # skip callstack before artscript exec
+        tb = e.__traceback__
+        while tb and tb.tb_frame.f_code.co_filename != script_filename:
+            tb = tb.tb_next
+        for line in ''.join(traceback.format_exception(type(e), e, tb)).split('\n'):
+            if line.strip() and not line.startswith('Traceback'):
+                self.app.log(line.rstrip())
+    
     def is_script_running(self, script_filename):
         "Return True if script with given filename is currently running."
         script_filename = self.get_valid_script_filename(script_filename)
@@ -936,6 +1101,7 @@ class Art:
         # set next time
         next_run = (self.app.get_elapsed_time() / 1000) + rate
         self.scripts_next_exec_time.append(next_run)
+        self.script_update_functions.append(None)
     
     def stop_script(self, script_filename):
         "Halt this Art's execution of script with given filename."
@@ -950,10 +1116,11 @@ class Art:
         self.scripts.pop(script_index)
         self.script_rates.pop(script_index)
         self.scripts_next_exec_time.pop(script_index)
+        self.script_update_functions.pop(script_index)
     
     def stop_all_scripts(self):
         "Halt all art scripts executing on this Art."
-        for script_filename in self.scripts:
+        for script_filename in self.scripts[:]:
             self.stop_script(script_filename)
     
     def update_scripts(self):
@@ -962,23 +1129,49 @@ class Art:
         # don't run on game art while paused
         if self.app.game_mode and self.app.gw.paused:
             return
+        failed_scripts = []
         for i,script in enumerate(self.scripts):
             if (self.app.get_elapsed_time() / 1000) > self.scripts_next_exec_time[i]:
                 # execute script directly; don't use formal safeguards of run_script
-                exec(open(script).read())
+                try:
+                    self.run_script_tick(i)
+                except Exception as e:
+                    self.log_script_error(script, e)
+                    failed_scripts.append(script)
                 self.unsaved_changes = True
                 self.scripts_next_exec_time[i] += self.script_rates[i]
+        for script in failed_scripts:
+            self.stop_script(script)
+    
+    def run_script_tick(self, script_index):
+        """
+        Run one tick of running script at given index: its update function
+        if it defines one, else its entire body.
+        """
+        script = self.scripts[script_index]
+        code = get_script_code(script)
+        cached = self.script_update_functions[script_index]
+        # call update function we found last tick, unless script changed
+        if cached and cached[0] is code:
+            cached[1](self)
+            return
+        # first run (or script changed): run body, look for update function
+        namespace = self.get_script_namespace()
+        exec(code, namespace)
+        update_function = namespace.get(SCRIPT_UPDATE_FUNCTION_NAME)
+        if callable(update_function):
+            self.script_update_functions[script_index] = code, update_function
+            update_function(self)
+        else:
+            self.script_update_functions[script_index] = None
     
     def clear_line(self, frame, layer, line_y, fg_color_index=None,
                    bg_color_index=None):
         "Clear characters on given horizontal line, to optional given colors."
-        # TODO: use numpy slicing to do this much more quickly!
-        for x in range(self.width):
-            self.set_char_index_at(frame, layer, x, line_y, 0)
-            if fg_color_index:
-                self.set_color_at(frame, layer, x, line_y, fg_color_index)
-            if bg_color_index:
-                self.set_color_at(frame, layer, x, line_y, bg_color_index, False)
+        # resolve negative line index, eg -1 for bottom line
+        line_y %= self.height
+        self.fill_region(frame, layer, 0, line_y, self.width, line_y + 1, 0,
+                         fg_color_index, bg_color_index)
     
     def write_string(self, frame, layer, x, y, text, fg_color_index=None,
                      bg_color_index=None, right_justify=False):
@@ -1062,7 +1255,7 @@ class ArtFromDisk(Art):
     def __init__(self, filename, app):
         self.valid = False
         try:
-            d = json.load(open(filename))
+            d = read_art_file(filename)
         except:
             return
         width = d['width']
@@ -1127,36 +1320,45 @@ class ArtFromDisk(Art):
         self.frames = len(frames)
         self.active_frame = 0
         self.frame_delays = []
-        # build tile data arrays from frame+layer lists
-        shape = (self.layers, self.height, self.width, 4)
+        # build tile data arrays from frame+layer lists, a whole frame at once
         for frame in frames:
             self.frame_delays.append(frame['delay'])
-            chars = np.zeros(shape, dtype=np.float32)
-            uvs = self.new_uv_layers(self.layers)
-            uv_maps = np.zeros(shape, dtype=np.uint32)
-            fg_colors = chars.copy()
-            bg_colors = chars.copy()
-            for layer_index,layer in enumerate(frame['layers']):
-                x, y = 0, 0
-                for tile in layer['tiles']:
-                    chars[layer_index][y][x] = tile['char']
-                    fg_colors[layer_index][y][x] = tile['fg']
-                    bg_colors[layer_index][y][x] = tile['bg']
-                    uvs[layer_index][y][x] = uv_types[tile.get('xform', UV_NORMAL)]
-                    uv_maps[layer_index][y][x] = tile.get('xform', UV_NORMAL)
-                    x += 1
-                    if x >= self.width:
-                        x = 0
-                        y += 1
+            tiles = self.get_loaded_frame_tile_data(frame)
+            chars, fgs, bgs, xforms = tiles
             self.chars.append(chars)
-            self.fg_colors.append(fg_colors)
-            self.bg_colors.append(bg_colors)
-            self.uv_mods.append(uvs)
-            self.uv_maps.append(uv_maps)
+            self.fg_colors.append(fgs)
+            self.bg_colors.append(bgs)
+            self.uv_maps.append(xforms)
         # set active frame properly
         active_frame = self.loaded_data.get('active_frame', 0)
         self.set_active_frame(active_frame)
     
+    def get_loaded_frame_tile_data(self, frame):
+        """
+        Return (attribute, layer, height, width) array of tile data from
+        given loaded frame dict, with attributes in PSCI_TILE_ATTRIBUTES order.
+        """
+        shape = (len(PSCI_TILE_ATTRIBUTES), self.layers, self.height, self.width)
+        tiles = np.zeros(shape, dtype=TILE_DTYPE)
+        # transform defaults to UV_NORMAL (0), so zeroes are fine for
+        # tiles missing from short tile lists
+        flat_tiles = tiles.reshape(len(PSCI_TILE_ATTRIBUTES), self.layers, -1)
+        for layer_index,layer in enumerate(frame['layers']):
+            # version 2+: whole 2D arrays per tile attribute
+            if not 'tiles' in layer:
+                for i,attr in enumerate(PSCI_TILE_ATTRIBUTES):
+                    tiles[i][layer_index] = layer[attr]
+                continue
+            # version 1: list of tile dicts, L->R T->B; pull out each
+            # attribute's column and convert it in one go
+            layer_tiles = layer['tiles'][:self.width * self.height]
+            count = len(layer_tiles)
+            flat_tiles[0][layer_index][:count] = np.array([t['char'] for t in layer_tiles])
+            flat_tiles[1][layer_index][:count] = np.array([t['fg'] for t in layer_tiles])
+            flat_tiles[2][layer_index][:count] = np.array([t['bg'] for t in layer_tiles])
+            flat_tiles[3][layer_index][:count] = np.array([t.get('xform', UV_NORMAL) for t in layer_tiles])
+        return tiles
+    
     def first_update(self):
         # do nothing on first update during Art.init; we update after loading
         pass
@@ -1164,8 +1366,9 @@ class ArtFromDisk(Art):
 
 class ArtInstance(Art):
     """
-    Deep copy / clone of a source Art that can hold unique changes and be
-    restored to its source.
+    Copy-on-write clone of a source Art that can hold unique changes and be
+    restored to its source. Tile data is shared with the source until either
+    one writes to a frame, which then gets its own copy.
     """
     update_when_source_changes = True
     "Set False if you want to manually update this Art."
@@ -1175,15 +1378,19 @@ class ArtInstance(Art):
         self.filename = '%s_Instance%i' % (source.filename, time.time())
         self.app = source.app
         self.instances = None
+        self.instance_shared_arrays = set()
         self.char_changed_frames, self.uv_changed_frames = {}, {}
         self.fg_changed_frames, self.bg_changed_frames = {}, {}
+        self.dirty_rows = {}
         # init lists that should be retained across refreshes
         self.scripts = []
         self.script_rates = []
         self.scripts_next_exec_time = []
+        # (code, update function) for each running script, set on first run
+        self.script_update_functions = []
         self.renderables = []
         self.restore_from_source()
-        self.source.instances.append(self)
+        self.source.instances.add(self)
     
     def set_unsaved_changes(self, new_status):
         pass
@@ -1199,19 +1406,20 @@ class ArtInstance(Art):
         self.layers_visibility = self.source.layers_visibility[:]
         self.layer_names = self.source.layer_names[:]
         self.frame_delays = self.source.frame_delays[:]
-        # deep copy tile data lists
+        # share source's tile data, dropping any private copies we made:
+        # read-only views, so unshare_frame copies before we write, and the
+        # source copies before it writes to an array we're viewing
         self.chars, self.fg_colors, self.bg_colors = [], [], []
-        self.uv_mods, self.uv_maps = [], []
-        for frame_chars in self.source.chars:
-            self.chars.append(frame_chars.copy())
-        for frame_uvs in self.source.uv_mods:
-            self.uv_mods.append(frame_uvs.copy())
-        for frame_uv_maps in self.source.uv_maps:
-            self.uv_maps.append(frame_uv_maps.copy())
-        for frame_fg_colors in self.source.fg_colors:
-            self.fg_colors.append(frame_fg_colors.copy())
-        for frame_bg_colors in self.source.bg_colors:
-            self.bg_colors.append(frame_bg_colors.copy())
+        self.uv_maps = []
+        for src_list, dest_list in [(self.source.chars, self.chars),
+                                    (self.source.fg_colors, self.fg_colors),
+                                    (self.source.bg_colors, self.bg_colors),
+                                    (self.source.uv_maps, self.uv_maps)]:
+            for frame_array in src_list:
+                view = frame_array.view()
+                view.flags.writeable = False
+                dest_list.append(view)
+                self.source.instance_shared_arrays.add(id(frame_array))
         self.geo_changed = True
         self.mark_all_frames_changed()
         self.update()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Batch convert files with Playscii's importers and exporters, without
+opening a window or GL context, across multiple processes.
+
+Each input file is imported with the given importer (or loaded, if it's a
+.psci file), then exported with the given exporter (or saved as .psci).
+Output filenames come from the output pattern, where * is replaced with the
+input file's name sans extension.
+
+Examples:
+  batch.py 'ascii/*.txt' -i TextImporter
+  batch.py 'art/*.psci' -e PNGExporter -o 'png/*.png' -O scale=2
+  batch.py 'images/*.png' -i BitmapImageImporter -O palette=c64_original \\
+    -O art_width=40 -O art_height=25 -O bicubic_scale=False -j 8
+"""
+
+import os, sys, glob, time, ast, argparse, traceback, multiprocessing
+
+from art import ART_FILE_EXTENSION
+from headless import HeadlessApp
+
+# set per worker process by init_worker
+app = None
+importer_class, exporter_class = None, None
+options = {}
+
+def get_converter_class(classes, class_name):
+    "returns converter class with given name from given list, None if absent"
+    for c in classes:
+        if c.__name__ == class_name:
+            return c
+
+def get_output_filename(in_filename, out_pattern, extension):
+    "returns output filename for given input file and output pattern"
+    base_filename = os.path.splitext(os.path.basename(in_filename))[0]
+    if not out_pattern:
+        out_pattern = os.path.join(os.path.dirname(in_filename), '*')
+    elif os.path.isdir(out_pattern) or out_pattern.endswith(os.sep):
+        out_pattern = os.path.join(out_pattern, '*')
+    out_filename = out_pattern.replace('*', base_filename)
+    if not os.path.splitext(out_filename)[1]:
+        out_filename += '.%s' % extension
+    return os.path.abspath(out_filename)
+
+def parse_option(option):
+    "returns (key, value) from a key=value string; value is a Python literal or a string"
+    key, value = option.split('=', 1)
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return key, value
+
+def init_worker(importer_name, exporter_name, convert_options):
+    global app, importer_class, exporter_class, options
+    app = HeadlessApp()
+    importer_class = get_converter_class(app.get_importers(), importer_name)
+    exporter_class = get_converter_class(app.get_exporters(), exporter_name)
+    options = convert_options
+
+def convert(in_filename, out_filename):
+    "import or load given file, then export or save it; returns success"
+    if importer_class:
+        importer = importer_class(app, in_filename, options)
+        if not importer.success:
+            return False
+        # importers like bitmap conversion do their work over time
+        app.finish_conversion()
+        art = importer.art
+    else:
+        art = app.load_art(in_filename)
+        if not art:
+            app.log("Couldn't load %s" % in_filename)
+            return False
+        # exporters work on the active art
+        app.set_new_art_for_edit(art)
+    try:
+        os.makedirs(os.path.dirname(out_filename), exist_ok=True)
+        if exporter_class:
+            return exporter_class(app, out_filename, options).success
+        art.set_filename(out_filename)
+        art.save_to_file()
+        return True
+    finally:
+        app.close_art(art)
+
+def convert_file(filenames):
+    """
+    Converts one file in a worker process. Returns input filename, output
+    filename, success, time taken, and log lines if conversion failed.
+    """
+    in_filename, out_filename = filenames
+    app.log_lines = []
+    start_time = time.time()
+    try:
+        success = convert(in_filename, out_filename)
+    except:
+        app.log(traceback.format_exc())
+        success = False
+    errors = [] if success else app.log_lines
+    return in_filename, out_filename, success, time.time() - start_time, errors
+
+def list_converters():
+    lister = HeadlessApp()
+    for label, classes in [('Importers', lister.get_importers()),
+                           ('Exporters', lister.get_exporters())]:
+        print('%s:' % label)
+        for c in classes:
+            print('  %s - %s' % (c.__name__, c.format_name))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='*', help='input filenames or globs')
+    parser.add_argument('-o', '--output', help='output filename pattern or directory (default: *.<ext> beside each input)')
+    parser.add_argument('-i', '--importer', help='importer class name, eg TextImporter (default: load .psci)')
+    parser.add_argument('-e', '--exporter', help='exporter class name, eg PNGExporter (default: save .psci)')
+    parser.add_argument('-O', '--option', action='append', default=[],
+                        help='importer/exporter option as key=value, can be repeated')
+    parser.add_argument('-j', '--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes (default: # of CPUs)')
+    parser.add_argument('-l', '--list', action='store_true',
+                        help='list available importers and exporters')
+    args = parser.parse_args()
+    if args.list:
+        list_converters()
+        return 0
+    # resolve class names up front so typos fail before any work starts
+    lister = HeadlessApp()
+    extension = ART_FILE_EXTENSION
+    for class_name, classes in [(args.importer, lister.get_importers()),
+                                (args.exporter, lister.get_exporters())]:
+        if class_name and not get_converter_class(classes, class_name):
+            parser.error('unknown importer/exporter %s, see --list' % class_name)
+    if args.exporter:
+        extension = get_converter_class(lister.get_exporters(), args.exporter).file_extension
+    in_filenames = []
+    for pattern in args.inputs:
+        in_filenames += sorted(glob.glob(pattern))
+    if len(in_filenames) == 0:
+        parser.error('no input files found')
+    jobs = [(os.path.abspath(f), get_output_filename(f, args.output, extension))
+            for f in in_filenames]
+    convert_options = dict(parse_option(o) for o in args.option)
+    init_args = (args.importer, args.exporter, convert_options)
+    workers = max(1, min(args.workers, len(jobs)))
+    start_time = time.time()
+    if workers == 1:
+        init_worker(*init_args)
+        results = map(convert_file, jobs)
+    else:
+        pool = multiprocessing.Pool(workers, init_worker, init_args)
+        results = pool.imap_unordered(convert_file, jobs)
+    failures = 0
+    for in_filename, out_filename, success, time_taken, errors in results:
+        status = 'ok' if success else 'FAILED'
+        print('%-6s %7.3fs  %s -> %s' % (status, time_taken, in_filename, out_filename))
+        for line in '\n'.join(errors).splitlines():
+            print('         %s' % line)
+        if not success:
+            failures += 1
+    if workers > 1:
+        pool.close()
+        pool.join()
+    print('%s converted, %s failed in %.3f seconds (%s workers)' % (len(jobs) - failures, failures, time.time() - start_time, workers))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
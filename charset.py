@@ -1,4 +1,5 @@
 import os.path, string, time
+import numpy as np
 from PIL import Image
 
 from texture import Texture
@@ -118,6 +119,7 @@ class CharacterSet:
         # load image
         self.load_image_data()
         self.set_char_dimensions()
+        self.set_glyph_tables()
         # store base filename for easy comparisons with not-yet-loaded sets
         self.base_filename = os.path.splitext(os.path.basename(self.filename))[0]
         return True
@@ -126,23 +128,20 @@ class CharacterSet:
         # load and process image
         img = Image.open(self.image_filename)
         img = img.convert('RGBA')
-        # flip for openGL
-        img = img.transpose(Image.FLIP_TOP_BOTTOM)
         self.image_width, self.image_height = img.size
         # any pixel that is "transparent color" will be made fully transparent
         # any pixel that isn't will be opaque + tinted FG color
-        for y in range(self.image_height):
-            for x in range(self.image_width):
-                # TODO: PIL pixel access shows up in profiler, use numpy array
-                # assignment instead
-                color = img.getpixel((x, y))
-                if color[:3] == self.transparent_color[:3]:
-                    # MAYBE-TODO: does keeping non-alpha color improve sampling?
-                    img.putpixel((x, y), (color[0], color[1], color[2], 0))
-        self.texture = Texture(img.tobytes(), self.image_width, self.image_height)
-        # flip image data back and save it for later, eg image conversion
-        img = img.transpose(Image.FLIP_TOP_BOTTOM)
-        self.image_data = img
+        pixels = np.array(img)
+        transparent = (pixels[:, :, :3] == self.transparent_color[:3]).all(axis=2)
+        # MAYBE-TODO: does keeping non-alpha color improve sampling?
+        pixels[transparent, 3] = 0
+        # headless apps (eg batch conversion) have no GL context for textures
+        if not self.app.headless:
+            # flip for openGL
+            flipped = np.ascontiguousarray(pixels[::-1])
+            self.texture = Texture(flipped.tobytes(), self.image_width, self.image_height)
+        # save image data for later, eg image conversion
+        self.image_data = Image.fromarray(pixels)
     
     def set_char_dimensions(self):
         # store character dimensions and UV size
@@ -151,6 +150,36 @@ class CharacterSet:
         self.u_width = self.char_width / self.image_width
         self.v_height = self.char_height / self.image_height
     
+    def set_glyph_tables(self):
+        """
+        Build per-character tables from image data:
+        glyph_masks: (chars, char height, char width) bool, True = solid pixel
+        glyph_densities: (chars,) fraction of each character's pixels that
+        are solid, roughly its visual density
+        conversion_masks: like glyph_masks, but True where image is closer to
+        white than black (1-bit quantized), as image conversion matches it;
+        differs from glyph_masks for charsets with colors besides white
+        """
+        pixels = np.asarray(self.image_data)
+        self.glyph_masks = self.get_char_cells(pixels[:, :, 3] > 0)
+        self.glyph_densities = self.glyph_masks.mean(axis=(1, 2))
+        # convert charmap to 1-bit color
+        bw_pal_img = Image.new('P', (1, 1))
+        bw_pal = [0, 0, 0, 255, 255, 255]
+        while len(bw_pal) < 256 * 3:
+            bw_pal.append(0)
+        bw_pal_img.putpalette(tuple(bw_pal))
+        bw_img = self.image_data.convert('RGB').quantize(palette=bw_pal_img)
+        self.conversion_masks = self.get_char_cells(np.asarray(bw_img) == 1)
+    
+    def get_char_cells(self, image_array):
+        "Returns given (height, width) image array sliced into one cell per char"
+        cw, ch = self.char_width, self.char_height
+        mw, mh = self.map_width, self.map_height
+        cells = image_array[:mh * ch, :mw * cw]
+        cells = cells.reshape(mh, ch, mw, cw).transpose(0, 2, 1, 3)
+        return np.ascontiguousarray(cells.reshape(mh * mw, ch, cw))
+    
     def report(self):
         self.app.log('  source texture %s is %s x %s pixels' % (self.image_filename, self.image_width, self.image_height))
         self.app.log('  char pixel width/height is %s x %s' % (self.char_width, self.char_height))
@@ -176,16 +205,4 @@ class CharacterSet:
     
     def get_solid_pixels_in_char(self, char_index):
         "Returns # of solid pixels in character at given index"
-        tile_x = int(char_index % self.map_width)
-        tile_y = int(char_index / self.map_width)
-        x_start = self.char_width * tile_x
-        x_end = x_start + self.char_width
-        y_start = self.char_height * tile_y
-        y_end = y_start + self.char_height
-        pixels = 0
-        for x in range(x_start, x_end):
-            for y in range(y_start, y_end):
-                color = self.image_data.getpixel((x, y))
-                if color[3] > 0:
-                    pixels += 1
-        return pixels
+        return int(np.count_nonzero(self.glyph_masks[char_index]))
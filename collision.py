@@ -1,6 +1,8 @@
-import math
+import math, weakref
 from collections import namedtuple
 
+import numpy as np
+
 from renderable import TileRenderable
 from renderable_line import CircleCollisionRenderable, BoxCollisionRenderable, TileBoxCollisionRenderable
 
@@ -38,6 +40,25 @@ __pdoc__['Contact'] = "Represents a contact between two objects."
 ShapeOverlap = namedtuple('ShapeOverlap', ['x', 'y', 'dist', 'area', 'other'])
 __pdoc__['ShapeOverlap'] = "Represents a CollisionShape's overlap with another."
 
+SweepHit = namedtuple('SweepHit', ['time', 'x', 'y', 'other'])
+__pdoc__['SweepHit'] = """
+Represents a moving CollisionShape's first hit on another: time of impact as
+a 0-1 fraction of the move, and x,y normal of the surface hit.
+"""
+
+SWEEP_FLUSH_DEPTH = 0.02
+"""
+Sweeps that start no deeper than this inside a shape, eg flush against it
+give or take float rounding, and move further in hit it at time 0.
+"""
+
+tile_box_cache = weakref.WeakKeyDictionary()
+"""
+Merged boxes for CST_TILE objects by art, then (frame, layer), as
+(solid tile mask, list of tile ranges) tuples; reused until the mask changes.
+Arts are held weakly, so eg spawned objects' ArtInstances don't pile up here.
+"""
+
 
 class CollisionShape:
     """
@@ -45,7 +66,10 @@ class CollisionShape:
     Shapes are part of a Collideable which in turn is part of a GameObject.
     """
     def resolve_overlaps_with_shapes(self, shapes):
-        "Resolve this shape's overlap(s) with given list of shapes."
+        """
+        Resolve this shape's overlap(s) with given list of shapes.
+        Return True if there were any.
+        """
         overlaps = []
         for other in shapes:
             if other is self:
@@ -54,17 +78,21 @@ class CollisionShape:
             if overlap.dist < 0:
                 overlaps.append(overlap)
         if len(overlaps) == 0:
-            return
+            return False
         # resolve collisions in order of largest -> smallest overlap
         overlaps.sort(key=lambda item: item.area, reverse=True)
         for i,old_overlap in enumerate(overlaps):
             # resolve first overlap without recalculating
             overlap = self.get_overlap(old_overlap.other) if i > 0 else overlaps[0]
             self.resolve_overlap(overlap)
+        return True
     
     def resolve_overlap(self, overlap):
         "Resolve this shape's given overlap."
         other = overlap.other
+        # being touched wakes a sleeping object
+        if other.go.sleeping:
+            other.go.wake()
         # tell objects they're overlapping, pass penetration vector
         a_coll_b, a_started_b = self.go.overlapped(other.go, overlap)
         b_coll_a, b_started_a = other.go.overlapped(self.go, overlap)
@@ -100,6 +128,9 @@ class CollisionShape:
     
     def get_overlapping_static_shapes(self):
         "Return a list of static shapes that overlap with this shape."
+        cl = self.go.world.cl
+        if cl.use_spatial_hash:
+            return cl.get_static_shapes_near(self)
         overlapping_shapes = []
         shape_left, shape_top, shape_right, shape_bottom = self.get_box()
         # add padding to overlapping tiles check
@@ -157,6 +188,25 @@ class CircleCollisionShape(CollisionShape):
                                                    other.halfheight)
         area = abs(pdist1 * pdist2) if pdist1 < 0 else 0
         return ShapeOverlap(x=px, y=py, dist=pdist1, area=area, other=other)
+    
+    def get_sweep_hit(self, other, start_x, start_y, dx, dy):
+        """
+        Return SweepHit for this shape moving from given start point by dx, dy
+        into given other shape, None if it doesn't hit.
+        """
+        if type(other) is CircleCollisionShape:
+            hit = circle_sweep_circle(start_x, start_y, dx, dy, other.x, other.y,
+                                      self.radius + other.radius)
+        elif type(other) is AABBCollisionShape:
+            hit = circle_sweep_box(start_x, start_y, dx, dy, self.radius,
+                                   other.x, other.y, other.halfwidth,
+                                   other.halfheight)
+        else:
+            return None
+        if not hit:
+            return None
+        time, nx, ny = hit
+        return SweepHit(time=time, x=nx, y=ny, other=other)
 
 
 class AABBCollisionShape(CollisionShape):
@@ -196,6 +246,31 @@ class AABBCollisionShape(CollisionShape):
             px, py = -px, -py
         area = abs(pdist1 * pdist2) if pdist1 < 0 else 0
         return ShapeOverlap(x=px, y=py, dist=pdist1, area=area, other=other)
+    
+    def get_sweep_hit(self, other, start_x, start_y, dx, dy):
+        """
+        Return SweepHit for this shape moving from given start point by dx, dy
+        into given other shape, None if it doesn't hit.
+        """
+        if type(other) is AABBCollisionShape:
+            hit = box_sweep_box(start_x, start_y, dx, dy,
+                                self.halfwidth, self.halfheight,
+                                other.x, other.y,
+                                other.halfwidth, other.halfheight)
+        elif type(other) is CircleCollisionShape:
+            # circle moving the opposite way hits us at the same time
+            hit = circle_sweep_box(other.x, other.y, -dx, -dy, other.radius,
+                                   start_x, start_y,
+                                   self.halfwidth, self.halfheight)
+            # reverse normal if we're the box
+            if hit:
+                hit = hit[0], -hit[1], -hit[2]
+        else:
+            return None
+        if not hit:
+            return None
+        time, nx, ny = hit
+        return SweepHit(time=time, x=nx, y=ny, other=other)
 
 
 class Collideable:
@@ -236,8 +311,7 @@ class Collideable:
         for r in self.renderables:
             r.destroy()
         self.renderables = []
-        for shape in self.shapes:
-            self.cl._remove_shape(shape)
+        self.cl._remove_shapes(self.shapes)
         self.shapes = []
         "List of CollisionShapes"
     
@@ -266,52 +340,41 @@ class Collideable:
             self.go.app.dev_log("%s: Couldn't find collision layer with name '%s'" % (self.go.name, self.go.col_layer_name))
             return
         layer = self.go.art.layer_names.index(self.go.col_layer_name)
-        # tile is available if it's not empty and not already covered by a shape
-        def tile_available(tile_x, tile_y):
-            return self.go.art.get_char_index_at(frame, layer, tile_x, tile_y) != 0 and not (tile_x, tile_y) in self.tile_shapes
-        def tile_range_available(start_x, end_x, start_y, end_y):
-            for y in range(start_y, end_y + 1):
-                for x in range(start_x, end_x + 1):
-                    if not tile_available(x, y):
-                        return False
-            return True
-        for y in range(self.go.art.height):
-            for x in range(self.go.art.width):
-                if not tile_available(x, y):
-                    continue
-                # determine how big we can make this box
-                # first fill left to right
-                end_x = x
-                while end_x < self.go.art.width - 1 and tile_available(end_x + 1, y):
-                    end_x += 1
-                # then fill top to bottom
-                end_y = y
-                while end_y < self.go.art.height - 1 and tile_range_available(x, end_x, y, end_y + 1):
-                    end_y += 1
-                # compute origin and halfsizes of box covering tile range
-                wx1, wy1 = self.go.get_tile_loc(x, y, tile_center=True)
-                wx2, wy2 = self.go.get_tile_loc(end_x, end_y, tile_center=True)
-                wx = (wx1 + wx2) / 2
-                halfwidth = (end_x - x) * self.go.art.quad_width
-                halfwidth /= 2
-                halfwidth += self.go.art.quad_width / 2
-                wy = (wy1 + wy2) / 2
-                halfheight = (end_y - y) * self.go.art.quad_height
-                halfheight /= 2
-                halfheight += self.go.art.quad_height / 2
-                shape = self.cl._add_box_shape(wx, wy, halfwidth, halfheight,
-                                               self.go)
-                # fill in cell(s) in our tile collision dict,
-                # write list of tiles shape covers to shape.tiles
-                for tile_y in range(y, end_y + 1):
-                    for tile_x in range(x, end_x + 1):
-                        self.tile_shapes[(tile_x, tile_y)] = shape
-                        shape.tiles.append((tile_x, tile_y))
-                r = TileBoxCollisionRenderable(shape)
-                # update renderable once to set location correctly
-                r.update()
-                self.shapes.append(shape)
-                self.renderables.append(r)
+        # tile is solid if it's not empty
+        solid = self.go.art.chars[frame][layer] != 0
+        # only re-merge if chars on this frame's collision layer changed
+        art_cache = tile_box_cache.setdefault(self.go.art, {})
+        cached = art_cache.get((frame, layer), None)
+        if cached and np.array_equal(cached[0], solid):
+            tile_boxes = cached[1]
+        else:
+            tile_boxes = get_merged_tile_boxes(solid)
+            art_cache[(frame, layer)] = (solid, tile_boxes)
+        for x, y, end_x, end_y in tile_boxes:
+            # compute origin and halfsizes of box covering tile range
+            wx1, wy1 = self.go.get_tile_loc(x, y, tile_center=True)
+            wx2, wy2 = self.go.get_tile_loc(end_x, end_y, tile_center=True)
+            wx = (wx1 + wx2) / 2
+            halfwidth = (end_x - x) * self.go.art.quad_width
+            halfwidth /= 2
+            halfwidth += self.go.art.quad_width / 2
+            wy = (wy1 + wy2) / 2
+            halfheight = (end_y - y) * self.go.art.quad_height
+            halfheight /= 2
+            halfheight += self.go.art.quad_height / 2
+            shape = self.cl._add_box_shape(wx, wy, halfwidth, halfheight,
+                                           self.go)
+            # fill in cell(s) in our tile collision dict,
+            # write list of tiles shape covers to shape.tiles
+            for tile_y in range(y, end_y + 1):
+                for tile_x in range(x, end_x + 1):
+                    self.tile_shapes[(tile_x, tile_y)] = shape
+                    shape.tiles.append((tile_x, tile_y))
+            r = TileBoxCollisionRenderable(shape)
+            # update renderable once to set location correctly
+            r.update()
+            self.shapes.append(shape)
+            self.renderables.append(r)
     
     def get_shape_overlapping_point(self, x, y):
         "Return shape if it's overlapping given point, None if no overlap."
@@ -341,6 +404,7 @@ class Collideable:
         for shape in self.shapes:
             shape.x = obj.x + obj.col_offset_x
             shape.y = obj.y + obj.col_offset_y
+            self.cl.update_shape(shape)
     
     def set_shape_color(self, shape, new_color):
         "Set the color of a given shape's debug LineRenderable."
@@ -364,8 +428,91 @@ class Collideable:
         for r in self.renderables:
             r.destroy()
         # remove our shapes from CollisionLord's shape list
-        for shape in self.shapes:
-            self.cl._remove_shape(shape)
+        self.cl._remove_shapes(self.shapes)
+
+
+class SpatialHash:
+    """
+    Uniform grid of square cells, each holding the CollisionShapes whose
+    bounds overlap it, so only shapes near each other need to be checked.
+    """
+    max_shape_cells = 64
+    "Shapes covering more cells than this are returned by every query."
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        "Dict of sets of shapes by (x,y) cell coordinates"
+        self.shape_cells = {}
+        "Dict of cell ranges (left, bottom, right, top) by shape"
+        self.large_shapes = set()
+    
+    def get_cell_range(self, left, top, right, bottom):
+        "Return range of cells (left, bottom, right, top) covering given box."
+        size = self.cell_size
+        # shape boxes have top < bottom, object edges have top > bottom
+        if top < bottom:
+            top, bottom = bottom, top
+        return (math.floor(left / size), math.floor(bottom / size),
+                math.floor(right / size), math.floor(top / size))
+    
+    def update_shape(self, shape):
+        "Add given shape, or move it to the cells its current bounds cover."
+        cell_range = self.get_cell_range(*shape.get_box())
+        old_range = self.shape_cells.get(shape, None)
+        if cell_range == old_range:
+            return
+        if old_range:
+            self._unlink_shape(shape, old_range)
+        self._link_shape(shape, cell_range)
+        self.shape_cells[shape] = cell_range
+    
+    def remove_shape(self, shape):
+        cell_range = self.shape_cells.pop(shape, None)
+        if cell_range:
+            self._unlink_shape(shape, cell_range)
+    
+    def _get_cell_count(self, cell_range):
+        left, bottom, right, top = cell_range
+        return (right - left + 1) * (top - bottom + 1)
+    
+    def _link_shape(self, shape, cell_range):
+        if self._get_cell_count(cell_range) > self.max_shape_cells:
+            self.large_shapes.add(shape)
+            return
+        left, bottom, right, top = cell_range
+        for x in range(left, right + 1):
+            for y in range(bottom, top + 1):
+                self.cells.setdefault((x, y), set()).add(shape)
+    
+    def _unlink_shape(self, shape, cell_range):
+        if self._get_cell_count(cell_range) > self.max_shape_cells:
+            self.large_shapes.discard(shape)
+            return
+        left, bottom, right, top = cell_range
+        for x in range(left, right + 1):
+            for y in range(bottom, top + 1):
+                cell = self.cells[(x, y)]
+                cell.discard(shape)
+                if not cell:
+                    self.cells.pop((x, y))
+    
+    def get_shapes_overlapping_box(self, left, top, right, bottom):
+        "Return set of shapes in the cells overlapping given box."
+        shapes = set(self.large_shapes)
+        cell_range = self.get_cell_range(left, top, right, bottom)
+        cell_left, cell_bottom, cell_right, cell_top = cell_range
+        # for very large boxes, walking occupied cells is cheaper
+        if self._get_cell_count(cell_range) > len(self.cells):
+            for (x, y), cell in self.cells.items():
+                if cell_left <= x <= cell_right and cell_bottom <= y <= cell_top:
+                    shapes.update(cell)
+            return shapes
+        for x in range(cell_left, cell_right + 1):
+            for y in range(cell_bottom, cell_top + 1):
+                cell = self.cells.get((x, y), None)
+                if cell:
+                    shapes.update(cell)
+        return shapes
 
 
 class CollisionLord:
@@ -378,56 +525,271 @@ class CollisionLord:
     Number of times to resolve collisions per update. Lower at own risk;
     multi-object collisions require multiple iterations to settle correctly.
     """
+    use_spatial_hash = True
+    """
+    If True, only check shapes that share a SpatialHash cell; if False, check
+    every dynamic shape against every other shape.
+    """
+    skip_resolved_shapes = True
+    """
+    If True, once a shape is free of overlaps it isn't checked again this
+    update unless it or a shape near it moves, and iteration stops once all
+    shapes are resolved. Results are the same as checking every shape.
+    """
     def __init__(self, world):
         self.world = world
         self.ticks = 0
         # list of objects processed for collision this frame
         self.collisions_this_frame = []
+        # shapes found free of dynamic / static overlaps during update,
+        # since they (or for dynamic overlaps, a shape near them) last moved
+        self.clean_shapes, self.clean_static_shapes = set(), set()
+        self.resolving = False
+        # stats for most recent update
+        self.awake_shapes = self.sleeping_shapes = 0
+        self.iterations_used = self.shape_checks = 0
         self.reset()
     
     def report(self):
         print('%s: %s dynamic shapes, %s static shapes' % (self,
                                                            len(self.dynamic_shapes),
                                                            len(self.static_shapes)))
+        print(self.get_debug_text())
+    
+    def get_debug_text(self):
+        "Return a line of stats from the most recent update."
+        return 'collision: %s awake, %s sleeping, %s/%s iterations, %s shape checks' % (
+            self.awake_shapes, self.sleeping_shapes, self.iterations_used,
+            self.iterations, self.shape_checks)
     
     def reset(self):
         self.dynamic_shapes, self.static_shapes = [], []
+        cell_size = self.world.collision_cell_size
+        self.dynamic_hash = SpatialHash(cell_size)
+        self.static_hash = SpatialHash(cell_size)
+        "Non-tile static shapes; CST_TILE objects look up their own tiles."
+        self.tile_objects = {}
+        "Number of shapes by CST_TILE object"
+        self.object_order = {}
+        "Index of each world object, for consistent shape check order"
+        # merged boxes of the previous game's arts aren't needed anymore
+        tile_box_cache.clear()
     
-    def _add_circle_shape(self, x, y, radius, game_object):
-        shape = CircleCollisionShape(x, y, radius, game_object)
-        if game_object.is_dynamic():
+    def _add_shape(self, shape):
+        if shape.go.is_dynamic():
             self.dynamic_shapes.append(shape)
+            self.dynamic_hash.update_shape(shape)
         else:
             self.static_shapes.append(shape)
+            if shape.go.collision_shape_type == CST_TILE:
+                count = self.tile_objects.get(shape.go, 0)
+                self.tile_objects[shape.go] = count + 1
+            else:
+                self.static_hash.update_shape(shape)
         return shape
     
+    def _add_circle_shape(self, x, y, radius, game_object):
+        shape = CircleCollisionShape(x, y, radius, game_object)
+        return self._add_shape(shape)
+    
     def _add_box_shape(self, x, y, halfwidth, halfheight, game_object):
         shape = AABBCollisionShape(x, y, halfwidth, halfheight, game_object)
-        if game_object.is_dynamic():
-            self.dynamic_shapes.append(shape)
-        else:
-            self.static_shapes.append(shape)
-        return shape
+        return self._add_shape(shape)
     
     def _remove_shape(self, shape):
         if shape in self.dynamic_shapes:
             self.dynamic_shapes.remove(shape)
+            self.dynamic_hash.remove_shape(shape)
         elif shape in self.static_shapes:
             self.static_shapes.remove(shape)
+            self.static_hash.remove_shape(shape)
+            if shape.go in self.tile_objects:
+                self.tile_objects[shape.go] -= 1
+                if self.tile_objects[shape.go] == 0:
+                    self.tile_objects.pop(shape.go)
+    
+    def _remove_shapes(self, shapes):
+        # filter shape lists once, as removing a CST_TILE object's
+        # thousands of shapes one by one is quadratic
+        if len(shapes) < 2:
+            for shape in shapes:
+                self._remove_shape(shape)
+            return
+        removed = set(shapes)
+        self.dynamic_shapes = [s for s in self.dynamic_shapes if not s in removed]
+        self.static_shapes = [s for s in self.static_shapes if not s in removed]
+        for shape in removed:
+            self.dynamic_hash.remove_shape(shape)
+            self.static_hash.remove_shape(shape)
+        for obj in set(shape.go for shape in removed):
+            if obj in self.tile_objects:
+                self.tile_objects[obj] = sum(1 for s in self.static_shapes if s.go is obj)
+                if self.tile_objects[obj] == 0:
+                    self.tile_objects.pop(obj)
+    
+    def update_shape(self, shape):
+        "Update given shape's spatial hash cells after it moves."
+        if self.use_spatial_hash:
+            if shape in self.dynamic_hash.shape_cells:
+                self.dynamic_hash.update_shape(shape)
+            elif shape in self.static_hash.shape_cells:
+                self.static_hash.update_shape(shape)
+        # shape and anything it now overlaps need checking again
+        if self.resolving:
+            self.clean_static_shapes.discard(shape)
+            if self.use_spatial_hash:
+                box = shape.get_box()
+                self.clean_shapes.difference_update(self.dynamic_hash.get_shapes_overlapping_box(*box))
+            else:
+                self.clean_shapes.clear()
+    
+    def _update_hashes(self):
+        # rebuild hashes if world's cell size changed
+        cell_size = self.world.collision_cell_size
+        if cell_size != self.dynamic_hash.cell_size:
+            self.dynamic_hash = SpatialHash(cell_size)
+            self.static_hash = SpatialHash(cell_size)
+        # catch shapes moved or resized outside of Collideable
+        for shape in self.dynamic_shapes:
+            self.dynamic_hash.update_shape(shape)
+        for shape in self.static_shapes:
+            if shape.go not in self.tile_objects:
+                self.static_hash.update_shape(shape)
+        self.object_order = {obj: i for i, obj in enumerate(self.world.objects.values())}
+    
+    def get_dynamic_shapes_near(self, shape, shape_order):
+        """
+        Return dynamic shapes near given shape, in order of given dict of
+        shape indices; shapes not in it are skipped.
+        """
+        nearby = self.dynamic_hash.get_shapes_overlapping_box(*shape.get_box())
+        nearby = [other for other in nearby if other in shape_order]
+        nearby.sort(key=shape_order.get)
+        return nearby
+    
+    def get_static_shapes_near(self, shape):
+        """
+        Return static shapes near given shape, in the same order
+        CollisionShape.get_overlapping_static_shapes would check them.
+        """
+        left, top, right, bottom = shape.get_box()
+        objects = self.world.objects
+        def is_valid(obj):
+            return obj is not shape.go and objects.get(obj.name, None) is obj \
+                and obj.should_collide() and not obj.is_dynamic()
+        nearby = self.static_hash.get_shapes_overlapping_box(left, top, right, bottom)
+        nearby_objects = set(other.go for other in nearby)
+        for obj in self.tile_objects:
+            obj_left, obj_top, obj_right, obj_bottom = obj.get_edges()
+            if boxes_overlap(left, top, right, bottom,
+                             obj_left, obj_top, obj_right, obj_bottom):
+                nearby_objects.add(obj)
+        nearby_objects = [obj for obj in nearby_objects if is_valid(obj)]
+        last = len(self.object_order)
+        nearby_objects.sort(key=lambda obj: self.object_order.get(obj, last))
+        shapes = []
+        for obj in nearby_objects:
+            if obj in self.tile_objects:
+                shapes += obj.collision.get_shapes_overlapping_box(left, top, right, bottom)
+            else:
+                shapes += [s for s in obj.collision.shapes if s in nearby]
+        return shapes
+    
+    def get_colliding_shapes_in_box(self, obj, left, top, right, bottom):
+        """
+        Return shapes overlapping given box that given object should collide
+        with, dynamic shapes first.
+        """
+        if top < bottom:
+            top, bottom = bottom, top
+        if self.use_spatial_hash:
+            nearby = self.dynamic_hash.get_shapes_overlapping_box(left, top, right, bottom)
+            nearby = list(nearby | self.static_hash.get_shapes_overlapping_box(left, top, right, bottom))
+            # sort for consistent results regardless of set order
+            last = len(self.object_order)
+            nearby.sort(key=lambda shape: (not shape.go.is_dynamic(),
+                                           self.object_order.get(shape.go, last),
+                                           shape.go.name))
+        else:
+            nearby = self.dynamic_shapes + [shape for shape in self.static_shapes
+                                            if shape.go not in self.tile_objects]
+        for tile_obj in self.tile_objects:
+            obj_left, obj_top, obj_right, obj_bottom = tile_obj.get_edges()
+            if obj_left <= right and left <= obj_right and \
+               obj_bottom <= top and bottom <= obj_top:
+                nearby += tile_obj.collision.get_shapes_overlapping_box(left, top, right, bottom)
+        shapes = []
+        valid = {}
+        for shape in nearby:
+            other = shape.go
+            if not other in valid:
+                valid[other] = other is not obj and other.should_collide() and \
+                    obj.can_collide_with(other) and other.can_collide_with(obj)
+            if valid[other]:
+                shapes.append(shape)
+        return shapes
+    
+    def _renew_contacts(self, obj):
+        for obj_name,contact in obj.collision.contacts.items():
+            other = self.world.objects.get(obj_name, None)
+            # let contacts with destroyed objects expire
+            if not other:
+                continue
+            obj.collision.contacts[obj_name] = Contact(contact.overlap, self.ticks)
+            if obj.name in other.collision.contacts:
+                other_contact = other.collision.contacts[obj.name]
+                other.collision.contacts[obj.name] = Contact(other_contact.overlap, self.ticks)
     
     def update(self):
         "Resolve overlaps between all relevant world objects."
+        if self.use_spatial_hash:
+            self._update_hashes()
+        self.clean_shapes.clear()
+        self.clean_static_shapes.clear()
+        self.resolving = True
+        self.iterations_used = self.shape_checks = 0
+        valid_dynamic_shapes, awake_shapes = [], []
         for i in range(self.iterations):
             # filter shape lists for anything out of room etc
             valid_dynamic_shapes = []
             for shape in self.dynamic_shapes:
                 if shape.go.should_collide():
                     valid_dynamic_shapes.append(shape)
-            for shape in valid_dynamic_shapes:
-                shape.resolve_overlaps_with_shapes(valid_dynamic_shapes)
-            for shape in valid_dynamic_shapes:
+            # sleeping shapes can be collided with, but don't resolve
+            awake_shapes = [shape for shape in valid_dynamic_shapes if not shape.go.sleeping]
+            if self.skip_resolved_shapes and \
+               self.clean_shapes.issuperset(awake_shapes) and \
+               self.clean_static_shapes.issuperset(awake_shapes):
+                break
+            self.iterations_used += 1
+            if self.use_spatial_hash:
+                shape_order = {shape: i for i, shape in enumerate(valid_dynamic_shapes)}
+            for shape in awake_shapes:
+                if shape in self.clean_shapes:
+                    continue
+                if self.use_spatial_hash:
+                    shapes = self.get_dynamic_shapes_near(shape, shape_order)
+                else:
+                    shapes = valid_dynamic_shapes
+                self.shape_checks += 1
+                if not shape.resolve_overlaps_with_shapes(shapes) and \
+                   self.skip_resolved_shapes:
+                    self.clean_shapes.add(shape)
+            for shape in awake_shapes:
+                if shape in self.clean_static_shapes:
+                    continue
                 static_shapes = shape.get_overlapping_static_shapes()
-                shape.resolve_overlaps_with_shapes(static_shapes)
+                self.shape_checks += 1
+                if not shape.resolve_overlaps_with_shapes(static_shapes) and \
+                   self.skip_resolved_shapes:
+                    self.clean_static_shapes.add(shape)
+        self.resolving = False
+        self.awake_shapes = len(awake_shapes)
+        self.sleeping_shapes = len(valid_dynamic_shapes) - len(awake_shapes)
+        # sleeping objects aren't checked, keep their contacts from expiring
+        for shape in valid_dynamic_shapes:
+            if shape.go.sleeping:
+                self._renew_contacts(shape.go)
         # check which objects stopped colliding
         for obj in self.world.objects.values():
             obj.check_finished_contacts()
@@ -437,6 +799,41 @@ class CollisionLord:
 
 # collision handling
 
+def get_merged_tile_boxes(solid):
+    """
+    Return (x, y, end_x, end_y) inclusive tile ranges of boxes covering all
+    True tiles in given 2D mask. Each row's runs of uncovered solid tiles
+    start new boxes, which extend down while the whole run stays solid.
+    """
+    free = np.array(solid, dtype=bool)
+    height = free.shape[0]
+    boxes = []
+    for y in range(height):
+        cols = np.flatnonzero(free[y])
+        if len(cols) == 0:
+            continue
+        # run starts and (exclusive) ends are where row changes value
+        padded = np.concatenate(([0], free[y].view(np.int8), [0]))
+        edges = np.flatnonzero(np.diff(padded))
+        starts, ends = edges[::2], edges[1::2]
+        lengths = ends - starts
+        # index of the run each of this row's free columns belongs to
+        col_runs = np.repeat(np.arange(len(starts)), lengths)
+        free[y, cols] = False
+        end_ys = np.full(len(starts), y)
+        extending = np.ones(len(starts), dtype=bool)
+        below_y = y + 1
+        # extend all runs down one row at a time until none can
+        while below_y < height and extending.any():
+            counts = np.concatenate(([0], np.cumsum(free[below_y])))
+            extending &= counts[ends] - counts[starts] == lengths
+            end_ys[extending] = below_y
+            free[below_y, cols[extending[col_runs]]] = False
+            below_y += 1
+        boxes += zip(starts.tolist(), [y] * len(starts), (ends - 1).tolist(),
+                     end_ys.tolist())
+    return boxes
+
 def point_in_box(x, y, box_left, box_top, box_right, box_bottom):
     "Return True if given point lies within box with given corners."
     return box_left <= x <= box_right and box_bottom <= y <= box_top
@@ -575,3 +972,117 @@ def circle_box_penetration(circle_x, circle_y, box_x, box_y, circle_radius,
     1, 0, -pdist, -pdist
     # TODO: calculate other axis of intersection for area?
     return -closest_x / d, -closest_y / d, -pdist, -pdist
+
+def ray_box_hit(x, y, dx, dy, left, top, right, bottom):
+    """
+    Return time (as a fraction of dx, dy) and x,y normal where given line
+    segment enters given box, or None if it misses. Time is negative if
+    segment starts inside box.
+    """
+    # slab method: find where segment is between each pair of box edges
+    tmin, tmax = -math.inf, math.inf
+    nx, ny = 0, 0
+    if dx != 0:
+        if dx > 0:
+            tmin, tmax, nx = (left - x) / dx, (right - x) / dx, -1
+        else:
+            tmin, tmax, nx = (right - x) / dx, (left - x) / dx, 1
+    elif not left < x < right:
+        return None
+    if dy != 0:
+        if dy > 0:
+            tnear, tfar, normal = (bottom - y) / dy, (top - y) / dy, -1
+        else:
+            tnear, tfar, normal = (top - y) / dy, (bottom - y) / dy, 1
+        if tnear > tmin:
+            tmin, nx, ny = tnear, 0, normal
+        tmax = min(tmax, tfar)
+    elif not bottom < y < top:
+        return None
+    # only touching an edge or corner isn't a hit
+    if tmin >= tmax or tmin > 1 or tmax <= 0:
+        return None
+    return tmin, nx, ny
+
+def get_flush_hit(hit, dx, dy):
+    """
+    Return given ray_box_hit result if it's ahead of the segment's start, a hit
+    at time 0 if segment starts just inside the box, else None.
+    """
+    t, nx, ny = hit
+    if t >= 0:
+        return hit
+    # not moving at all
+    if nx == 0 and ny == 0:
+        return None
+    # depth inside the face we're moving into
+    depth = -t * abs(dx if nx != 0 else dy)
+    if depth > SWEEP_FLUSH_DEPTH:
+        return None
+    return 0, nx, ny
+
+def circle_sweep_circle(ax, ay, dx, dy, bx, by, radius):
+    """
+    Return time of impact and normal for circle A moving by dx, dy into
+    circle B, given the sum of their radii; None if A misses, moves away or
+    starts more than SWEEP_FLUSH_DEPTH inside.
+    """
+    # solve |A + t*d - B| = radius for t
+    mx, my = ax - bx, ay - by
+    b = mx * dx + my * dy
+    c = mx ** 2 + my ** 2 - radius ** 2
+    # moving away
+    if b >= 0:
+        return None
+    # starting inside: a hit right away if we're only just in
+    if c < 0:
+        dist = math.sqrt(mx ** 2 + my ** 2)
+        if dist == 0 or radius - dist > SWEEP_FLUSH_DEPTH:
+            return None
+        return 0, mx / dist, my / dist
+    a = dx ** 2 + dy ** 2
+    discriminant = b ** 2 - a * c
+    if discriminant <= 0:
+        return None
+    t = (-b - math.sqrt(discriminant)) / a
+    if t > 1:
+        return None
+    return t, (mx + dx * t) / radius, (my + dy * t) / radius
+
+def circle_sweep_box(circle_x, circle_y, dx, dy, circle_radius, box_x, box_y,
+                     box_hw, box_hh):
+    """
+    Return time of impact and normal for given circle moving by dx, dy into
+    given box; None if circle misses or starts more than SWEEP_FLUSH_DEPTH
+    inside.
+    """
+    left, right = box_x - box_hw, box_x + box_hw
+    top, bottom = box_y + box_hh, box_y - box_hh
+    # sweep circle's center against box grown by its radius
+    hit = ray_box_hit(circle_x, circle_y, dx, dy,
+                      left - circle_radius, top + circle_radius,
+                      right + circle_radius, bottom - circle_radius)
+    if not hit:
+        return None
+    t = max(0, hit[0])
+    hit_x, hit_y = circle_x + dx * t, circle_y + dy * t
+    # beyond both edges of box, grown box's corner is really a rounded one
+    if left <= hit_x <= right or bottom <= hit_y <= top:
+        return get_flush_hit(hit, dx, dy)
+    corner_x = left if hit_x < left else right
+    corner_y = bottom if hit_y < bottom else top
+    return circle_sweep_circle(circle_x, circle_y, dx, dy, corner_x, corner_y,
+                               circle_radius)
+
+def box_sweep_box(ax, ay, dx, dy, ahw, ahh, bx, by, bhw, bhh):
+    """
+    Return time of impact and normal for box A moving by dx, dy into box B;
+    None if A misses or starts more than SWEEP_FLUSH_DEPTH inside.
+    """
+    # sweep A's center against B grown by A's size
+    widths, heights = ahw + bhw, ahh + bhh
+    hit = ray_box_hit(ax, ay, dx, dy, bx - widths, by + heights,
+                      bx + widths, by - heights)
+    if not hit:
+        return None
+    return get_flush_hit(hit, dx, dy)
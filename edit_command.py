@@ -76,7 +76,7 @@ class EntireArtCommand:
     """
     
     # art arrays to grab
-    array_types = ['chars', 'fg_colors', 'bg_colors', 'uv_mods']
+    array_types = ['chars', 'fg_colors', 'bg_colors', 'uv_maps']
     
     def __init__(self, art, origin_x=0, origin_y=0):
         self.art = art
@@ -3,38 +3,66 @@
 # heavy lifting still done by ImageConverter, this mainly coordinates
 # conversion of multiple frames
 
-import os, time
+import os, time, math, multiprocessing
+import numpy as np
 
 import image_convert
 import formats.in_bitmap as bm
 
 class ImageSequenceConverter:
     
+    # only convert tiles whose source blocks changed since previous frame,
+    # copy the rest from it
+    temporal_coherence = True
+    # fraction of a block's pixels that must change for its tile to be
+    # converted again, 0 = any change
+    change_threshold = 0
+    # # of processes converting ranges of frames in parallel, None = one per
+    # CPU. 1 = one frame at a time, with a preview of each.
+    frame_workers = 1
+    
     def __init__(self, app, image_filenames, art, bicubic_scale):
         self.init_success = False
         self.app = app
         self.start_time = time.time()
         self.image_filenames = image_filenames
+        self.total_frames = len(image_filenames)
+        # totals from each frame's converter, for logging
+        self.tiles_done, self.cache_hits, self.tiles_unchanged = 0, 0, 0
         # App.update_window_title uses image_filename for titlebar
         self.image_filename = ''
         # common name of sequence
         self.image_name = os.path.splitext(self.image_filename)[0]
         self.art = art
         self.bicubic_scale = bicubic_scale
+        # source image and art frame of last converted frame, for
+        # temporal coherence
+        self.reference_array, self.previous_frame = None, None
+        self.current_frame_converter = None
+        self.frame_pool = None
+        # frame converters' tile row pool, if they use one, see
+        # ImageConverter.start_pool
+        self.row_pool = None
         # queue up first frame
         self.next_image(first=True)
+        if self.current_frame_converter and self.current_frame_converter.init_success \
+           and self.frame_workers != 1 and self.total_frames > 1:
+            self.start_frame_pool()
         self.init_success = True
     
     def next_image(self, first=False):
         # pop last image off stack
         if not first:
             self.image_filenames.pop(0)
+            self.reference_array = self.current_frame_converter.reference_array
+            self.previous_frame = self.art.active_frame
         # done?
         if len(self.image_filenames) == 0:
             self.finish()
             return
         # next frame
-        self.art.set_active_frame(self.art.active_frame + 1)
+        if not first:
+            self.art.set_active_frame(self.art.active_frame + 1)
         try:
             self.current_frame_converter = image_convert.ImageConverter(self.app,
                                                       self.image_filenames[0],
@@ -50,22 +78,127 @@ class ImageSequenceConverter:
         self.preview_sprite = self.current_frame_converter.preview_sprite
         self.app.update_window_title()
     
+    def start_frame_pool(self):
+        """
+        start worker processes converting the sequence in contiguous ranges
+        of frames, using tables first frame's converter built
+        """
+        converter = self.current_frame_converter
+        workers = min(self.frame_workers or multiprocessing.cpu_count(), self.total_frames)
+        try:
+            self.frame_pool = multiprocessing.Pool(workers, image_convert.init_pool_worker,
+                                                   (converter.color_diffs, converter.glyph_masks,
+                                                    converter.cache_blocks, converter.color_classes,
+                                                    converter.glyph_index))
+        except Exception as e:
+            self.app.log("ImageSequenceConverter: Couldn't start conversion processes (%s), converting one frame at a time" % e)
+            return
+        self.frame_range_size = math.ceil(self.total_frames / workers)
+        self.first_frame = self.art.active_frame
+        # source arrays of range being loaded, results of ranges queued
+        self.range_arrays = []
+        self.frame_ranges = []
+        self.frames_loaded, self.frames_done = 0, 0
+    
+    def load_next_image(self):
+        "load next image's source array, queue its range if it's complete"
+        src_img = image_convert.get_source_image(self.image_filenames[0],
+                                                 self.art, self.bicubic_scale)
+        self.range_arrays.append(image_convert.get_source_array(src_img))
+        self.image_filenames.pop(0)
+        self.frames_loaded += 1
+        if len(self.range_arrays) == self.frame_range_size or len(self.image_filenames) == 0:
+            first = self.frames_loaded - len(self.range_arrays)
+            converter = self.current_frame_converter
+            threshold = self.change_threshold if self.temporal_coherence else None
+            args = (first, self.range_arrays, converter.char_w, converter.char_h,
+                    self.art.width, self.art.height, threshold)
+            self.frame_ranges.append(self.frame_pool.apply_async(image_convert.convert_frames, args))
+            self.range_arrays = []
+        return len(self.image_filenames) > 0
+    
+    def update_frame_pool(self):
+        "load more images, set tiles of frame ranges pool has finished"
+        if len(self.image_filenames) > 0:
+            try:
+                image_convert.run_for(self.load_next_image,
+                                      image_convert.ImageConverter.frame_budget_ms / 1000)
+            except:
+                self.fail()
+                return
+        # headless apps have no window to keep responsive, wait for a range
+        elif self.app.headless and not any(r.ready() for r in self.frame_ranges):
+            self.frame_ranges[0].wait()
+        for result in [r for r in self.frame_ranges if r.ready()]:
+            self.frame_ranges.remove(result)
+            first, tiles, hits, unchanged = result.get()
+            self.set_frame_tiles(first, tiles)
+            self.tiles_done += tiles[..., 0].size - unchanged
+            self.cache_hits += hits
+            self.tiles_unchanged += unchanged
+        if len(self.image_filenames) == 0 and len(self.frame_ranges) == 0:
+            self.finish()
+    
+    def set_frame_tiles(self, first, tiles):
+        "set active layer of frames from given index to given (char, fg, bg) tiles"
+        layer = self.art.active_layer
+        darkest = self.art.palette.darkest_index
+        for i, frame_tiles in enumerate(tiles):
+            frame = self.first_frame + first + i
+            self.art.clear_frame_layer(frame, layer, 0)
+            chars, fgs, bgs = frame_tiles[..., 0], frame_tiles[..., 1], frame_tiles[..., 2]
+            # see ImageConverter.set_tile
+            self.art.chars[frame][layer] = chars
+            self.art.fg_colors[frame][layer] = np.where(fgs == 0, darkest, fgs)
+            self.art.bg_colors[frame][layer] = np.where(bgs == 0, darkest, bgs)
+            self.art.mark_frame_changed(frame)
+            self.frames_done += 1
+    
     def fail(self):
         self.app.log('Bad frame %s' % self.image_filenames[0], error=True)
         self.finish(True)
     
     def update(self):
+        if self.frame_pool:
+            self.update_frame_pool()
         # create converter for new frame if current one is done,
         # else update current one
-        if self.current_frame_converter.finished:
+        elif self.current_frame_converter.finished:
             self.next_image()
         else:
             self.current_frame_converter.update()
     
+    def get_progress(self):
+        "returns fraction of sequence converted, and estimated seconds remaining"
+        if self.frame_pool:
+            frames_done = self.frames_done
+        else:
+            frames_done = self.total_frames - len(self.image_filenames)
+            if self.image_filenames and not self.current_frame_converter.finished:
+                frames_done += self.current_frame_converter.get_progress()[0]
+        done = frames_done / self.total_frames
+        return done, image_convert.get_eta(done, time.time() - self.start_time)
+    
     def finish(self, cancelled=False):
+        if self.frame_pool:
+            self.frame_pool.terminate()
+            self.frame_pool = None
+        # stop current frame's conversion processes if we're cancelled
+        frame_converter = self.current_frame_converter
+        if frame_converter and frame_converter.init_success and not frame_converter.finished:
+            frame_converter.finish(cancelled)
+        if self.row_pool:
+            self.row_pool.terminate()
+            self.row_pool = None
         time_taken = time.time() - self.start_time
         (verb, error) = ('cancelled', True) if cancelled else ('finished', False)
         self.app.log('Conversion of image sequence %s %s after %.3f seconds' % (self.image_name, verb, time_taken), error)
+        if self.temporal_coherence:
+            total = self.tiles_done + self.tiles_unchanged
+            rate = self.tiles_unchanged / total * 100 if total else 0
+            self.app.log('  %s of %s tiles (%.1f%%) unchanged from previous frame' % (self.tiles_unchanged, total, rate))
+        if image_convert.ImageConverter.cache_blocks:
+            self.app.log(image_convert.get_cache_report(self.cache_hits, self.tiles_done))
         self.app.converter = None
         self.app.update_window_title()
 
@@ -11,5 +11,6 @@ transparency and proper frame timings.
     file_extension = 'gif'
     def run_export(self, out_filename, options):
         # heavy lifting done by image_export module
-        export_animation(self.app, self.app.ui.active_art, out_filename)
+        export_animation(self.app, self.app.ui.active_art, out_filename,
+                         renderer=options.get('renderer'))
         return True
@@ -78,4 +78,5 @@ If CRT filter is enabled, image will always be 32-bit.
         return export_still_image(self.app, self.app.ui.active_art,
                            out_filename,
                            crt=options.get('crt', DEFAULT_CRT),
-                           scale=options.get('scale', DEFAULT_SCALE))
+                           scale=options.get('scale', DEFAULT_SCALE),
+                           renderer=options.get('renderer'))
@@ -158,9 +158,13 @@ PNG image set for each frame and/or layer.
                                                   art.layer_names[layer],
                                                   export_frames, export_layers,
                                                   self.app.forbidden_filename_chars)
+                # if exporting layers, each image is just that layer
+                layers = [layer] if export_layers else None
                 if not export_still_image(self.app, art, full_filename,
                            crt=options.get('crt', DEFAULT_CRT),
-                           scale=options.get('scale', DEFAULT_SCALE)):
+                           scale=options.get('scale', DEFAULT_SCALE),
+                           layers=layers,
+                           renderer=options.get('renderer')):
                     success = False
         # put everything back how user left it
         art.set_active_frame(start_frame)
@@ -97,11 +97,20 @@ class GameObject:
     "If False, don't do move physics updates for this object"
     fast_move_steps = 0
     """
-    If >0, subdivide high-velocity moves into fractions-of-this-object-sized
-    steps to avoid tunneling. turn this up if you notice an object tunneling.
-    # 1 = each step is object's full size
-    # 2 = each step is half object's size
-    # N = each step is 1/N object's size
+    If >0, sweep high-velocity moves against everything we collide with and
+    stop at the first hit to avoid tunneling. turn this up if you notice an
+    object tunneling.
+    # 1 = sweep moves longer than object's full size
+    # 2 = sweep moves longer than half object's size
+    # N = sweep moves longer than 1/N object's size
+    """
+    fast_move_contact_depth = 0.01
+    "How far fast_move leaves us inside what we hit, so collision resolves it"
+    allow_vectorized_physics = True
+    """
+    If True, our movement is integrated in world's PhysicsArrays along with
+    other objects' while world's vectorized_physics is on. Classes overriding
+    update or physics methods always run their own apply_move.
     """
     move_accel_x = move_accel_y = 200.
     "Acceleration per update from player movement"
@@ -113,6 +122,15 @@ class GameObject:
     "Bounciness aka restitution, % of velocity reflected on bounce"
     stop_velocity = 0.1
     "Near-zero point at which any velocity is set to zero"
+    can_sleep = False
+    """
+    If True, object stops being simulated once it's been at rest for
+    sleep_delay updates, until it's touched, moved or given a velocity.
+    """
+    sleep_delay = 30
+    "Number of updates object must be at rest before it falls asleep"
+    sleep_velocity = 0.1
+    "Speed below which object is at rest, also applied to per-update movement"
     log_move = False
     log_load = False
     log_spawn = False
@@ -227,6 +245,14 @@ class GameObject:
         "Object's velocity in units per second. Derived from acceleration."
         self.move_x, self.move_y = 0, 0
         "User-intended acceleration"
+        self.sleeping = False
+        "If True, object isn't simulated until it's woken up, see can_sleep"
+        self.rest_updates = 0
+        "Number of updates object has been at rest for"
+        self.sleep_loc = None
+        self.sleep_state = None
+        self.last_sweep_hit = None
+        "SweepHit for what fast_move stopped us at this update, if anything"
         self.last_x, self.last_y, self.last_z = self.x, self.y, self.z
         self.last_update_end = 0
         self.flip_x = False
@@ -522,6 +548,31 @@ class GameObject:
                 overlaps.append(other)
         return overlaps
     
+    def get_sweep_hit(self, start_x, start_y, end_x, end_y):
+        """
+        Return SweepHit for the first shape our collision would hit moving
+        from given start to end location, None if the way is clear.
+        """
+        dx, dy = end_x - start_x, end_y - start_y
+        first_hit = None
+        for shape in self.collision.shapes:
+            x, y = start_x + self.col_offset_x, start_y + self.col_offset_y
+            left, top, right, bottom = shape.get_box()
+            # shape's box may be out of date, only use its size
+            left, top = x + left - shape.x, y + top - shape.y
+            right, bottom = x + right - shape.x, y + bottom - shape.y
+            # check everything near the box covering whole move
+            others = self.world.cl.get_colliding_shapes_in_box(self,
+                                                               min(left, left + dx),
+                                                               min(top, top + dy),
+                                                               max(right, right + dx),
+                                                               max(bottom, bottom + dy))
+            for other in others:
+                hit = shape.get_sweep_hit(other, x, y, dx, dy)
+                if hit and (not first_hit or hit.time < first_hit.time):
+                    first_hit = hit
+        return first_hit
+    
     def is_overlapping(self, other):
         "Return True if we overlap with other object's collision"
         return other.name in self.collision.contacts
@@ -842,6 +893,42 @@ class GameObject:
         self.vel_z = hsvel_z + 0.5 * timestep * accel_z
         self.vel_x, self.vel_y, self.vel_z = vector.cut_xyz(self.vel_x, self.vel_y, self.vel_z, self.stop_velocity)
     
+    def get_sleep_state(self):
+        "Return values that wake this object if they change while it sleeps."
+        return (self.x, self.y, self.z, self.vel_x, self.vel_y, self.vel_z,
+                self.move_x, self.move_y)
+    
+    def update_sleep(self):
+        """
+        Count updates this object has been at rest, and put it to sleep after
+        sleep_delay of them. Run by GameWorld after collisions are resolved.
+        """
+        if self.sleeping:
+            return
+        last_x, last_y, last_z = self.sleep_loc or (self.x, self.y, self.z)
+        self.sleep_loc = self.x, self.y, self.z
+        speed = math.sqrt(self.vel_x ** 2 + self.vel_y ** 2 + self.vel_z ** 2)
+        moved = math.sqrt((self.x - last_x) ** 2 + (self.y - last_y) ** 2 + (self.z - last_z) ** 2)
+        max_move = self.sleep_velocity * self.world.app.timestep / 1000
+        if speed < self.sleep_velocity and moved < max_move:
+            self.rest_updates += 1
+        else:
+            self.rest_updates = 0
+        if self.rest_updates >= self.sleep_delay:
+            self.sleep()
+    
+    def sleep(self):
+        "Stop simulating this object until it's touched, moved or pushed."
+        self.vel_x, self.vel_y, self.vel_z = 0, 0, 0
+        self.sleeping = True
+        self.sleep_state = self.get_sleep_state()
+    
+    def wake(self):
+        "Resume simulating this object."
+        self.sleeping = False
+        self.rest_updates = 0
+        self.sleep_loc = None
+    
     def moved_this_frame(self):
         "Return True if object changed locations this frame."
         delta = math.sqrt(abs(self.last_x - self.x) ** 2 + abs(self.last_y - self.y) ** 2 + abs(self.last_z - self.z) ** 2)
@@ -984,10 +1071,10 @@ class GameObject:
     
     def fast_move(self):
         """
-        Subdivide object's move this frame into steps to avoid tunneling.
-        Only called for objects with fast_move_steps >0.
+        Sweep object's move this frame and stop it at the first thing it would
+        hit, to avoid tunneling. Only called for objects with fast_move_steps >0.
         """
-        final_x, final_y = self.x, self.y
+        self.last_sweep_hit = None
         dx, dy = self.x - self.last_x, self.y - self.last_y
         total_move_dist = math.sqrt(dx ** 2 + dy ** 2)
         if total_move_dist == 0:
@@ -1001,22 +1088,20 @@ class GameObject:
             # get size in axis object is moving in
             step_x, step_y = self.col_width * dir_x, self.col_height * dir_y
             step_dist = math.sqrt(step_x ** 2 + step_y ** 2)
+        else:
+            return
         step_dist /= self.fast_move_steps
-        # if object isn't moving fast enough, don't step
+        # if object isn't moving fast enough to tunnel, don't sweep
         if total_move_dist <= step_dist:
             return
-        steps = int(total_move_dist / step_dist)
-        # start stepping from beginning of this frame's move distance
-        self.x, self.y = self.last_x, self.last_y
-        for i in range(steps):
-            self.x += dir_x * step_dist
-            self.y += dir_y * step_dist
-            collisions = self.get_collisions()
-            # if overlapping just leave as-is, collision update will resolve
-            if len(collisions) > 0:
-                return
-        # ran through all steps without a hit, set back to final position
-        self.x, self.y = final_x, final_y
+        hit = self.get_sweep_hit(self.last_x, self.last_y, self.x, self.y)
+        if not hit:
+            return
+        self.last_sweep_hit = hit
+        # stop just inside what we hit: collision update pushes us out, and
+        # resolves momentum (bounce etc) from the velocity we hit it with
+        t = min(1, hit.time + self.fast_move_contact_depth * inv_dist)
+        self.x, self.y = self.last_x + dx * t, self.last_y + dy * t
     
     def get_time_since_last_update(self):
         "Return time (in milliseconds) since end of this object's last update."
@@ -1030,10 +1115,16 @@ class GameObject:
         """
         if 0 < self.destroy_time <= self.world.get_elapsed_time():
             self.destroy()
+        # wake if we were moved or given a velocity while asleep
+        if self.sleeping and self.get_sleep_state() != self.sleep_state:
+            self.wake()
         # don't apply physics to selected objects being dragged
-        if self.physics_move and not self.name in self.world.drag_objects:
+        # (world's PhysicsArrays may have already moved us this update)
+        if self.physics_move and not self.sleeping and \
+           not self.name in self.world.drag_objects and \
+           not self.world.physics.has_moved(self):
             self.apply_move()
-        if self.fast_move_steps > 0:
+        if self.fast_move_steps > 0 and not self.sleeping:
             self.fast_move()
         self.update_state()
         self.update_state_sounds()
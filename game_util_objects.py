@@ -158,7 +158,9 @@ class WorldPropertiesObject(GameObject):
                    'camera_x', 'camera_y', 'camera_z',
                    'bg_color_r', 'bg_color_g', 'bg_color_b', 'bg_color_a',
                    'player_camera_lock', 'object_grid_snap', 'draw_hud',
-                   'collision_enabled', 'show_collision_all', 'show_bounds_all',
+                   'collision_enabled', 'collision_cell_size',
+                   'vectorized_physics',
+                   'show_collision_all', 'show_bounds_all',
                    'show_origin_all', 'show_all_rooms',
                    'room_camera_changes_enabled', 'draw_debug_objects'
     ]
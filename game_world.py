@@ -5,7 +5,7 @@ from collections import namedtuple
 import sdl2
 
 import game_object, game_util_objects, game_hud, game_room
-import collision, vector
+import collision, physics, vector
 from camera import Camera
 from grid import GameGrid
 from art import ART_DIR
@@ -79,6 +79,14 @@ class GameWorld:
     "If False, user cannot pause game sim"
     collision_enabled = True
     "If False, CollisionLord won't bother thinking about collision at all."
+    collision_cell_size = 4.
+    "Size of CollisionLord's spatial hash cells, in world units."
+    vectorized_physics = False
+    """
+    If True, integrate movement of objects with default physics all at once
+    in our PhysicsArrays rather than in each object's apply_move. This happens
+    before any object updates, see PhysicsArrays for what that changes.
+    """
     # toggles for "show all" debug viz modes
     show_collision_all = False
     show_bounds_all = False
@@ -134,6 +142,7 @@ class GameWorld:
         "Dict of rooms by name:room"
         self.current_room = None
         self.cl = collision.CollisionLord(self)
+        self.physics = physics.PhysicsArrays(self)
         self.hud = None
         self.art_loaded = []
         self.drag_objects = {}
@@ -414,6 +423,7 @@ class GameWorld:
         for obj in self.objects.values():
             obj.destroy()
         self.cl.reset()
+        self.physics.reset()
         self.camera.reset()
         self.player = None
         self.globals = None
@@ -747,6 +757,7 @@ class GameWorld:
             self.properties.update_from_world()
         if not self.paused:
             # update objects based on movement, then resolve collisions
+            self.physics.update()
             for obj in self.objects.values():
                 if obj.is_in_current_room() or obj.update_if_outside_room:
                     # update timers
@@ -758,6 +769,10 @@ class GameWorld:
                     obj.last_update_end = self.get_elapsed_time()
             if self.collision_enabled:
                 self.cl.update()
+            # let objects that have come to rest fall asleep
+            for obj in self.objects.values():
+                if obj.can_sleep and (obj.is_in_current_room() or obj.update_if_outside_room):
+                    obj.update_sleep()
             for room in self.rooms.values():
                 room.update()
         # display debug text for selected object(s)
@@ -765,6 +780,9 @@ class GameWorld:
             s = obj.get_debug_text()
             if s:
                 self.app.ui.debug_text.post_lines(s)
+        # display collision stats while all collision is shown
+        if self.show_collision_all and self.collision_enabled:
+            self.app.ui.debug_text.post_lines(self.cl.get_debug_text())
         # remove objects marked for destruction
         to_destroy = []
         for obj in self.objects.values():
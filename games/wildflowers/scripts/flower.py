@@ -165,5 +165,4 @@ class FlowerObject(GameObject):
         self.exportable_art.chars[-1] = self.art.chars[0].copy()
         self.exportable_art.fg_colors[-1] = self.art.fg_colors[0].copy()
         self.exportable_art.bg_colors[-1] = self.art.bg_colors[0].copy()
-        self.exportable_art.uv_mods[-1] = self.art.uv_mods[0].copy()
         self.exportable_art.uv_maps[-1] = self.art.uv_maps[0].copy()
@@ -0,0 +1,240 @@
+"""
+Stand-ins for Application and UI that let Art, importers and exporters run
+with no window or OpenGL context, eg for batch conversion.
+"""
+
+import os, sys, hashlib, importlib, time
+
+from art import Art, ArtFromDisk, ART_DIR, ART_FILE_EXTENSION, DEFAULT_CHARSET, DEFAULT_PALETTE, DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_ART_FILENAME
+from art_import import ArtImporter
+from art_export import ArtExporter
+from camera import Camera
+from charset import CharacterSet
+from palette import Palette
+from image_export import RENDERER_SOFTWARE
+
+FORMATS_DIR = 'formats/'
+
+# directory Playscii's own charsets, palettes etc are found in
+APP_DIR = os.path.dirname(os.path.abspath(__file__)) + '/'
+
+
+class HeadlessUI:
+
+    "Minimal UI: tracks active art and selection, ignores display requests."
+
+    flip_affects_xforms = True
+
+    def __init__(self, app):
+        self.app = app
+        self.active_art = None
+        self.selected_char = 0
+        self.selected_fg_color, self.selected_bg_color = 0, 0
+        self.selected_xform = 0
+        # stands in for message line and popup too, which only get notified
+        self.message_line = self.popup = self
+
+    def set_active_art(self, new_art):
+        self.active_art = new_art
+        self.selected_char = new_art.selected_char
+        self.selected_fg_color = new_art.selected_fg_color
+        self.selected_bg_color = new_art.selected_bg_color
+        self.selected_xform = new_art.selected_xform
+
+    def post_line(self, new_line, hold_time=None, error=False):
+        pass
+
+    def set_active_charset(self, charset): pass
+    def set_active_palette(self, palette): pass
+    def set_active_frame(self, frame): pass
+    def set_active_layer(self, layer): pass
+    def adjust_for_art_resize(self, art): pass
+    def erase_selection_or_art(self): pass
+    def undo(self): pass
+
+
+class HeadlessCamera:
+    "Holds the camera position that gets saved into Art files."
+    def __init__(self):
+        self.x, self.y = Camera.start_x, Camera.start_y
+        self.z = self.start_zoom = Camera.start_zoom
+
+
+class HeadlessCursor:
+    "No cursor means no hover preview edits to undo before save/export."
+    preview_edits = []
+
+
+class HeadlessGameWorld:
+    "No game is ever loaded, so art lookups never check a game's dirs."
+    game_dir = None
+    art_loaded = []
+    paused = False
+
+
+class HeadlessApp:
+
+    """
+    Provides the parts of Application that Art, CharacterSet, Palette,
+    ArtImporter and ArtExporter use, with no window or GL context.
+    Log lines are kept in log_lines rather than shown.
+    """
+
+    headless = True
+    game_mode = False
+    can_edit = True
+    show_hidden_layers = False
+    override_saved_camera = False
+    # GL renderer needs a context
+    export_renderer = RENDERER_SOFTWARE
+
+    def __init__(self, documents_dir='', cache_dir=None):
+        self.documents_dir = documents_dir
+        # None = don't write thumbnails of saved art
+        self.cache_dir = cache_dir
+        self.start_time = time.time()
+        self.log_lines = []
+        self.charsets, self.palettes = [], []
+        self.art_loaded_for_edit = []
+        self.converter = None
+        self.converter_modules = {}
+        self.last_export_options = {}
+        self.camera = HeadlessCamera()
+        self.cursor = HeadlessCursor()
+        self.gw = HeadlessGameWorld()
+        self.ui = HeadlessUI(self)
+
+    def log(self, new_line, error=False):
+        self.log_lines.append(new_line)
+
+    def dev_log(self, new_line):
+        pass
+
+    def get_elapsed_time(self):
+        return (time.time() - self.start_time) * 1000
+
+    def update_window_title(self):
+        pass
+
+    def get_file_hash(self, filename):
+        f_data = open(filename, 'rb').read()
+        return hashlib.md5(f_data).hexdigest()
+
+    def get_dirnames(self, subdir=None, include_base=True):
+        "returns list of dirs to search: user documents, then Playscii's own"
+        dirnames = []
+        for base_dir in [self.documents_dir, APP_DIR]:
+            if subdir is not None and os.path.exists(base_dir + subdir):
+                dirnames.append(base_dir + subdir)
+        if include_base:
+            dirnames += [self.documents_dir, APP_DIR, '']
+        return dirnames
+
+    def find_filename_path(self, filename, subdir=None, extensions=None):
+        "returns a valid path for given file, extension, subdir (art/ etc)"
+        if not filename:
+            return None
+        if not extensions:
+            extensions = ['']
+        elif not type(extensions) is list:
+            extensions = [extensions]
+        for dirname in self.get_dirnames(subdir):
+            for ext in extensions:
+                f = '%s%s' % (dirname, filename)
+                if ext and not filename.endswith(ext):
+                    f += '.' + ext
+                if os.path.isfile(f):
+                    return f
+        return None
+
+    def load_charset(self, charset_to_load, log=False):
+        base_charset_to_load = os.path.basename(charset_to_load)
+        base_charset_to_load = os.path.splitext(base_charset_to_load)[0]
+        for charset in self.charsets:
+            if charset.base_filename == base_charset_to_load:
+                return charset
+        new_charset = CharacterSet(self, charset_to_load, log)
+        if new_charset.init_success:
+            self.charsets.append(new_charset)
+            return new_charset
+
+    def load_palette(self, palette_to_load, log=False):
+        base_palette_to_load = os.path.basename(palette_to_load)
+        base_palette_to_load = os.path.splitext(base_palette_to_load)[0]
+        for palette in self.palettes:
+            if palette.base_filename == base_palette_to_load:
+                return palette
+        new_palette = Palette(self, palette_to_load, log)
+        if new_palette.init_success:
+            self.palettes.append(new_palette)
+            return new_palette
+
+    def new_art(self, filename, width=None, height=None,
+                charset=None, palette=None):
+        width, height = width or DEFAULT_WIDTH, height or DEFAULT_HEIGHT
+        filename = filename or DEFAULT_ART_FILENAME
+        charset = self.load_charset(charset or DEFAULT_CHARSET)
+        palette = self.load_palette(palette or DEFAULT_PALETTE)
+        art = Art(filename, self, charset, palette, width, height)
+        art.set_filename(filename)
+        art.time_loaded = time.time()
+        return art
+
+    def load_art(self, filename, autocreate=False):
+        "returns art loaded from given file, None if it couldn't be loaded"
+        valid_filename = self.find_filename_path(filename, ART_DIR,
+                                                 ART_FILE_EXTENSION)
+        if not valid_filename:
+            return self.new_art(filename) if autocreate else None
+        for art in self.art_loaded_for_edit:
+            if art.filename == valid_filename:
+                return art
+        art = ArtFromDisk(valid_filename, self)
+        if not art.valid:
+            return None
+        return art
+
+    def set_new_art_for_edit(self, art):
+        self.art_loaded_for_edit.insert(0, art)
+        self.ui.set_active_art(art)
+
+    def close_art(self, art):
+        if art in self.art_loaded_for_edit:
+            self.art_loaded_for_edit.remove(art)
+        if art is self.ui.active_art:
+            self.ui.active_art = None
+
+    def get_converter_classes(self, base_class):
+        "return a list of converter classes in Playscii and user formats dirs"
+        classes = []
+        for dirname in [self.documents_dir, APP_DIR]:
+            if dirname and not dirname in sys.path:
+                sys.path.append(dirname)
+        files = os.listdir(APP_DIR + FORMATS_DIR)
+        if os.path.exists(self.documents_dir + FORMATS_DIR):
+            files += os.listdir(self.documents_dir + FORMATS_DIR)
+        for filename in files:
+            basename, ext = os.path.splitext(filename)
+            if not ext.lower() == '.py':
+                continue
+            if not basename in self.converter_modules:
+                self.converter_modules[basename] = importlib.import_module('formats.%s' % basename)
+            for v in self.converter_modules[basename].__dict__.values():
+                # skip base class, and classes imported from other modules
+                if type(v) is type and issubclass(v, base_class) and \
+                   v is not base_class and not v in classes:
+                    classes.append(v)
+        return classes
+
+    def get_importers(self):
+        "Returns list of all ArtImporter subclasses found in formats/ dir."
+        return self.get_converter_classes(ArtImporter)
+
+    def get_exporters(self):
+        "Returns list of all ArtExporter subclasses found in formats/ dir."
+        return self.get_converter_classes(ArtExporter)
+
+    def finish_conversion(self):
+        "runs any in-progress (eg bitmap) conversion until it's done"
+        while self.converter:
+            self.converter.update()
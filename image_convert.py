@@ -1,11 +1,10 @@
 
-import math, os.path, time
+import math, os.path, time, multiprocessing
 import numpy as np
 
 from PIL import Image, ImageChops, ImageStat
 
 from renderable_sprite import SpriteRenderable
-from lab_color import rgb_to_lab, lab_color_diff
 
 """
 notes / future research
@@ -23,16 +22,324 @@ https://www.youtube.com/watch?v=L6CkYou6hYU
 - downsample each block bilinearly, divide each into 4x4 cells, then compare them with similarly bilinearly-downsampled char blocks
 """
 
+# max # of per-pixel color diffs get_best_tile_for_block scores at once
+MAX_SCORE_ELEMENTS = 2 ** 22
+
+# width and height in cells of fast conversion's glyph signatures
+SIGNATURE_SIZE = 4
+# subdir of app's cache dir glyph signatures are saved in
+GLYPH_INDEX_CACHE_DIR = 'glyph_index/'
+
+def get_signature_weights(char_w, char_h):
+    """
+    Returns (char_h * char_w, SIGNATURE_SIZE ** 2) array that averages a
+    flattened block's pixels into SIGNATURE_SIZE x SIGNATURE_SIZE cells.
+    """
+    rows = np.arange(char_h) * SIGNATURE_SIZE // char_h
+    cols = np.arange(char_w) * SIGNATURE_SIZE // char_w
+    cells = (rows[:, np.newaxis] * SIGNATURE_SIZE + cols).ravel()
+    weights = np.zeros((cells.size, SIGNATURE_SIZE ** 2), dtype=np.float32)
+    weights[np.arange(cells.size), cells] = 1
+    # cells no pixels fall in (chars smaller than SIGNATURE_SIZE) stay 0
+    return weights / np.maximum(weights.sum(axis=0), 1)
+
+def get_glyph_signatures(app, charset, glyph_masks):
+    """
+    Returns (num chars, SIGNATURE_SIZE ** 2) array of how much of each
+    signature cell each glyph covers, saved in app's cache dir keyed on
+    charset image's hash.
+    """
+    n, h, w = glyph_masks.shape
+    cache_filename = None
+    if app.cache_dir:
+        file_hash = app.get_file_hash(charset.image_filename)
+        cache_filename = '%s%s%s_%sx%s_%s.npy' % (app.cache_dir, GLYPH_INDEX_CACHE_DIR,
+                                                 file_hash, w, h, SIGNATURE_SIZE)
+        if os.path.exists(cache_filename):
+            signatures = np.load(cache_filename)
+            if len(signatures) == n:
+                return signatures
+    signatures = glyph_masks.reshape(n, -1) @ get_signature_weights(w, h)
+    if cache_filename:
+        try:
+            os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+            np.save(cache_filename, signatures)
+        except OSError as e:
+            app.log("Couldn't save glyph signatures to %s: %s" % (cache_filename, e))
+    return signatures
+
+class GlyphIndex:
+    
+    """
+    Approximate nearest glyph search, for fast conversion: picks candidate
+    chars for a block by comparing its downsampled brightness to each glyph's
+    downsampled coverage, so only those need exact scoring.
+    """
+    
+    def __init__(self, signatures, palette, char_w, char_h, candidates):
+        self.signatures = signatures
+        self.inverse_signatures = 1 - signatures
+        self.weights = get_signature_weights(char_w, char_h)
+        # perceived brightness of each palette color
+        rgb = np.array([color[:3] for color in palette.colors], dtype=np.float32)
+        self.luminances = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        self.candidates = candidates
+    
+    def get_candidates(self, src_block):
+        "returns sorted indices of chars likeliest to match block, None for all"
+        if self.candidates >= len(self.signatures):
+            return None
+        lum = self.luminances[src_block.ravel()]
+        darkest, brightest = lum.min(), lum.max()
+        if darkest == brightest:
+            return None
+        signature = ((lum - darkest) / (brightest - darkest)) @ self.weights
+        # either of a tile's colors might be the brighter one
+        diffs = np.minimum(((self.signatures - signature) ** 2).sum(axis=1),
+                           ((self.inverse_signatures - signature) ** 2).sum(axis=1))
+        return np.sort(np.argpartition(diffs, self.candidates)[:self.candidates])
+
+def get_best_tile(src_block, color_diffs, glyph_masks, glyph_index=None):
+    """
+    Returns a (char, fg, bg) tuple for the best match of given block, given
+    a table of palette color diffs and glyph masks
+    (CharacterSet.conversion_masks).
+    If a GlyphIndex is given, only its candidate chars are considered.
+    """
+    # get unique colors in source block
+    colors, counts = np.unique(src_block, return_counts=True)
+    # blocks past edge of (aspect-preserved) source image are empty
+    if len(colors) == 0:
+        return (0, 0, 0)
+    elif len(colors) == 1:
+        return (0, 0, colors[0])
+    # sort by most to least used colors, ties in color order
+    colors = colors[np.argsort(-counts, kind='stable')]
+    # all (bg, fg) pairs of different colors, most used bg colors first
+    bg_i, fg_i = np.nonzero(~np.eye(len(colors), dtype=bool))
+    bgs, fgs = colors[bg_i], colors[fg_i]
+    # (pairs, pixels) diffs of each source pixel from each fg and bg
+    pixels = src_block.ravel()
+    fg_diffs = color_diffs[pixels, fgs[:, np.newaxis]]
+    bg_diffs = color_diffs[pixels, bgs[:, np.newaxis]]
+    # bg color 1 tiles were always scored as solid fg, as recoloring
+    # glyph pixels 0 -> bg then 1 -> fg recolored bg pixels too
+    solid = bgs == 1
+    bg_diffs[solid] = fg_diffs[solid]
+    chars = glyph_index.get_candidates(src_block) if glyph_index else None
+    if chars is not None:
+        glyph_masks = glyph_masks[chars]
+    masks = glyph_masks.reshape(len(glyph_masks), -1)
+    # score every char for as many color pairs at a time as fit in
+    # MAX_SCORE_ELEMENTS: (pairs, chars) sums of per-pixel diffs
+    pairs_per_chunk = max(1, MAX_SCORE_ELEMENTS // masks.size)
+    best_diff, best_index = None, 0
+    for i in range(0, len(bgs), pairs_per_chunk):
+        j = i + pairs_per_chunk
+        diffs = np.where(masks, fg_diffs[i:j, np.newaxis],
+                         bg_diffs[i:j, np.newaxis]).sum(axis=-1)
+        # first lowest diff in pair, char order wins ties
+        index = np.argmin(diffs)
+        if best_diff is None or diffs.flat[index] < best_diff:
+            best_diff = diffs.flat[index]
+            best_index = i * len(masks) + index
+        # no difference = can't do better
+        if best_diff == 0:
+            break
+    pair, char = divmod(int(best_index), len(masks))
+    if chars is not None:
+        char = int(chars[char])
+    return (char, fgs[pair], bgs[pair])
+
+# bits of each R, G, B channel approximate block cache keys compare
+APPROXIMATE_COLOR_BITS = 2
+
+def get_color_classes(palette):
+    """
+    Returns array of a coarse color class for each of given palette's color
+    indices, from the top APPROXIMATE_COLOR_BITS of its R, G and B.
+    """
+    shift = 8 - APPROXIMATE_COLOR_BITS
+    rgb = np.array([color[:3] for color in palette.colors], dtype=np.uint32) >> shift
+    classes = (rgb[:, 0] << (APPROXIMATE_COLOR_BITS * 2)) | (rgb[:, 1] << APPROXIMATE_COLOR_BITS) | rgb[:, 2]
+    return classes.astype(np.uint8)
+
+def match_block(block, color_diffs, glyph_masks, cache=None, color_classes=None,
+                glyph_index=None):
+    """
+    Returns best (char, fg, bg) for given block, and True if it was found in
+    given cache dict, keyed on block's color indices. If color_classes (from
+    get_color_classes) is given, blocks whose pixels are in the same coarse
+    color classes share a key and thus a tile. Optional GlyphIndex is passed
+    on to get_best_tile.
+    """
+    if cache is None:
+        return get_best_tile(block, color_diffs, glyph_masks, glyph_index), False
+    key = color_classes[block] if color_classes is not None else block
+    key = key.shape, key.tobytes()
+    tile = cache.get(key, None)
+    if tile is not None:
+        return tile, True
+    char, fg, bg = get_best_tile(block, color_diffs, glyph_masks, glyph_index)
+    tile = cache[key] = int(char), int(fg), int(bg)
+    return tile, False
+
+# conversion pool workers' copies of the tables every band is matched
+# against, sent once per worker by init_pool_worker
+worker_color_diffs, worker_glyph_masks = None, None
+worker_block_cache, worker_color_classes = None, None
+worker_glyph_index = None
+
+def init_pool_worker(color_diffs, glyph_masks, cache_blocks, color_classes,
+                     glyph_index):
+    global worker_color_diffs, worker_glyph_masks
+    global worker_block_cache, worker_color_classes, worker_glyph_index
+    worker_color_diffs, worker_glyph_masks = color_diffs, glyph_masks
+    worker_block_cache = {} if cache_blocks else None
+    worker_color_classes = color_classes
+    worker_glyph_index = glyph_index
+
+def convert_band(y, band, char_w, columns):
+    """
+    Runs in conversion pool workers: returns given tile row index, an
+    (x, char, fg, bg) tuple for the block in given band at each of given
+    columns, and # of those found in worker's block cache.
+    """
+    tiles = []
+    hits = 0
+    for x in columns:
+        block = band[:, x * char_w:(x + 1) * char_w]
+        (char, fg, bg), hit = match_block(block, worker_color_diffs, worker_glyph_masks,
+                                          worker_block_cache, worker_color_classes,
+                                          worker_glyph_index)
+        tiles.append((x, int(char), int(fg), int(bg)))
+        hits += hit
+    return y, tiles, hits
+
+def convert_frames(first_frame, src_arrays, char_w, char_h, width, height, threshold):
+    """
+    Runs in conversion pool workers: converts given consecutive frames'
+    source arrays, each only re-matching blocks changed since previous one
+    by more than given threshold (see get_changed_tiles); None = match all.
+    Returns given first frame index, a (frames, height, width, 3) array of
+    (char, fg, bg) tiles, # of block cache hits, and # of unchanged tiles.
+    """
+    tiles = np.zeros((len(src_arrays), height, width, 3), dtype=np.uint16)
+    hits, unchanged = 0, 0
+    reference = None
+    for i, src_array in enumerate(src_arrays):
+        changed, reference = get_changed_tiles(src_array, reference, char_w,
+                                               char_h, width, height, threshold)
+        if threshold is None:
+            reference = None
+        if i > 0:
+            tiles[i] = tiles[i - 1]
+        unchanged += changed.size - np.count_nonzero(changed)
+        for y, x in np.argwhere(changed):
+            block = src_array[y * char_h:(y + 1) * char_h, x * char_w:(x + 1) * char_w]
+            tiles[i, y, x], hit = match_block(block, worker_color_diffs, worker_glyph_masks,
+                                              worker_block_cache, worker_color_classes,
+                                              worker_glyph_index)
+            hits += hit
+    return first_frame, tiles, hits, unchanged
+
+def get_color_diffs(palette, lab_color_comparison=True):
+    """
+    Returns (colors, colors) table of differences between each of given
+    palette's colors: L*a*b distance for greater accuracy, else sum of
+    RGBA channel differences.
+    """
+    if lab_color_comparison:
+        return palette.get_lab_distances().astype(np.float32)
+    colors = np.array(palette.colors, dtype=np.float32)
+    return np.abs(colors[:, np.newaxis] - colors[np.newaxis, :]).sum(axis=-1)
+
+def get_source_image(image_filename, art, bicubic_scale=False):
+    """
+    Returns given image scaled to fit given art's tiles, preserving aspect,
+    and quantized to its palette.
+    """
+    src_img = Image.open(image_filename).convert('RGB')
+    char_w, char_h = art.charset.char_width, art.charset.char_height
+    art_pixel_w, art_pixel_h = char_w * art.width, char_h * art.height
+    w, h = src_img.size
+    ratio = min(art_pixel_h / h, art_pixel_w / w)
+    w = math.floor((w * ratio) / char_w) * char_w
+    h = math.floor((h * ratio) / char_h) * char_h
+    scale_method = Image.BICUBIC if bicubic_scale else Image.NEAREST
+    src_img = src_img.resize((w, h), resample=scale_method)
+    return art.palette.get_palettized_image(src_img)
+
+def get_source_array(src_img):
+    "returns (height, width) array of given palettized image's color indices"
+    # palettes of >256 colors are palettized to 32-bit images
+    return np.asarray(src_img).astype(np.uint16)
+
+def get_changed_tiles(src_array, reference, char_w, char_h, width, height, threshold=0):
+    """
+    Returns (height, width) boolean array, True for each tile whose block in
+    given source array differs from given reference array's in more than
+    given fraction of its pixels, and a new reference with those blocks
+    updated. All tiles have changed if there's no compatible reference.
+    """
+    if reference is None or reference.shape != src_array.shape:
+        return np.ones((height, width), dtype=bool), src_array
+    src_h, src_w = src_array.shape
+    diffs = np.zeros((height * char_h, width * char_w), dtype=np.float32)
+    diffs[:src_h, :src_w] = src_array != reference
+    diffs = diffs.reshape(height, char_h, width, char_w).mean(axis=(1, 3))
+    changed = diffs > threshold
+    pixels = changed.repeat(char_h, axis=0).repeat(char_w, axis=1)[:src_h, :src_w]
+    return changed, np.where(pixels, src_array, reference)
+
+def get_cache_report(hits, tiles):
+    "returns log line for given # of block cache hits in given # of tiles"
+    rate = hits / tiles * 100 if tiles else 0
+    return '  %s of %s tiles (%.1f%%) reused from block cache' % (hits, tiles, rate)
+
+def run_for(step, budget, clock=time.perf_counter):
+    """
+    Calls given function until it returns False or given budget (in
+    seconds, measured by given clock) is used up, at least once.
+    Returns # of calls made.
+    """
+    deadline = clock() + budget
+    calls = 0
+    while True:
+        calls += 1
+        if not step() or clock() >= deadline:
+            return calls
+
+def get_eta(fraction_done, elapsed):
+    "returns estimated seconds remaining for a task, None if too soon to tell"
+    if fraction_done <= 0:
+        return None
+    return elapsed * (1 - fraction_done) / fraction_done
+
 class ImageConverter:
     
-    tiles_per_tick = 1
     lab_color_comparison = True
-    # delay in seconds before beginning to convert tiles.
-    # lets eg UI catch up to BitmapImageImporter changes to Art.
-    start_delay = 1.0
+    # milliseconds of each frame spent converting tiles in the app's
+    # process, keep below frame time (~16ms at 60fps) for a responsive UI
+    frame_budget_ms = 10
+    # # of processes converting tile rows in parallel, None = one per CPU.
+    # 1 = convert frame_budget_ms worth of tiles each update in app's process.
+    # processes are forked from app's, only raise this where that's safe, ie
+    # not from a process with a window and GL context.
+    workers = 1
+    # reuse tiles chosen for blocks identical to ones already converted
+    cache_blocks = True
+    # also reuse them for blocks whose colors are merely similar: faster,
+    # less accurate
+    approximate_block_cache = False
+    # fast (lower quality) conversion: only score the fast_candidates chars
+    # whose rough shapes best match each block, see GlyphIndex
+    fast = False
+    fast_candidates = 16
     
     def __init__(self, app, image_filename, art, bicubic_scale=False, sequence_converter=None):
         self.init_success = False
+        self.pool = None
         image_filename = app.find_filename_path(image_filename)
         if not image_filename or not os.path.exists(image_filename):
             app.log("ImageConverter: Couldn't find image %s" % image_filename)
@@ -46,88 +353,75 @@ class ImageConverter:
         # if an ImageSequenceConverter created us, keep a handle to it
         self.sequence_converter = sequence_converter
         try:
-            self.src_img = Image.open(self.image_filename).convert('RGB')
+            self.src_img = get_source_image(self.image_filename, art, bicubic_scale)
         except:
             return
         # if we're part of a sequence, app doesn't need handle directly to us
         if not self.sequence_converter:
             self.app.converter = self
-        # preserve aspect
         self.char_w, self.char_h = art.charset.char_width, art.charset.char_height
-        art_pixel_w, art_pixel_h = self.char_w * art.width, self.char_h * art.height
         w, h = self.src_img.size
-        ratio = min(art_pixel_h / h, art_pixel_w / w)
-        w = math.floor((w * ratio) / self.char_w) * self.char_w
-        h = math.floor((h * ratio) / self.char_h) * self.char_h
-        scale_method = Image.BICUBIC if bicubic_scale else Image.NEAREST
-        self.src_img = self.src_img.resize((w, h), resample=scale_method)
-        # convert source image to art's palette
-        self.src_img = self.art.palette.get_palettized_image(self.src_img)
         # build table of color diffs
-        unique_colors = len(self.art.palette.colors)
-        self.color_diffs = np.zeros((unique_colors, unique_colors), dtype=np.float32)
-        # option: L*a*b color space conversion for greater accuracy
-        get_color_diff = self.get_lab_color_diff if self.lab_color_comparison else self.get_rgb_color_diff
-        #get_color_diff = self.get_nonlinear_rgb_color_diff
-        for i,color in enumerate(self.art.palette.colors):
-            for j,other_color in enumerate(self.art.palette.colors):
-                self.color_diffs[i][j] = get_color_diff(color, other_color)
+        self.color_diffs = get_color_diffs(self.art.palette, self.lab_color_comparison)
         # convert palettized source image to an array for fast comparisons
-        self.src_array = np.fromstring(self.src_img.tobytes(), dtype=np.uint8)
-        src_w, src_h = self.src_img.size
-        self.src_array = np.reshape(self.src_array, (src_h, src_w))
-        # convert charmap to 1-bit color for fast value swaps during
-        # block comparison
-        self.char_img = self.art.charset.image_data.copy().convert('RGB')
-        bw_pal_img = Image.new('P', (1, 1))
-        bw_pal = [0, 0, 0, 255, 255, 255]
-        while len(bw_pal) < 256 * 3:
-            bw_pal.append(0)
-        bw_pal_img.putpalette(tuple(bw_pal))
-        self.char_img = self.char_img.quantize(palette=bw_pal_img)
-        self.char_array = np.fromstring(self.char_img.tobytes(), dtype=np.uint8)
-        self.char_array = np.reshape(self.char_array, (self.art.charset.image_height, self.art.charset.image_width))
-        # create, size and position image preview
-        preview_img = self.src_img.copy()
-        # remove transparency if source image is a GIF to avoid a PIL crash :[
-        # TODO: https://github.com/python-pillow/Pillow/issues/1377
-        if 'transparency' in preview_img.info:
-            preview_img.info.pop('transparency')
-        self.preview_sprite = SpriteRenderable(self.app, None, preview_img)
-        # preview image scale takes into account character aspect
-        self.preview_sprite.scale_x = w / (self.char_w / self.art.quad_width)
-        self.preview_sprite.scale_y = h / (self.char_h / self.art.quad_height)
-        # position in top left corner
-        self.preview_sprite.y = -self.preview_sprite.scale_y
-        self.preview_sprite.z = self.art.layers_z[self.art.active_layer] - 0.01
+        self.src_array = get_source_array(self.src_img)
+        # 1-bit glyph masks for block comparison, built by charset
+        self.glyph_masks = self.art.charset.conversion_masks
+        self.glyph_index = None
+        if self.fast:
+            signatures = get_glyph_signatures(self.app, self.art.charset, self.glyph_masks)
+            self.glyph_index = GlyphIndex(signatures, self.art.palette, self.char_w,
+                                          self.char_h, self.fast_candidates)
+        # {block key: (char, fg, bg)}, see match_block
+        self.block_cache = {} if self.cache_blocks else None
+        self.color_classes = None
+        if self.cache_blocks and self.approximate_block_cache:
+            self.color_classes = get_color_classes(self.art.palette)
+        self.cache_hits = 0
+        # create, size and position image preview.
+        # headless apps (eg batch conversion) have nowhere to show a preview
+        self.preview_sprite = None
+        if not self.app.headless:
+            if self.src_img.mode == 'P':
+                preview_img = self.src_img.copy()
+            else:
+                # 32-bit color indices, see Palette.get_palettized_image
+                colors = np.array([color[:3] for color in self.art.palette.colors], dtype=np.uint8)
+                preview_img = Image.fromarray(colors[self.src_array])
+            # remove transparency if source image is a GIF to avoid a PIL crash :[
+            # TODO: https://github.com/python-pillow/Pillow/issues/1377
+            if 'transparency' in preview_img.info:
+                preview_img.info.pop('transparency')
+            self.preview_sprite = SpriteRenderable(self.app, None, preview_img)
+            # preview image scale takes into account character aspect
+            self.preview_sprite.scale_x = w / (self.char_w / self.art.quad_width)
+            self.preview_sprite.scale_y = h / (self.char_h / self.art.quad_height)
+            # position in top left corner
+            self.preview_sprite.y = -self.preview_sprite.scale_y
+            self.preview_sprite.z = self.art.layers_z[self.art.active_layer] - 0.01
         # clear active layer so we can see preview
         self.art.clear_frame_layer(self.art.active_frame, self.art.active_layer, 0)
-        # block indices
-        self.x, self.y = 0, 0
-        # precompute block indices - lets us do a bit less + and *
-        self.char_blocks = []
-        for char_y in range(self.art.charset.map_height):
-            for char_x in range(self.art.charset.map_width):
-                x0, y0 = char_x * self.char_w, char_y * self.char_h
-                x1, y1 = x0 + self.char_w, y0 + self.char_h
-                self.char_blocks.append((x0, y0, x1, y1))
-                # characters might end mid-row, bail if so
-                if len(self.char_blocks) > self.art.charset.last_index:
-                    break
+        # only convert tiles whose source blocks changed since sequence's
+        # previous frame, if it's keeping track
+        reference, threshold, self.previous_frame = None, 0, None
+        if self.sequence_converter and self.sequence_converter.temporal_coherence:
+            reference = self.sequence_converter.reference_array
+            threshold = self.sequence_converter.change_threshold
+            self.previous_frame = self.sequence_converter.previous_frame
+        # reference_array: source each tile was last converted from
+        self.changed_tiles, self.reference_array = get_changed_tiles(self.src_array, reference,
+                                                                     self.char_w, self.char_h,
+                                                                     art.width, art.height,
+                                                                     threshold)
+        # (x, y) of each tile left to convert, in row order
+        self.tile_queue = [(x, y) for y, x in np.argwhere(self.changed_tiles)]
+        # pending results of rows being converted by pool, if any
+        self.bands = []
+        self.tiles_done = 0
+        # set when first update begins conversion
+        self.convert_start_time = None
         self.init_success = True
     
-    def get_rgb_color_diff(self, color1, color2):
-        r = abs(color1[0] - color2[0])
-        g = abs(color1[1] - color2[1])
-        b = abs(color1[2] - color2[2])
-        a = abs(color1[3] - color2[3])
-        return abs(r + g + b + a)
-    
-    def get_lab_color_diff(self, color1, color2):
-        l1, a1, b1 = rgb_to_lab(*color1[:3])
-        l2, a2, b2 = rgb_to_lab(*color2[:3])
-        return lab_color_diff(l1, a1, b1, l2, a2, b2)
-    
     def get_nonlinear_rgb_color_diff(self, color1, color2):
         # from http://www.compuphase.com/cmetric.htm
         rmean = int((color1[0] + color2[0]) / 2)
@@ -136,76 +430,126 @@ class ImageConverter:
         b = color1[2] - color2[2]
         return math.sqrt((((512+rmean)*r*r)>>8) + 4*g*g + (((767-rmean)*b*b)>>8))
     
-    def update(self):
-        if time.time() < self.start_time + self.start_delay:
+    def start_pool(self):
+        """
+        start worker processes and queue every tile row for conversion.
+        frames of a sequence all use one pool, kept by sequence converter.
+        """
+        rows = [y for y in range(self.art.height) if self.changed_tiles[y].any()]
+        if len(rows) == 0:
             return
-        for i in range(self.tiles_per_tick):
-            x_start, y_start = self.x * self.char_w, self.y * self.char_h
-            x_end, y_end = x_start + self.char_w, y_start + self.char_h
-            block = self.src_array[y_start:y_end, x_start:x_end]
-            char, fg, bg = self.get_best_tile_for_block(block)
-            # get_best_etc sometimes returns 0 for darkest blocks,
-            # but transparency isn't properly supported yet
-            fg = self.art.palette.darkest_index if fg == 0 else fg
-            bg = self.art.palette.darkest_index if bg == 0 else bg
-            self.art.set_tile_at(self.art.active_frame, self.art.active_layer,
-                                 self.x, self.y, char, fg, bg)
-            #print('set block %s,%s to ch %s fg %s bg %s' % (self.x, self.y, char, fg, bg))
-            self.x += 1
-            if self.x >= self.art.width:
-                self.x = 0
-                self.y += 1
-                if self.y >= self.art.height:
-                    self.finish()
-                    break
+        if self.sequence_converter and self.sequence_converter.row_pool:
+            self.pool = self.sequence_converter.row_pool
+        else:
+            workers = self.workers or multiprocessing.cpu_count()
+            # sequence's later frames may have more rows to convert
+            if not self.sequence_converter:
+                workers = min(workers, len(rows))
+            if workers < 2:
+                return
+            try:
+                self.pool = multiprocessing.Pool(workers, init_pool_worker,
+                                                 (self.color_diffs, self.glyph_masks,
+                                                  self.cache_blocks, self.color_classes,
+                                                  self.glyph_index))
+            except Exception as e:
+                self.app.log("ImageConverter: Couldn't start conversion processes (%s), converting in app" % e)
+                return
+            if self.sequence_converter:
+                self.sequence_converter.row_pool = self.pool
+        for y in rows:
+            band = self.src_array[y * self.char_h:(y + 1) * self.char_h]
+            columns = np.nonzero(self.changed_tiles[y])[0].tolist()
+            result = self.pool.apply_async(convert_band, (y, band, self.char_w, columns))
+            self.bands.append(result)
+    
+    def update(self):
+        # first update only starts conversion, so UI can catch up to eg
+        # BitmapImageImporter changes to Art before first tiles are set
+        if self.convert_start_time is None:
+            self.convert_start_time = time.time()
+            if self.previous_frame is not None:
+                self.copy_unchanged_tiles()
+            if self.workers != 1:
+                self.start_pool()
+            if not self.app.headless:
+                return
+        if self.pool:
+            self.update_bands()
+        else:
+            self.update_tiles()
+    
+    def update_bands(self):
+        "set tiles for rows the pool has finished until frame's budget is used up"
+        # headless apps have no window to keep responsive, wait for a row
+        if self.app.headless and not any(r.ready() for r in self.bands):
+            self.bands[0].wait()
+        run_for(self.set_next_band, self.frame_budget_ms / 1000)
+        if len(self.bands) == 0:
+            self.finish()
+    
+    def set_next_band(self):
+        "set tiles for next row the pool has finished, return False if none"
+        result = next((r for r in self.bands if r.ready()), None)
+        if not result:
+            return False
+        self.bands.remove(result)
+        y, tiles, hits = result.get()
+        for x, char, fg, bg in tiles:
+            self.set_tile(x, y, char, fg, bg)
+        self.tiles_done += len(tiles)
+        self.cache_hits += hits
+        return True
+    
+    def update_tiles(self):
+        "convert tiles in this process until this frame's budget is used up"
+        run_for(self.convert_next_tile, self.frame_budget_ms / 1000)
+    
+    def convert_next_tile(self):
+        "convert next tile in queue, return False once done"
+        if self.tiles_done >= len(self.tile_queue):
+            self.finish()
+            return False
+        x, y = self.tile_queue[self.tiles_done]
+        x_start, y_start = x * self.char_w, y * self.char_h
+        x_end, y_end = x_start + self.char_w, y_start + self.char_h
+        block = self.src_array[y_start:y_end, x_start:x_end]
+        (char, fg, bg), hit = match_block(block, self.color_diffs, self.glyph_masks,
+                                          self.block_cache, self.color_classes,
+                                          self.glyph_index)
+        self.set_tile(x, y, char, fg, bg)
+        self.tiles_done += 1
+        self.cache_hits += hit
+        return True
+    
+    def copy_unchanged_tiles(self):
+        "set tiles whose source blocks didn't change to previous frame's"
+        frame, layer = self.art.active_frame, self.art.active_layer
+        unchanged = ~self.changed_tiles
+        self.art.unshare_frame(frame)
+        for tiles in [self.art.chars, self.art.fg_colors, self.art.bg_colors]:
+            tiles[frame][layer][unchanged] = tiles[self.previous_frame][layer][unchanged]
+        self.art.mark_frame_changed(frame)
+    
+    def get_progress(self):
+        "returns fraction of tiles converted, and estimated seconds remaining"
+        done = self.tiles_done / max(1, np.count_nonzero(self.changed_tiles))
+        if self.convert_start_time is None:
+            return done, None
+        return done, get_eta(done, time.time() - self.convert_start_time)
+    
+    def set_tile(self, x, y, char, fg, bg):
+        # get_best_etc sometimes returns 0 for darkest blocks,
+        # but transparency isn't properly supported yet
+        fg = self.art.palette.darkest_index if fg == 0 else fg
+        bg = self.art.palette.darkest_index if bg == 0 else bg
+        self.art.set_tile_at(self.art.active_frame, self.art.active_layer,
+                             x, y, char, fg, bg)
     
     def get_best_tile_for_block(self, src_block):
         "returns a (char, fg, bg) tuple for the best match of given block"
-        # get unique colors in source block
-        colors, counts = np.unique(src_block, False, False, return_counts=True)
-        if len(colors) == 1:
-            return (0, 0, colors[0])
-        # sort by most to least used colors
-        color_counts = []
-        for i,color in enumerate(colors):
-            color_counts += [(color, counts[i])]
-        color_counts.sort(key=lambda item: item[1], reverse=True)
-        # build list of unique fg/bg color (index) tuple-pairs
-        combos = []
-        for color1,count1 in color_counts:
-            for color2,count2 in color_counts:
-                if color1 == color2:
-                    continue
-                # fg/bg color swap SHOULD be allowed
-                if (color1, color2) in combos:
-                    continue
-                combos.append((color1, color2))
-        # compare all combos + chars w/ source block
-        best_char = 0
-        best_diff = 9999999999999
-        best_fg, best_bg = 0, 0
-        for bg,fg in combos:
-            # reset char index before each run through charset
-            char_index = 0
-            char_array = self.char_array.copy()
-            # replace 1-bit color of char image with fg and bg colors
-            char_array[char_array == 0] = bg
-            char_array[char_array == 1] = fg
-            for (x0, y0, x1, y1) in self.char_blocks:
-                char_block = char_array[y0:y1, x0:x1]
-                diff = self.get_block_diff(src_block, char_block)
-                # no difference = return immediately
-                if diff == 0:
-                    return (char_index, fg, bg)
-                if diff < best_diff:
-                    best_diff = diff
-                    best_char = char_index
-                    best_fg, best_bg = fg, bg
-                    #print('%s is new best char index, diff %s:' % (char_index, diff))
-                char_index += 1
-        # return best (least different to source block) char/fg/bg found
-        #print('%s is best char index, diff %s:' % (best_char, best_diff))
-        return (best_char, best_fg, best_bg)
+        return get_best_tile(src_block, self.color_diffs, self.glyph_masks,
+                             self.glyph_index)
     
     def print_block(self, block, fg, bg):
         "prints ASCII representation of a block with . and # as white and black"
@@ -220,16 +564,41 @@ class ImageConverter:
             s += '\n'
         print(s)
     
-    def get_block_diff(self, block1, block2):
-        # build array of difference values w/ fancy numpy indexing, sum() it
-        return self.color_diffs[block1, block2].sum()
-    
     def finish(self, cancelled=False):
         self.finished = True
-        if not self.sequence_converter:
+        # sequence converter stops its pool once sequence is done
+        if self.pool and not self.sequence_converter:
+            self.pool.terminate()
+        self.pool = None
+        self.bands = []
+        if self.sequence_converter:
+            self.sequence_converter.tiles_done += self.tiles_done
+            self.sequence_converter.cache_hits += self.cache_hits
+            self.sequence_converter.tiles_unchanged += self.changed_tiles.size - np.count_nonzero(self.changed_tiles)
+        else:
             time_taken = time.time() - self.start_time
             verb = 'cancelled' if cancelled else 'finished'
             self.app.log('Conversion of image %s %s after %.3f seconds' % (self.image_filename, verb, time_taken))
+            if self.block_cache is not None:
+                self.app.log(get_cache_report(self.cache_hits, self.tiles_done))
             self.app.converter = None
         self.preview_sprite = None
         self.app.update_window_title()
+
+
+def convert_image(image_filename, charset, palette, width, height, bicubic_scale=False):
+    """
+    Converts given image file to a new Art of given size in tiles, using
+    charset and palette of given names, with no window or UI.
+    Returns None if conversion fails.
+    """
+    # headless imports modules that import us
+    from headless import HeadlessApp
+    app = HeadlessApp()
+    name = os.path.splitext(os.path.basename(image_filename))[0]
+    art = app.new_art(name, width, height, charset, palette)
+    converter = ImageConverter(app, image_filename, art, bicubic_scale)
+    if not converter.init_success:
+        return None
+    app.finish_conversion()
+    return art
@@ -3,9 +3,31 @@ from OpenGL import GL
 from PIL import Image, ImageChops, GifImagePlugin
 
 from framebuffer import ExportFramebuffer, ExportFramebufferNoCRT
+from image_render import render_frame_image
 
-def get_frame_image(app, art, frame, allow_crt=True, scale=1, bg_color=(0, 0, 0, 0)):
-    "returns a PIL image of given frame of given art, None on failure"
+# image export backends: OpenGL (supports CRT filter) or pure NumPy software
+# renderer (needs no GL context, eg for headless export)
+RENDERER_GL = 'gl'
+RENDERER_SOFTWARE = 'software'
+
+# GIFs and 8-bit PNGs can hold at most this many colors
+PALETTIZED_MAX_COLORS = 256
+
+def get_export_renderer(app):
+    "returns image export backend to use, set by Application.export_renderer"
+    # no app = headless, software is the only option
+    return app.export_renderer if app else RENDERER_SOFTWARE
+
+def get_frame_image(app, art, frame, allow_crt=True, scale=1, bg_color=(0, 0, 0, 0),
+                    layers=None, renderer=None):
+    """
+    returns a PIL image of given frame of given art, None on failure.
+    layers: list of layer indices to render, None = all visible layers.
+    renderer: RENDERER_GL or RENDERER_SOFTWARE, None = app's setting.
+    """
+    renderer = renderer or get_export_renderer(app)
+    if renderer == RENDERER_SOFTWARE:
+        return get_frame_image_software(app, art, frame, scale, bg_color, layers)
     post_fb_class = ExportFramebuffer if allow_crt else ExportFramebufferNoCRT
     # determine art's native size in pixels
     w = art.charset.char_width * art.width
@@ -33,7 +55,7 @@ def get_frame_image(app, art, frame, allow_crt=True, scale=1, bg_color=(0, 0, 0,
     GL.glClearColor(*bg_color or (0, 0, 0, 0))
     GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
     # render to it
-    art.renderables[0].render_frame_for_export(frame)
+    art.renderables[0].render_frame_for_export(frame, layers)
     GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, export_fb)
     post_fb.render()
     GL.glReadBuffer(GL.GL_COLOR_ATTACHMENT0)
@@ -52,7 +74,19 @@ def get_frame_image(app, art, frame, allow_crt=True, scale=1, bg_color=(0, 0, 0,
     src_img = src_img.transpose(Image.FLIP_TOP_BOTTOM)
     return src_img
 
-def export_animation(app, art, out_filename, bg_color=None, loop=True):
+def get_frame_image_software(app, art, frame, scale=1, bg_color=(0, 0, 0, 0),
+                             layers=None):
+    "get_frame_image for software renderer; app may be None"
+    show_hidden = False
+    if app:
+        show_hidden = app.show_hidden_layers
+        # as GL export does, undo any cursor preview changes
+        for edit in app.cursor.preview_edits:
+            edit.undo()
+    return render_frame_image(art, frame, scale, bg_color, layers, show_hidden)
+
+def export_animation(app, art, out_filename, bg_color=None, loop=True,
+                     renderer=None):
     # get list of rendered frame images
     frames = []
     # use arbitrary color for transparency
@@ -69,12 +103,15 @@ def export_animation(app, art, out_filename, bg_color=None, loop=True):
         f_transp = (i_transp[0]/255, i_transp[1]/255, i_transp[2]/255, 1.)
     for frame in range(art.frames):
         frame_img = get_frame_image(app, art, frame, allow_crt=False,
-                                    scale=1, bg_color=f_transp)
+                                    scale=1, bg_color=f_transp,
+                                    renderer=renderer)
         if bg_color is not None:
             # if bg color is specified, assume no transparency
-            frame_img = art.palette.get_palettized_image(frame_img, force_no_transparency=True)
+            frame_img = art.palette.get_palettized_image(frame_img, force_no_transparency=True,
+                                                         max_colors=PALETTIZED_MAX_COLORS)
         else:
-            frame_img = art.palette.get_palettized_image(frame_img, i_transp[:3])
+            frame_img = art.palette.get_palettized_image(frame_img, i_transp[:3],
+                                                         max_colors=PALETTIZED_MAX_COLORS)
         frames.append(frame_img)
     # compile frames into animated GIF with proper frame delays
     # technique thanks to:
@@ -114,14 +151,19 @@ def export_animation(app, art, out_filename, bg_color=None, loop=True):
     #app.log('%s exported (%s)' % (out_filename, output_format))
 
 
-def export_still_image(app, art, out_filename, crt=True, scale=1, bg_color=None):
+def export_still_image(app, art, out_filename, crt=True, scale=1, bg_color=None,
+                       layers=None, renderer=None):
+    renderer = renderer or get_export_renderer(app)
+    # software renderer has no CRT filter;
     # respect "disable CRT entirely" setting for slow GPUs
-    crt = False if app.fb.disable_crt else crt
+    if renderer == RENDERER_SOFTWARE or app.fb.disable_crt:
+        crt = False
     # just write RGBA if palette has more than one color with <1 alpha
     # TODO: add PNG/PNGset export option for palettized;
     # for now always export 32bit
     if crt or not art.palette.all_colors_opaque() or bg_color or True:
-        src_img = get_frame_image(app, art, art.active_frame, crt, scale, bg_color)
+        src_img = get_frame_image(app, art, art.active_frame, crt, scale,
+                                  bg_color, layers, renderer)
         if not src_img:
             return False
         src_img.save(out_filename, 'PNG')
@@ -131,10 +173,12 @@ def export_still_image(app, art, out_filename, crt=True, scale=1, bg_color=None)
         # as with aniGIF export, use arbitrary color for transparency
         i_transp = art.palette.get_random_non_palette_color()
         f_transp = (i_transp[0]/255, i_transp[1]/255, i_transp[2]/255, 1.)
-        src_img = get_frame_image(app, art, art.active_frame, False, scale, f_transp)
+        src_img = get_frame_image(app, art, art.active_frame, False, scale,
+                                  f_transp, layers, renderer)
         if not src_img:
             return False
-        output_img = art.palette.get_palettized_image(src_img, i_transp[:3])
+        output_img = art.palette.get_palettized_image(src_img, i_transp[:3],
+                                                      max_colors=PALETTIZED_MAX_COLORS)
         output_img.save(out_filename, 'PNG', transparency=0)
         output_format = '8-bit palettized w/ transparency'
     #app.log('%s exported (%s)' % (out_filename, output_format))
@@ -147,11 +191,13 @@ def write_thumbnail(app, art_filename, thumb_filename):
     # don't bother if art is None, must be created at runtime eg via Game Mode
     if not art:
         return
+    renderer = get_export_renderer(app)
     renderable = None
-    if len(art.renderables) == 0:
+    # software renderer doesn't need a renderable
+    if renderer == RENDERER_GL and len(art.renderables) == 0:
         renderable = app.thumbnail_renderable_class(app, art)
         art.renderables.append(renderable)
-    img = get_frame_image(app, art, 0, allow_crt=False)
+    img = get_frame_image(app, art, 0, allow_crt=False, renderer=renderer)
     if img:
         img.save(thumb_filename, 'PNG')
     if renderable:
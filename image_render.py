@@ -0,0 +1,161 @@
+"""
+Software (pure NumPy) renderer for Art, used to export images without an
+OpenGL context. Composites layers the same way TileRenderable's shaders do.
+"""
+
+import numpy as np
+from PIL import Image
+
+from palette import MAX_COLORS
+
+# rough cap on # of pixels composited at once, bounds memory use for big art
+BAND_PIXELS = 512 * 512
+
+# {charset image filename: (source image, glyph RGBA array)}
+glyph_cache = {}
+
+# (char width, char height): (glyph Y index, glyph X index) arrays per xform
+xform_maps = {}
+
+def get_glyph_array(charset):
+    """
+    Returns float (num chars, char height, char width, RGBA) array of given
+    charset's glyphs, 0-1 range, sliced from its (alpha processed) image.
+    """
+    cached = glyph_cache.get(charset.image_filename)
+    # charset hot reload replaces image_data, rebuild if it's changed
+    if cached and cached[0] is charset.image_data:
+        return cached[1]
+    img = np.asarray(charset.image_data.convert('RGBA'), dtype=np.float32)
+    cw, ch = charset.char_width, charset.char_height
+    mw, mh = charset.map_width, charset.map_height
+    glyphs = img[:mh * ch, :mw * cw] / 255
+    glyphs = glyphs.reshape(mh, ch, mw, cw, 4).transpose(0, 2, 1, 3, 4)
+    glyphs = np.ascontiguousarray(glyphs.reshape(mw * mh, ch, cw, 4))
+    glyph_cache[charset.image_filename] = charset.image_data, glyphs
+    return glyphs
+
+def get_xform_maps(char_width, char_height):
+    """
+    Returns (glyph Y, glyph X) index arrays of shape (num xforms, char height,
+    char width): for each xform, which glyph pixel each cell pixel samples.
+    """
+    key = (char_width, char_height)
+    if key in xform_maps:
+        return xform_maps[key]
+    # art imports image_export, which imports us; import here to avoid cycle
+    from art import uv_types_array
+    # UV of each cell pixel's center, interpolated from quad corner UVs the
+    # same way the tile vertex shader does: top left, top right, bottom left
+    s = (np.arange(char_width) + 0.5) / char_width
+    t = (np.arange(char_height) + 0.5) / char_height
+    t, s = np.meshgrid(t, s, indexing='ij')
+    uvs = uv_types_array[:, :, np.newaxis, np.newaxis]
+    u = uvs[:, 0] + s * (uvs[:, 2] - uvs[:, 0]) + t * (uvs[:, 4] - uvs[:, 0])
+    v = uvs[:, 1] + s * (uvs[:, 3] - uvs[:, 1]) + t * (uvs[:, 5] - uvs[:, 1])
+    gx = np.clip(np.floor(u * char_width), 0, char_width - 1).astype(int)
+    gy = np.clip(np.floor(v * char_height), 0, char_height - 1).astype(int)
+    xform_maps[key] = gy, gx
+    return gy, gx
+
+def get_palette_array(palette):
+    "Returns float (MAX_COLORS, RGBA) array of palette's colors, 0-1 range."
+    # mirrors palette texture: indices past last color are transparent black
+    colors = np.zeros((MAX_COLORS, 4), dtype=np.float32)
+    colors[:len(palette.colors)] = np.array(palette.colors, dtype=np.float32) / 255
+    return colors
+
+def get_render_layers(art, layers=None, show_hidden=False):
+    """
+    Returns list of layer indices to render: given list or int, else all in
+    back to front (Z) order. As TileRenderable.render does, hidden layers
+    are skipped unless show_hidden is True.
+    """
+    if layers is None:
+        layers = list(range(art.layers))
+        layers.sort(key=lambda i: art.layers_z[i])
+    elif type(layers) is int:
+        layers = [layers]
+    if not show_hidden:
+        layers = [i for i in layers if art.layers_visibility[i]]
+    return layers
+
+def composite_tiles(dest, glyphs, colors, gy, gx, chars, fgs, bgs, xforms,
+                    bg_alpha=1.):
+    """
+    Alpha blends given tile rows (2D arrays of char, fg, bg, xform indices)
+    over float RGBA dest pixels, as TileRenderable's fragment shader would.
+    """
+    h, w = chars.shape
+    ch, cw = gy.shape[1:]
+    # (rows, columns, char height, char width, RGBA) glyph pixels per tile
+    tex = glyphs[chars[:, :, np.newaxis, np.newaxis], gy[xforms], gx[xforms]]
+    fg = colors[fgs][:, :, np.newaxis, np.newaxis]
+    bg = colors[bgs][:, :, np.newaxis, np.newaxis]
+    a = tex[..., 3:]
+    src = np.empty_like(tex)
+    # FG color: glyph pixels tinted FG over BG, alpha mixed same as color
+    src[..., :3] = bg[..., :3] * (1 - a) + tex[..., :3] * fg[..., :3] * a
+    src[..., 3:] = bg[..., 3:] * bg_alpha * (1 - a) + a * a
+    # transparent FG: cut-out effect, glyph pixels become transparent
+    cutout = (fgs == 0)[:, :, np.newaxis, np.newaxis]
+    src[..., :3] = np.where(cutout[..., np.newaxis], bg[..., :3], src[..., :3])
+    src[..., 3] = np.where(cutout, (1 - a[..., 0]) * bg_alpha, src[..., 3])
+    # transparent FG and BG: nothing drawn
+    src[(fgs == 0) & (bgs == 0)] = 0
+    # tiles -> pixels
+    src = src.transpose(0, 2, 1, 3, 4).reshape(h * ch, w * cw, 4)
+    # GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA blend, applied to alpha too
+    sa = src[..., 3:]
+    dest *= 1 - sa
+    dest += src * sa
+    # framebuffer stores 8 bits per channel between layers
+    np.round(dest * 255, out=dest)
+    dest /= 255
+
+def render_frame_array(art, frame, scale=1, bg_color=(0, 0, 0, 0),
+                       layers=None, show_hidden=False):
+    """
+    Returns uint8 (height, width, RGBA) array of given frame of given art.
+    bg_color is a 0-1 float RGBA tuple, None = transparent.
+    layers: list of layer indices to draw (in given order), or None to draw
+    all layers in Z order; either way hidden ones are skipped unless
+    show_hidden is True.
+    """
+    charset, palette = art.charset, art.palette
+    cw, ch = charset.char_width, charset.char_height
+    glyphs = get_glyph_array(charset)
+    colors = get_palette_array(palette)
+    gy, gx = get_xform_maps(cw, ch)
+    layers = get_render_layers(art, layers, show_hidden)
+    img = np.empty((art.height * ch, art.width * cw, 4), dtype=np.float32)
+    img[:] = bg_color or (0, 0, 0, 0)
+    # out of range chars wrap like charset texture lookups would
+    chars = art.chars[frame] % len(glyphs)
+    fgs = art.fg_colors[frame] % MAX_COLORS
+    bgs = art.bg_colors[frame] % MAX_COLORS
+    xforms = art.uv_maps[frame] % len(gy)
+    # composite in bands of rows to keep per-pixel temp arrays small
+    band_rows = max(1, BAND_PIXELS // (art.width * cw * ch))
+    for y0 in range(0, art.height, band_rows):
+        y1 = min(y0 + band_rows, art.height)
+        dest = img[y0 * ch:y1 * ch]
+        for i in layers:
+            composite_tiles(dest, glyphs, colors, gy, gx,
+                            chars[i, y0:y1], fgs[i, y0:y1], bgs[i, y0:y1],
+                            xforms[i, y0:y1])
+    img = np.round(np.clip(img, 0, 1) * 255).astype(np.uint8)
+    if scale != 1:
+        # nearest neighbor scaling, like GL_NEAREST charset sampling
+        h, w = int(img.shape[0] * scale), int(img.shape[1] * scale)
+        ys = (np.arange(h) / scale).astype(int)
+        xs = (np.arange(w) / scale).astype(int)
+        img = img[ys][:, xs]
+    return img
+
+def render_frame_image(art, frame, scale=1, bg_color=(0, 0, 0, 0),
+                       layers=None, show_hidden=False):
+    "Returns PIL image of given frame of given art; see render_frame_array."
+    pixels = render_frame_array(art, frame, scale, bg_color, layers,
+                                show_hidden)
+    return Image.fromarray(pixels, 'RGBA')
@@ -2,6 +2,7 @@
 # from EDSCII
 
 import math
+import numpy as np
 
 def rgb_to_xyz(r, g, b):
     r /= 255.0
@@ -60,3 +61,29 @@ def lab_color_diff(l1, a1, b1, l2, a2, b2):
     da = (a1 - a2)**2
     db = (b1 - b2)**2
     return math.sqrt(dl + da + db)
+
+# array versions of the above, for converting many colors at once
+
+def rgb_to_lab_array(rgb):
+    "converts (..., 3) array of base-255 RGB colors to (..., 3) L*a*b array"
+    rgb = np.asarray(rgb, dtype=np.float64) / 255.0
+    rgb = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055)**2.4, rgb / 12.92) * 100
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    # same operation order as rgb_to_xyz + xyz_to_lab, results match to
+    # within the last bit or so (numpy's ** isn't quite math's pow)
+    # observer: 2deg, illuminant: D65
+    xyz = np.stack([(r * 0.4124 + g * 0.3576 + b * 0.1805) / 95.047,
+                    (r * 0.2126 + g * 0.7152 + b * 0.0722) / 100.0,
+                    (r * 0.0193 + g * 0.1192 + b * 0.9505) / 108.883], axis=-1)
+    xyz = np.where(xyz > 0.008856, xyz**(1.0/3), (7.787 * xyz) + (16.0 / 116))
+    x, y, z = xyz[..., 0], xyz[..., 1], xyz[..., 2]
+    return np.stack([(116 * y) - 16, 500 * (x - y), 200 * (y - z)], axis=-1)
+
+def lab_distance_matrix(labs1, labs2=None):
+    """
+    returns (N, M) array of lab_color_diff between each of (N, 3) and (M, 3)
+    arrays of L*a*b colors. second defaults to first.
+    """
+    labs2 = labs1 if labs2 is None else labs2
+    deltas = labs1[:, np.newaxis] - labs2[np.newaxis, :]
+    return np.sqrt((deltas**2).sum(axis=-1))
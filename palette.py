@@ -1,13 +1,42 @@
 import os.path, math, time
+import numpy as np
 from random import randint
 from PIL import Image
 
 from texture import Texture
-from lab_color import rgb_to_lab, lab_color_diff
+from lab_color import rgb_to_lab_array, lab_distance_matrix
 
 PALETTE_DIR = 'palettes/'
 PALETTE_EXTENSIONS = ['png', 'gif', 'bmp']
 MAX_COLORS = 1024
+# bits of each RGB channel used to index closest color lookup table,
+# ie table has (2 ** LOOKUP_BITS) ** 3 bins
+LOOKUP_BITS = 5
+# # of query colors compared against their candidates at once
+LOOKUP_CHUNK_SIZE = 2 ** 16
+
+def get_lookup_bins():
+    """
+    returns (bins, 3) array of L*a*b centers of closest color lookup table's
+    RGB bins, and (bins) array of their radii: farthest of each bin's corners
+    from its center.
+    corners are one step past bin's last RGB value, so radii bound every
+    color in it (checked for every color by tests, L*a*b being nonlinear).
+    """
+    size = 2 ** LOOKUP_BITS
+    step = 256 / size
+    # L*a*b of each bin's corners and center
+    corners = rgb_to_lab_array(np.stack(np.meshgrid(*[np.arange(size + 1) * step] * 3,
+                                                    indexing='ij'), axis=-1))
+    centers = rgb_to_lab_array(np.stack(np.meshgrid(*[(np.arange(size) + 0.5) * step] * 3,
+                                                    indexing='ij'), axis=-1))
+    radii = np.zeros((size, size, size))
+    for dr in (0, 1):
+        for dg in (0, 1):
+            for db in (0, 1):
+                corner = corners[dr:dr + size, dg:dg + size, db:db + size]
+                radii = np.maximum(radii, np.sqrt(((corner - centers)**2).sum(axis=-1)))
+    return centers.reshape(-1, 3), radii.ravel()
 
 class PaletteLord:
     
@@ -27,7 +56,8 @@ class PaletteLord:
             if palette.has_updated():
                 changed = palette.filename
                 try:
-                    palette.load_image()
+                    if not palette.load_image():
+                        raise Exception
                     self.app.log('PaletteLord: success reloading %s' % palette.filename)
                 except:
                     self.app.log('PaletteLord: failed reloading %s' % palette.filename, True)
@@ -35,6 +65,15 @@ class PaletteLord:
 
 class Palette:
     
+    # copy of colors list the Lab tables below were built from, they're
+    # rebuilt when it changes, eg on hot reload or GIF export's BG color
+    lab_colors_source = None
+    lab_colors = None
+    lab_distances = None
+    # (bins, max candidates) array of color indices that could be closest
+    # to a color in each RGB bin, padded with -1
+    lookup_candidates = None
+    
     def __init__(self, app, src_filename, log):
         self.init_success = False
         self.app = app
@@ -46,7 +85,8 @@ class Palette:
         self.last_image_change = os.path.getmtime(self.filename)
         self.name = os.path.basename(self.filename)
         self.name = os.path.splitext(self.name)[0]
-        self.load_image()
+        if not self.load_image():
+            return
         self.base_filename = os.path.splitext(os.path.basename(self.filename))[0]
         if log and not self.app.game_mode:
             self.app.log("loaded palette '%s' from %s:" % (self.name, self.filename))
@@ -56,44 +96,51 @@ class Palette:
         self.init_success = True
     
     def load_image(self):
-        "loads palette data from the given bitmap image"
+        """
+        loads palette data from the given bitmap image, returns False if it
+        has too many colors
+        """
         src_img = Image.open(self.filename)
         src_img = src_img.convert('RGBA')
         width, height = src_img.size
-        # store texture for chooser preview etc
-        self.src_texture = Texture(src_img.tobytes(), width, height)
-        # scan image L->R T->B for unique colors, store em as tuples
+        # unique colors in image L->R T->B order, ie sorted by first index
+        pixels = np.asarray(src_img).reshape(-1, 4)
+        packed = np.ascontiguousarray(pixels).view(np.uint32).ravel()
+        packed, first_indices = np.unique(packed, return_index=True)
+        unique_colors = pixels[np.sort(first_indices)]
         # color 0 is always fully transparent
-        self.colors = [(0, 0, 0, 0)]
+        colors = [(0, 0, 0, 0)]
+        colors += [tuple(int(c) for c in color) for color in unique_colors if tuple(color) != (0, 0, 0, 0)]
+        if len(colors) > MAX_COLORS:
+            self.app.log("Palette image %s has %s unique colors, more than the maximum of %s" % (self.filename, len(colors) - 1, MAX_COLORS - 1), True)
+            return False
+        self.colors = colors
+        # store texture for chooser preview etc
+        # (headless apps, eg batch conversion, have no GL context for textures)
+        if not self.app.headless:
+            self.src_texture = Texture(src_img.tobytes(), width, height)
         # determine lightest and darkest colors in palette for defaults
         lightest = 0
         darkest = 255 * 3 + 1
         self.lightest_index, self.darkest_index = 0, 0
-        for y in range(height):
-            for x in range(width):
-                # bail if we've now read max colors
-                if len(self.colors) >= MAX_COLORS:
-                    break
-                color = src_img.getpixel((x, y))
-                if not color in self.colors:
-                    self.colors.append(color)
-                    # is this lightest/darkest unique color so far? save index
-                    luminosity = color[0]*0.21 + color[1]*0.72 + color[2]*0.07
-                    if luminosity < darkest:
-                        darkest = luminosity
-                        self.darkest_index = len(self.colors) - 1
-                    elif luminosity > lightest:
-                        lightest = luminosity
-                        self.lightest_index = len(self.colors) - 1
+        for i,color in enumerate(self.colors[1:]):
+            # is this lightest/darkest unique color so far? save index
+            luminosity = color[0]*0.21 + color[1]*0.72 + color[2]*0.07
+            if luminosity < darkest:
+                darkest = luminosity
+                self.darkest_index = i + 1
+            elif luminosity > lightest:
+                lightest = luminosity
+                self.lightest_index = i + 1
         # create new 1D image with unique colors
-        img = Image.new('RGBA', (MAX_COLORS, 1), (0, 0, 0, 0))
-        x = 0
-        for color in self.colors:
-            img.putpixel((x, 0), color)
-            x += 1
+        img = np.zeros((1, MAX_COLORS, 4), dtype=np.uint8)
+        img[0, :len(self.colors)] = self.colors
+        img = Image.fromarray(img)
         # debug: save out generated palette texture
         #img.save('palette.png')
-        self.texture = Texture(img.tobytes(), MAX_COLORS, 1)
+        if not self.app.headless:
+            self.texture = Texture(img.tobytes(), MAX_COLORS, 1)
+        return True
     
     def has_updated(self):
         "return True if source image file has changed since last check"
@@ -146,11 +193,24 @@ class Palette:
         return r, g, b, a
     
     def get_palettized_image(self, src_img, transparent_color=(0, 0, 0),
-                             force_no_transparency=False):
-        "returns a copy of source image quantized to this palette"
-        pal_img = Image.new('P', (1, 1))
+                             force_no_transparency=False, max_colors=MAX_COLORS):
+        """
+        returns a copy of source image quantized to this palette.
+        P (8-bit) images only have room for 256 colors, so if this palette
+        and given max_colors are larger, returns an undithered I (32-bit)
+        image of color indices.
+        """
         # source must be in RGB (no alpha) format
         out_img = src_img.convert('RGB')
+        if len(self.colors) > 256 and max_colors > 256:
+            pixels = np.asarray(out_img)
+            indices = self.get_closest_color_indices(pixels.reshape(-1, 3))
+            indices = indices.reshape(pixels.shape[:2]).astype(np.int32)
+            # user-defined color 0 in case we want to do 8-bit transparency
+            if not force_no_transparency:
+                indices[(pixels == transparent_color).all(axis=-1)] = 0
+            return Image.fromarray(indices)
+        pal_img = Image.new('P', (1, 1))
         # Image.putpalette needs a flat tuple :/
         colors = []
         for i,color in enumerate(self.colors):
@@ -182,19 +242,76 @@ class Palette:
         b_diff = abs(color_a[2] - color_b[2])
         return (r_diff + g_diff + b_diff) <= tolerance
     
+    def get_lab_colors(self):
+        "returns (colors, 3) array of this palette's colors in L*a*b space"
+        if self.lab_colors_source != self.colors:
+            self.lab_colors = rgb_to_lab_array([color[:3] for color in self.colors])
+            self.lab_distances = None
+            self.lookup_candidates = None
+            self.lab_colors_source = list(self.colors)
+        return self.lab_colors
+    
+    def get_lab_distances(self):
+        "returns (colors, colors) array of L*a*b distances between all colors"
+        lab_colors = self.get_lab_colors()
+        if self.lab_distances is None:
+            self.lab_distances = lab_distance_matrix(lab_colors)
+        return self.lab_distances
+    
+    def get_lookup_candidates(self):
+        """
+        returns table of closest color candidates for each RGB bin, see
+        lookup_candidates. built on first use.
+        """
+        lab_colors = self.get_lab_colors()
+        if self.lookup_candidates is not None:
+            return self.lookup_candidates
+        centers, radii = get_lookup_bins()
+        # a color can only be closest to something in a bin if it's within
+        # 2 radii of the distance from bin center to the color closest to it
+        candidate_lists = []
+        for i in range(0, len(centers), LOOKUP_CHUNK_SIZE // 4):
+            j = i + LOOKUP_CHUNK_SIZE // 4
+            distances = lab_distance_matrix(centers[i:j], lab_colors)
+            limits = distances.min(axis=1) + 2 * radii[i:j]
+            candidate_lists += [np.nonzero(d <= limit)[0] for d, limit in zip(distances, limits)]
+        most = max(len(c) for c in candidate_lists)
+        self.lookup_candidates = np.full((len(candidate_lists), most), -1, dtype=np.int16)
+        for i, candidates in enumerate(candidate_lists):
+            self.lookup_candidates[i, :len(candidates)] = candidates
+        return self.lookup_candidates
+    
+    def get_closest_color_indices(self, colors):
+        """
+        returns array of indices of closest colors in this palette to given
+        (N, 3) array of base-255 RGB colors
+        """
+        colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+        lab_colors = self.get_lab_colors()
+        lookup = self.get_lookup_candidates()
+        # only look up each distinct color once
+        packed = (colors[:, 0].astype(np.uint32) << 16) | (colors[:, 1].astype(np.uint32) << 8) | colors[:, 2]
+        packed, inverse = np.unique(packed, return_inverse=True)
+        unique_colors = np.stack([packed >> 16, (packed >> 8) & 255, packed & 255], axis=-1)
+        shift = 8 - LOOKUP_BITS
+        bins = unique_colors >> shift
+        bins = (bins[:, 0] << (LOOKUP_BITS * 2)) | (bins[:, 1] << LOOKUP_BITS) | bins[:, 2]
+        indices = np.zeros(len(unique_colors), dtype=np.int16)
+        # refine: exact distance to each of bin's candidates
+        for i in range(0, len(unique_colors), LOOKUP_CHUNK_SIZE):
+            j = i + LOOKUP_CHUNK_SIZE
+            candidates = lookup[bins[i:j]]
+            labs = rgb_to_lab_array(unique_colors[i:j])
+            distances = ((lab_colors[candidates] - labs[:, np.newaxis])**2).sum(axis=-1)
+            distances[candidates < 0] = np.inf
+            # candidates are in index order, so ties go to lowest index
+            best = np.argmin(distances, axis=1)
+            indices[i:j] = candidates[np.arange(len(best)), best]
+        return indices[inverse.ravel()]
+    
     def get_closest_color_index(self, r, g, b):
-        "returns index of closest color in this palette to given color (kinda slow?)"
-        closest_diff = 99999999999
-        closest_diff_index = -1
-        for i,color in enumerate(self.colors):
-            l1, a1, b1 = rgb_to_lab(r, g, b)
-            l2, a2, b2 = rgb_to_lab(*color[:3])
-            diff = lab_color_diff(l1, a1, b1, l2, a2, b2)
-            if diff < closest_diff:
-                closest_diff = diff
-                closest_diff_index = i
-        #print('%s is closest to input color %s' % (self.colors[closest_diff_index], (r, g, b)))
-        return closest_diff_index
+        "returns index of closest color in this palette to given color"
+        return int(self.get_closest_color_indices([(r, g, b)])[0])
     
     def get_random_color_index(self):
         # exclude transparent first index
@@ -235,7 +352,8 @@ class PaletteFromList(Palette):
         for color in self.colors:
             img.putpixel((x, 0), color)
             x += 1
-        self.texture = Texture(img.tobytes(), MAX_COLORS, 1)
+        if not self.app.headless:
+            self.texture = Texture(img.tobytes(), MAX_COLORS, 1)
         if log and not self.app.game_mode:
             self.app.log("generated new palette '%s'" % (self.name))
             self.app.log('  unique colors: %s' % int(len(self.colors)-1))
@@ -0,0 +1,170 @@
+from itertools import chain
+from operator import attrgetter
+
+import numpy as np
+
+import game_object
+
+
+class PhysicsArrays:
+    """
+    Opt-in physics backend owned by GameWorld: gathers movement state for all
+    objects with default physics into numpy arrays and integrates them in one
+    vectorized step at the start of each world update, reproducing
+    GameObject.apply_move exactly. Enabled by GameWorld.vectorized_physics.
+    Objects with update timers are left to their own apply_move.
+    Because we step before any object updates, an object's update that reads
+    an object later in the update order sees it already moved. If it changes
+    that object's move_x/y or sets its location or velocity outright, has_moved
+    undoes our step so apply_move runs on the new state as usual; changes
+    relative to current values, eg other.vel_x += 1, land on top of our step.
+    Games whose objects push each other like that should leave the pushed
+    classes' allow_vectorized_physics False.
+    """
+    physics_methods = ['update', 'apply_move', 'get_acceleration',
+                       'get_friction', 'is_on_ground',
+                       'is_affected_by_gravity']
+    """
+    GameObject methods our step stands in for; classes that override any of
+    them run their own apply_move instead.
+    """
+    accel_threshold = 0.01
+    "Acceleration below this is zeroed, same as GameObject.get_acceleration"
+    get_state = attrgetter('x', 'y', 'z', 'vel_x', 'vel_y', 'vel_z',
+                           'move_x', 'move_y')
+    get_params = attrgetter('move_accel_x', 'move_accel_y', 'ground_friction',
+                            'mass', 'stop_velocity')
+    def __init__(self, world):
+        self.world = world
+        self.class_eligible = {}
+        "Cache of whether each GameObject class can be integrated by us"
+        self.reset()
+    
+    def reset(self):
+        self.moved_objects = {}
+        """
+        Objects whose movement we integrated this update, with their movement
+        state (see get_state) before and after our step
+        """
+        self.objects = []
+        "Objects in most recent step, by array row"
+        self.params = []
+        "Objects' physics parameters in most recent step, to reuse arrays"
+        self.positions = np.zeros((0, 3))
+        self.velocities = np.zeros((0, 3))
+        self.accelerations = np.zeros((0, 3))
+        "Acceleration at end of each object's most recent step"
+        self.move = np.zeros((0, 2))
+        "User-intended acceleration, ie GameObject.move_x/y"
+        self.move_accel = np.zeros((0, 2))
+        self.friction = np.zeros(0)
+        self.mass = np.zeros(0)
+        self.stop_velocity = np.zeros(0)
+    
+    def can_integrate_class(self, obj_class):
+        "Return True if given GameObject class moves only by default physics."
+        if obj_class in self.class_eligible:
+            return self.class_eligible[obj_class]
+        base = game_object.GameObject
+        eligible = obj_class.allow_vectorized_physics and \
+            all(getattr(obj_class, name) is getattr(base, name)
+                for name in self.physics_methods)
+        self.class_eligible[obj_class] = eligible
+        return eligible
+    
+    def _update_params(self, objects):
+        # parameters rarely change, only rebuild their arrays if they do
+        params = list(map(self.get_params, objects))
+        if params == self.params:
+            return
+        self.params = params
+        params = np.array(params, dtype=float).reshape(-1, 5)
+        self.move_accel = params[:, 0:2]
+        self.friction, self.mass = params[:, 2], params[:, 3]
+        self.stop_velocity = params[:, 4]
+    
+    def get_acceleration(self, vel, move, move_accel, friction, mass):
+        """
+        Return accelerations for given rows of velocities etc, same as
+        GameObject.get_acceleration for objects unaffected by gravity.
+        """
+        force = np.zeros(vel.shape)
+        force[:, :2] = move * move_accel
+        # friction / drag
+        force -= (friction * mass)[:, np.newaxis] * vel
+        accel = force / mass[:, np.newaxis]
+        # zero out acceleration beneath a threshold
+        return np.where(np.abs(accel) > self.accel_threshold, accel, 0)
+    
+    def update(self):
+        """
+        Integrate movement of all eligible objects, as each one's
+        GameObject.update would with apply_move.
+        """
+        self.moved_objects.clear()
+        world = self.world
+        if not world.vectorized_physics:
+            return
+        objects = []
+        class_eligible = self.class_eligible
+        for obj in world.objects.values():
+            # skip objects that move themselves, or aren't updated
+            obj_class = type(obj)
+            if not obj_class in class_eligible:
+                self.can_integrate_class(obj_class)
+            if not class_eligible[obj_class] or not obj.physics_move or \
+               obj.timer_functions_update or \
+               not (obj.is_in_current_room() or obj.update_if_outside_room):
+                continue
+            # wake if we were moved or given a velocity while asleep
+            if obj.sleeping and obj.get_sleep_state() != obj.sleep_state:
+                obj.wake()
+            # don't apply physics to sleeping objects or ones being dragged
+            if not obj.sleeping and not obj.name in world.drag_objects:
+                objects.append(obj)
+        self.objects = objects
+        if len(objects) == 0:
+            return
+        states_before = list(map(self.get_state, objects))
+        state = np.fromiter(chain.from_iterable(states_before),
+                            dtype=float, count=len(objects) * 8).reshape(-1, 8)
+        self.positions, self.velocities = state[:, 0:3], state[:, 3:6]
+        self.move = state[:, 6:8]
+        self._update_params(objects)
+        # same Verlet integration with half-step velocity as apply_move
+        timestep = world.app.timestep / 1000
+        accel = self.get_acceleration(self.velocities, self.move,
+                                      self.move_accel, self.friction, self.mass)
+        hsvel = self.velocities + 0.5 * timestep * accel
+        self.positions += hsvel * timestep
+        accel = self.get_acceleration(hsvel, self.move, self.move_accel,
+                                      self.friction, self.mass)
+        vel = hsvel + 0.5 * timestep * accel
+        stop_velocity = self.stop_velocity[:, np.newaxis]
+        self.velocities[:] = np.where(np.abs(vel) > stop_velocity, vel, 0)
+        self.accelerations = accel
+        # write results back to objects
+        for obj, before, (x, y, z), (vel_x, vel_y, vel_z) in zip(objects, states_before,
+                                                                  self.positions.tolist(),
+                                                                  self.velocities.tolist()):
+            obj.x, obj.y, obj.z = x, y, z
+            obj.vel_x, obj.vel_y, obj.vel_z = vel_x, vel_y, vel_z
+            self.moved_objects[obj] = before, (x, y, z, vel_x, vel_y, vel_z) + before[6:]
+    
+    def has_moved(self, obj):
+        """
+        Return True if we integrated given object's movement this update.
+        If its movement state has changed since our step, eg an earlier
+        object's update set its location or move_x, undo our step (keeping
+        the changed values) and return False so its apply_move runs instead.
+        """
+        if not obj in self.moved_objects:
+            return False
+        before, after = self.moved_objects.pop(obj)
+        now = self.get_state(obj)
+        if now == after:
+            return True
+        # values that changed since our step were set by something else
+        state = [b if n == a else n for b, a, n in zip(before, after, now)]
+        obj.x, obj.y, obj.z, obj.vel_x, obj.vel_y, obj.vel_z = state[:6]
+        return False
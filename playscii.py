@@ -20,7 +20,7 @@ if platform.system() == 'Darwin' and hasattr(sys, 'frozen'):
     os.chdir(os.path.abspath(os.path.dirname(sys.executable)))
 
 # app imports
-import ctypes, time, hashlib, importlib, traceback
+import ctypes, time, hashlib, importlib, traceback, multiprocessing
 import webbrowser
 import sdl2
 import sdl2.ext
@@ -116,12 +116,17 @@ class Application:
     show_dev_log = False
     # in art mode, show layers marked invisible to game mode
     show_hidden_layers = False
+    # image export (PNG, GIF, thumbnails) backend: 'gl' for the OpenGL
+    # renderer (supports CRT filter), 'software' for the NumPy renderer
+    export_renderer = 'gl'
     welcome_message = 'Welcome to Playscii! Press SPACE to select characters and colors to paint.'
     compat_fail_message = "your hardware doesn't appear to meet Playscii's requirements!  Sorry ;________;"
     game_mode_message = 'Game Mode active, press %s to return to Art Mode.'
     img_convert_message = 'converting bitmap image: %s'
     # can_edit: if False, user can't use art or edit functionality
     can_edit = True
+    # True for apps with no window or GL context, see headless.HeadlessApp
+    headless = False
     # these values should be written to cfg files on exit
     # key = module path, value = [member object (blank if self), var name]
     persistent_setting_names = {
@@ -1100,6 +1105,8 @@ class Logger:
 
 
 if __name__ == "__main__":
+    # image conversion processes re-run frozen (pyinstaller) executables
+    multiprocessing.freeze_support()
     # get paths for config file, later to be passed into Application
     config_dir, documents_dir, cache_dir = get_paths()
     # start logger even before Application has initialized so we can write to it
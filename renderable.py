@@ -1,7 +1,7 @@
 import os, math, ctypes
 import numpy as np
 from OpenGL import GL
-from art import VERT_LENGTH
+from art import VERT_LENGTH, UV_STRIDE, TILE_DTYPE, uv_types_array
 from palette import MAX_COLORS
 
 # inactive layer alphas
@@ -31,6 +31,11 @@ class TileRenderable:
     default_move_rate = 1
     use_art_offset = True
     "Use game object's art_off_pct values."
+    partial_update_max_fraction = 0.5
+    """
+    If more than this fraction of an Art's tile rows changed, upload entire
+    frame rather than only the changed rows.
+    """
     
     def __init__(self, app, art, game_object=None):
         "Create Renderable with given Art, optionally bound to given GameObject"
@@ -86,6 +91,8 @@ class TileRenderable:
         self.alpha_uniform = self.shader.get_uniform_location('alpha')
         self.brightness_uniform = self.shader.get_uniform_location('brightness')
         self.bg_alpha_uniform = self.shader.get_uniform_location('bgColorAlpha')
+        # size in bytes of each buffer's data as last uploaded in full
+        self.buffer_sizes = {}
         self.create_buffers()
         # finish
         if self.app.use_vao:
@@ -113,39 +120,95 @@ class TileRenderable:
         # use GL_DYNAMIC_DRAW given they change every time a char/color changes
         self.char_buffer, self.uv_buffer = GL.glGenBuffers(2)
         # character indices (which become vertex UVs)
-        self.update_buffer(self.char_buffer, self.art.chars[self.frame],
-                           GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_FLOAT, 'charIndex', 1)
+        self.update_buffer(self.char_buffer, self.get_vertex_data(self.art.chars),
+                           GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_UNSIGNED_SHORT, 'charIndex', 1)
         # UV "mods" - modify UV derived from character index
-        self.update_buffer(self.uv_buffer, self.art.uv_mods[self.frame],
+        self.update_buffer(self.uv_buffer, self.get_uv_data(),
                            GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_FLOAT, 'uvMod', 2)
         self.fg_buffer, self.bg_buffer = GL.glGenBuffers(2)
         # foreground/background color indices (which become rgba colors)
-        self.update_buffer(self.fg_buffer, self.art.fg_colors[self.frame],
-                           GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_FLOAT, 'fgColorIndex', 1)
-        self.update_buffer(self.bg_buffer, self.art.bg_colors[self.frame],
-                           GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_FLOAT, 'bgColorIndex', 1)
-    
-    def update_geo_buffers(self):
-        self.update_buffer(self.vert_buffer, self.art.vert_array, GL.GL_ARRAY_BUFFER, GL.GL_STATIC_DRAW, GL.GL_FLOAT, None, None)
-        self.update_buffer(self.elem_buffer, self.art.elem_array, GL.GL_ELEMENT_ARRAY_BUFFER, GL.GL_STATIC_DRAW, GL.GL_UNSIGNED_INT, None, None)
-        # total vertex count probably changed
-        self.vert_count = int(len(self.art.elem_array))
+        self.update_buffer(self.fg_buffer, self.get_vertex_data(self.art.fg_colors),
+                           GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_UNSIGNED_SHORT, 'fgColorIndex', 1)
+        self.update_buffer(self.bg_buffer, self.get_vertex_data(self.art.bg_colors),
+                           GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_UNSIGNED_SHORT, 'bgColorIndex', 1)
+    
+    def get_vertex_data(self, frame_arrays, rows=None):
+        """
+        Return given per-frame list of Art tile arrays' data for our current
+        frame, with each tile's value repeated for all 4 verts of its quad.
+        If given a (first, last) range of tile rows, only return those rows.
+        """
+        data = frame_arrays[self.frame]
+        if rows:
+            # rows count down through all layers
+            data = data.reshape(-1, data.shape[-1])[rows[0]:rows[1]+1]
+        return np.repeat(data, 4, axis=-1)
+    
+    def get_uv_data(self, rows=None):
+        "Return UV mods for all 4 verts of each tile in our current frame."
+        data = self.art.uv_maps[self.frame]
+        if rows:
+            data = data.reshape(-1, data.shape[-1])[rows[0]:rows[1]+1]
+        return uv_types_array[data]
+    
+    def get_tile_buffer_nbytes(self):
+        "Return # of bytes per tile in our char/color buffers and UV buffer."
+        return 4 * np.dtype(TILE_DTYPE).itemsize, UV_STRIDE * uv_types_array.itemsize
+    
+    def are_tile_buffers_current_size(self):
+        "Return True if all tile buffers are sized for our Art's current size."
+        tiles = self.art.layers * self.art.height * self.art.width
+        tile_nbytes, uv_nbytes = self.get_tile_buffer_nbytes()
+        for buffer_index in [self.char_buffer, self.fg_buffer, self.bg_buffer]:
+            if self.buffer_sizes.get(buffer_index) != tiles * tile_nbytes:
+                return False
+        return self.buffer_sizes.get(self.uv_buffer) == tiles * uv_nbytes
     
-    def update_tile_buffers(self, update_chars, update_uvs, update_fg, update_bg):
-        "Update GL data arrays for tile characters, fg/bg colors, transforms."
+    def update_tile_buffers(self, update_chars, update_uvs, update_fg, update_bg,
+                            rows=None):
+        """
+        Update GL data arrays for tile characters, fg/bg colors, transforms.
+        If given a (first, last) range of changed tile rows, upload only those
+        unless too many changed or buffers need resizing.
+        """
+        if rows:
+            row_count = rows[1] - rows[0] + 1
+            total_rows = self.art.layers * self.art.height
+            if row_count > total_rows * self.partial_update_max_fraction or \
+               not self.are_tile_buffers_current_size():
+                rows = None
+        tile_nbytes, uv_nbytes = self.get_tile_buffer_nbytes()
         updates = {}
         if update_chars:
-            updates[self.char_buffer] = self.art.chars
-        if update_uvs:
-            updates[self.uv_buffer] = self.art.uv_mods
+            updates[self.char_buffer] = self.get_vertex_data(self.art.chars, rows)
         if update_fg:
-            updates[self.fg_buffer] = self.art.fg_colors
+            updates[self.fg_buffer] = self.get_vertex_data(self.art.fg_colors, rows)
         if update_bg:
-            updates[self.bg_buffer] = self.art.bg_colors
+            updates[self.bg_buffer] = self.get_vertex_data(self.art.bg_colors, rows)
         for update in updates:
-            self.update_buffer(update, updates[update][self.frame],
+            if rows:
+                offset = self.art.get_dirty_byte_range(self.frame, tile_nbytes)[0]
+                self.update_buffer_range(update, updates[update], offset)
+                continue
+            self.update_buffer(update, updates[update],
                                GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW,
-                               GL.GL_FLOAT, None, None)
+                               GL.GL_UNSIGNED_SHORT, None, None)
+        if update_uvs:
+            if rows:
+                offset = self.art.get_dirty_byte_range(self.frame, uv_nbytes)[0]
+                self.update_buffer_range(self.uv_buffer, self.get_uv_data(rows), offset)
+            else:
+                self.update_buffer(self.uv_buffer, self.get_uv_data(),
+                                   GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW,
+                                   GL.GL_FLOAT, None, None)
+    
+    def update_buffer_range(self, buffer_index, array, offset):
+        "Upload given array into given array buffer, starting at given byte."
+        if self.log_buffer_updates:
+            self.app.log('update_buffer_range: %s, %s bytes at %s' % (buffer_index, array.nbytes, offset))
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, buffer_index)
+        GL.glBufferSubData(GL.GL_ARRAY_BUFFER, offset, array.nbytes, array)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
     
     def update_buffer(self, buffer_index, array, target, buffer_type, data_type,
                       attrib_name, attrib_size):
@@ -153,6 +216,7 @@ class TileRenderable:
             self.app.log('update_buffer: %s, %s, %s, %s, %s, %s, %s' % (buffer_index, array, target, buffer_type, data_type, attrib_name, attrib_size))
         GL.glBindBuffer(target, buffer_index)
         GL.glBufferData(target, array.nbytes, array, buffer_type)
+        self.buffer_sizes[buffer_index] = array.nbytes
         if attrib_name:
             attrib = self.shader.get_attrib_location(attrib_name)
             GL.glEnableVertexAttribArray(attrib)
@@ -330,7 +394,7 @@ class TileRenderable:
         y = 2 / (self.art.height * self.art.quad_height)
         return (x, y, 1)
     
-    def render_frame_for_export(self, frame):
+    def render_frame_for_export(self, frame, layers=None):
         self.exporting = True
         self.set_frame(frame)
         # cache "inactive layer visibility", restore after render
@@ -341,7 +405,7 @@ class TileRenderable:
             edit.undo()
         # update art to commit changes to the renderable
         self.art.update()
-        self.render()
+        self.render(layers)
         self.art.app.inactive_layer_visibility = ilv
         self.exporting = False
     
@@ -396,7 +460,7 @@ class TileRenderable:
             GL.glEnableVertexAttribArray(attrib('vertPosition'))
             # chars
             GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.char_buffer)
-            GL.glVertexAttribPointer(attrib('charIndex'), 1, GL.GL_FLOAT, GL.GL_FALSE, 0, vp)
+            GL.glVertexAttribPointer(attrib('charIndex'), 1, GL.GL_UNSIGNED_SHORT, GL.GL_FALSE, 0, vp)
             GL.glEnableVertexAttribArray(attrib('charIndex'))
             # uvs
             GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.uv_buffer)
@@ -404,11 +468,11 @@ class TileRenderable:
             GL.glEnableVertexAttribArray(attrib('uvMod'))
             # fg colors
             GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.fg_buffer)
-            GL.glVertexAttribPointer(attrib('fgColorIndex'), 1, GL.GL_FLOAT, GL.GL_FALSE, 0, vp)
+            GL.glVertexAttribPointer(attrib('fgColorIndex'), 1, GL.GL_UNSIGNED_SHORT, GL.GL_FALSE, 0, vp)
             GL.glEnableVertexAttribArray(attrib('fgColorIndex'))
             # bg colors
             GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.bg_buffer)
-            GL.glVertexAttribPointer(attrib('bgColorIndex'), 1, GL.GL_FLOAT, GL.GL_FALSE, 0, vp)
+            GL.glVertexAttribPointer(attrib('bgColorIndex'), 1, GL.GL_UNSIGNED_SHORT, GL.GL_FALSE, 0, vp)
             GL.glEnableVertexAttribArray(attrib('bgColorIndex'))
         # finally, bind element buffer
         GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.elem_buffer)
@@ -0,0 +1,73 @@
+"""
+Benchmark spawning 500 ArtInstances of one art, sharing its tile data,
+against the per-instance deep copy restore_from_source used to make.
+Run directly: python tests/bench_art_instance.py
+"""
+
+import time
+
+import conftest
+from art import ArtInstance
+from headless import HeadlessApp
+
+INSTANCES = 500
+
+
+def deep_copy_restore_from_source(self):
+    "restore_from_source before sharing: a private copy of every frame"
+    for prop in ['app', 'width', 'height', 'charset', 'palette',
+                 'quad_width', 'quad_height', 'layers', 'frames']:
+        setattr(self, prop, getattr(self.source, prop))
+    self.layers_z = self.source.layers_z[:]
+    self.layers_visibility = self.source.layers_visibility[:]
+    self.layer_names = self.source.layer_names[:]
+    self.frame_delays = self.source.frame_delays[:]
+    self.chars = [a.copy() for a in self.source.chars]
+    self.uv_maps = [a.copy() for a in self.source.uv_maps]
+    self.fg_colors = [a.copy() for a in self.source.fg_colors]
+    self.bg_colors = [a.copy() for a in self.source.bg_colors]
+    self.geo_changed = True
+    self.mark_all_frames_changed()
+    self.update()
+
+def get_private_bytes(instances, source):
+    "bytes of tile data held by instances that isn't a view of source's"
+    total = 0
+    for instance in instances:
+        for array_list in [instance.chars, instance.fg_colors,
+                           instance.bg_colors, instance.uv_maps]:
+            for array in array_list:
+                if array.base is None:
+                    total += array.nbytes
+    return total
+
+def spawn(source):
+    source.instances = []
+    start_time = time.perf_counter()
+    instances = [ArtInstance(source) for i in range(INSTANCES)]
+    return time.perf_counter() - start_time, instances
+
+def main():
+    app = HeadlessApp()
+    for width, height, frames in [(40, 25, 1), (200, 100, 1), (80, 50, 8)]:
+        source = app.new_art('bench_instance', width, height)
+        while source.frames < frames:
+            source.add_frame_to_end(log=False)
+        source.update()
+        shared_time, shared = spawn(source)
+        shared_bytes = get_private_bytes(shared, source)
+        ArtInstance.restore_from_source, original = \
+            deep_copy_restore_from_source, ArtInstance.restore_from_source
+        try:
+            copied_time, copied = spawn(source)
+        finally:
+            ArtInstance.restore_from_source = original
+        copied_bytes = get_private_bytes(copied, source)
+        print('%d instances of %dx%d, %d frame(s):' % (INSTANCES, width, height, frames))
+        print('  deep copy %7.1f ms, %9d bytes private tile data' % (
+            copied_time * 1000, copied_bytes))
+        print('  shared    %7.1f ms, %9d bytes private tile data (%.1fx)' % (
+            shared_time * 1000, shared_bytes, copied_time / shared_time))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark loading a large version 1 (JSON) art: ArtFromDisk's vectorized
+tile data against the per-tile loop it replaced, checking both agree, and
+the same art saved in version 2 (binary) format.
+Run directly: python tests/bench_art_load.py
+"""
+
+import os, tempfile, time
+
+import conftest
+from art import ArtFromDisk, read_art_file
+from headless import HeadlessApp
+from test_art import get_tiles, loop_frame_tile_data, write_json_art
+
+
+def time_call(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start_time, result
+
+def main():
+    app = HeadlessApp()
+    for width, height, layers, frames in [(120, 80, 3, 4), (500, 300, 5, 10)]:
+        with tempfile.TemporaryDirectory() as dirname:
+            json_filename = write_json_art(os.path.join(dirname, 'v1.psci'),
+                                           width, height, layers, frames)
+            parse_time, d = time_call(read_art_file, json_filename)
+            del d
+            load_time, art = time_call(ArtFromDisk, json_filename, app)
+            assert art.valid
+            loaded_frames = art.loaded_data['frames']
+            vector_time, vector_tiles = time_call(
+                lambda: [art.get_loaded_frame_tile_data(f) for f in loaded_frames])
+            loop_time, loop_tiles = time_call(
+                lambda: [loop_frame_tile_data(width, height, layers, f)
+                         for f in loaded_frames])
+            for vector_frame, loop_frame in zip(vector_tiles, loop_tiles):
+                for a, b in zip(vector_frame, loop_frame):
+                    assert (a == b).all()
+            del loaded_frames, vector_tiles, loop_tiles, art.loaded_data
+            art.set_filename(os.path.join(dirname, 'v2.psci'))
+            art.save_to_file()
+            binary_time, binary_art = time_call(ArtFromDisk, art.filename, app)
+            for frame in range(frames):
+                for a, b in zip(get_tiles(art, frame), get_tiles(binary_art, frame)):
+                    assert (a == b).all()
+            print('%dx%d, %d layers, %d frames:' % (width, height, layers, frames))
+            print('  v1 JSON load %.2fs, of which parsing %.2fs' % (load_time, parse_time))
+            print('  tile data: per-tile loop %.2fs, vectorized %.2fs (%.1fx), identical' % (
+                loop_time, vector_time, loop_time / vector_time))
+            print('  v2 binary load %.3fs' % binary_time)
+            del art, binary_art
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""
+Benchmark CollisionLord.update with and without its spatial hash, for crowds
+of circles and boxes in a walled room.
+Run directly: python tests/bench_collision.py
+"""
+
+import time
+
+import conftest
+from test_collision import build_world, get_state, run_world
+
+
+def time_world(world, ticks):
+    start_time = time.perf_counter()
+    run_world(world, ticks)
+    return (time.perf_counter() - start_time) / ticks
+
+def main():
+    for num_objects, ticks in [(100, 60), (500, 10), (2000, 2)]:
+        hashed = build_world(num_objects)
+        brute_force = build_world(num_objects, use_spatial_hash=False)
+        hashed_time = time_world(hashed, ticks)
+        brute_force_time = time_world(brute_force, ticks)
+        same = get_state(hashed) == get_state(brute_force)
+        print('%5d objects, %2d ticks: identical %s, brute force %.4fs/tick, spatial hash %.4fs/tick (%.1fx)' % (
+            num_objects, ticks, same, brute_force_time, hashed_time,
+            brute_force_time / hashed_time))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Benchmarks for image conversion. Run directly, optionally naming sections:
+python tests/bench_image_convert.py [matching] [fast] [block_cache] [coherence]
+matching: tiles per second of get_best_tile's vectorized glyph matching
+against the per-combo, per-char loop it replaced.
+fast: tiles per second and mean L*a*b error of fast (GlyphIndex) matching
+against exact, by # of candidate chars.
+block_cache: conversion time with and without the exact block cache.
+coherence: image sequence time per frame with and without temporal
+coherence, by fraction of blocks changed each frame.
+"""
+
+import os, sys, tempfile, time
+
+import numpy as np
+
+import conftest
+import image_convert
+from image_convert import ImageConverter
+from headless import HeadlessApp
+from formats.in_bitmap_sequence import ImageSequenceConverter
+from test_image_convert import (make_image, make_pattern_image, make_sequence,
+                                convert_sequence, get_char_array, get_tiles,
+                                loop_best_tile)
+
+# loop takes ~seconds per block with many colors, only time this many
+LOOP_BLOCKS = 40
+# GlyphIndex candidate char counts to compare with exact matching
+FAST_CANDIDATES = [8, 16, 32, 64]
+
+
+def get_blocks(app, charset_name, palette_name, width, height):
+    "blocks of a noisy gradient test image, converted to given palette"
+    art = app.new_art('bench', width, height, charset_name, palette_name)
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = make_image(os.path.join(dirname, 'gradient.png'),
+                              size=(width * 8, height * 8))
+        src_array = image_convert.get_source_array(
+            image_convert.get_source_image(filename, art))
+    w, h = art.charset.char_width, art.charset.char_height
+    return [src_array[y:y + h, x:x + w]
+            for y in range(0, src_array.shape[0] - h + 1, h)
+            for x in range(0, src_array.shape[1] - w + 1, w)]
+
+def tiles_per_second(match, blocks):
+    start_time = time.perf_counter()
+    tiles = [match(block) for block in blocks]
+    return len(blocks) / (time.perf_counter() - start_time), tiles
+
+def bench_matching():
+    app = HeadlessApp()
+    for charset_name, palette_name in [('c64_petscii', 'c64_original'),
+                                       ('dos', 'ega'), ('ultima4', 'c64_original')]:
+        charset = app.load_charset(charset_name)
+        palette = app.load_palette(palette_name)
+        color_diffs = image_convert.get_color_diffs(palette)
+        char_array = get_char_array(charset)
+        blocks = get_blocks(app, charset_name, palette_name, 40, 25)
+        loop_speed, loop_tiles = tiles_per_second(
+            lambda block: loop_best_tile(block, color_diffs, charset, char_array),
+            blocks[:LOOP_BLOCKS])
+        speed, tiles = tiles_per_second(
+            lambda block: image_convert.get_best_tile(block, color_diffs,
+                                                      charset.conversion_masks),
+            blocks)
+        same = all(tuple(map(int, a)) == tuple(map(int, b))
+                   for a, b in zip(loop_tiles, tiles))
+        print('%s, %s: loop %.1f tiles/s, vectorized %.1f tiles/s (%.1fx), identical %s' % (
+            charset_name, palette_name, loop_speed, speed, speed / loop_speed, same))
+
+def get_tile_error(block, tile, color_diffs, glyph_masks):
+    "mean L*a*b distance of given tile's pixels from given block's"
+    char, fg, bg = tile
+    # see get_best_tile: bg color 1 tiles render as solid fg
+    colors = np.where(glyph_masks[char] | (bg == 1), fg, bg)
+    return color_diffs[block, colors].mean()
+
+def bench_fast():
+    app = HeadlessApp()
+    for charset_name, palette_name in [('c64_petscii', 'c64_original'),
+                                       ('dos', 'ega'), ('ultima4', 'c64_original')]:
+        charset = app.load_charset(charset_name)
+        palette = app.load_palette(palette_name)
+        color_diffs = image_convert.get_color_diffs(palette)
+        masks = charset.conversion_masks
+        signatures = image_convert.get_glyph_signatures(app, charset, masks)
+        blocks = get_blocks(app, charset_name, palette_name, 40, 25)
+        def match(glyph_index):
+            speed, tiles = tiles_per_second(
+                lambda block: image_convert.get_best_tile(block, color_diffs, masks,
+                                                          glyph_index),
+                blocks)
+            error = np.mean([get_tile_error(block, tile, color_diffs, masks)
+                             for block, tile in zip(blocks, tiles)])
+            return speed, error, [tuple(map(int, tile)) for tile in tiles]
+        exact_speed, exact_error, exact_tiles = match(None)
+        print('%s (%d chars), %s:' % (charset_name, len(masks), palette_name))
+        print('  exact:         %7.1f tiles/s, mean error %.2f' % (exact_speed, exact_error))
+        for candidates in FAST_CANDIDATES:
+            if candidates >= len(masks):
+                continue
+            glyph_index = image_convert.GlyphIndex(signatures, palette,
+                                                   charset.char_width,
+                                                   charset.char_height, candidates)
+            speed, error, tiles = match(glyph_index)
+            same = sum(a == b for a, b in zip(exact_tiles, tiles)) / len(tiles)
+            print('  fast, %2d chars: %7.1f tiles/s (%.1fx), mean error %.2f (+%.1f%%), %.1f%% same tiles' % (
+                candidates, speed, speed / exact_speed, error,
+                (error / exact_error - 1) * 100, same * 100))
+
+def time_conversion(filename, width, height, **settings):
+    "Return seconds taken to convert given image in app's process, and art."
+    originals = {name: getattr(ImageConverter, name) for name in settings}
+    for name, value in settings.items():
+        setattr(ImageConverter, name, value)
+    try:
+        app = HeadlessApp()
+        art = app.new_art('bench', width, height, 'c64_petscii', 'c64_original')
+        start_time = time.perf_counter()
+        converter = ImageConverter(app, filename, art)
+        app.finish_conversion()
+        return time.perf_counter() - start_time, art, converter
+    finally:
+        for name, value in originals.items():
+            setattr(ImageConverter, name, value)
+
+def bench_block_cache():
+    width, height = 80, 50
+    with tempfile.TemporaryDirectory() as dirname:
+        images = [
+            ('4 repeated blocks', make_pattern_image(
+                os.path.join(dirname, 'pattern4.png'), size=(width * 8, height * 8))),
+            ('64 repeated blocks', make_pattern_image(
+                os.path.join(dirname, 'pattern64.png'), size=(width * 8, height * 8),
+                patterns=64)),
+            ('noisy gradient', make_image(
+                os.path.join(dirname, 'gradient.png'), size=(width * 8, height * 8))),
+        ]
+        print('%dx%d tiles, c64_petscii, in app:' % (width, height))
+        for label, filename in images:
+            uncached_time, uncached, _ = time_conversion(filename, width, height,
+                                                         cache_blocks=False)
+            cached_time, cached, converter = time_conversion(filename, width, height,
+                                                             cache_blocks=True)
+            same = all((a == b).all() for a, b in zip(get_tiles(uncached), get_tiles(cached)))
+            print('  %s: uncached %.2fs, cached %.2fs (%.1fx), %.1f%% hits, identical %s' % (
+                label, uncached_time, cached_time, uncached_time / cached_time,
+                converter.cache_hits / converter.tiles_done * 100, same))
+
+def time_sequence(filenames, width, height, temporal_coherence):
+    """
+    Return mean seconds taken to convert each frame of sequence after the
+    first, which is always converted in full, and art.
+    """
+    frame_times = []
+    next_image = ImageSequenceConverter.next_image
+    def timed_next_image(self, first=False):
+        frame_times.append(time.perf_counter())
+        next_image(self, first)
+    ImageSequenceConverter.next_image = timed_next_image
+    original = ImageSequenceConverter.temporal_coherence
+    ImageSequenceConverter.temporal_coherence = temporal_coherence
+    try:
+        art, converter = convert_sequence(filenames, width, height)
+    finally:
+        ImageSequenceConverter.next_image = next_image
+        ImageSequenceConverter.temporal_coherence = original
+    # each call after first ends previous frame, last one ends sequence
+    return (frame_times[-1] - frame_times[1]) / (len(frame_times) - 2), art
+
+def bench_coherence():
+    width, height, frames = 40, 25, 4
+    # time spent on unchanged blocks is what coherence saves, not cache hits
+    cache_blocks, ImageConverter.cache_blocks = ImageConverter.cache_blocks, False
+    print('%d frames of %dx%d tiles, c64_petscii, block cache off, per frame after first:' % (
+        frames, width, height))
+    try:
+        for changed in [0, 0.01, 0.1, 0.25, 0.5, 1]:
+            with tempfile.TemporaryDirectory() as dirname:
+                filenames = make_sequence(dirname, frames, changed,
+                                          size=(width * 8, height * 8))
+                coherent_time, coherent = time_sequence(filenames, width, height, True)
+                full_time, full = time_sequence(filenames, width, height, False)
+            same = all((a == b).all() for frame in range(frames)
+                       for a, b in zip(get_tiles(full, frame), get_tiles(coherent, frame)))
+            print('  %5.1f%% blocks changed: off %.2fs, on %.2fs (%.1fx), identical %s' % (
+                changed * 100, full_time, coherent_time, full_time / coherent_time, same))
+    finally:
+        ImageConverter.cache_blocks = cache_blocks
+
+SECTIONS = {
+    'matching': bench_matching,
+    'fast': bench_fast,
+    'block_cache': bench_block_cache,
+    'coherence': bench_coherence,
+}
+
+def main():
+    for name in sys.argv[1:] or SECTIONS:
+        SECTIONS[name]()
+
+if __name__ == '__main__':
+    main()
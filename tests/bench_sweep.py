@@ -0,0 +1,70 @@
+"""
+Microbenchmark GameObject.fast_move's sweep against the step loop it replaced,
+for bullets crossing open space and bullets hitting a wall.
+Run directly: python tests/bench_sweep.py
+"""
+
+import math, time
+
+import conftest
+from collision import CST_CIRCLE
+from game_object import GameObject
+from test_sweep import wall_world, fire
+
+
+def step_loop_fast_move(self):
+    "fast_move before sweeping: step along move, checking collisions each step"
+    final_x, final_y = self.x, self.y
+    dx, dy = self.x - self.last_x, self.y - self.last_y
+    total_move_dist = math.sqrt(dx ** 2 + dy ** 2)
+    if total_move_dist == 0:
+        return
+    inv_dist = 1 / total_move_dist
+    dir_x, dir_y = dx * inv_dist, dy * inv_dist
+    if self.collision_shape_type == CST_CIRCLE:
+        step_dist = self.col_radius * 2
+    else:
+        step_x, step_y = self.col_width * dir_x, self.col_height * dir_y
+        step_dist = math.sqrt(step_x ** 2 + step_y ** 2)
+    step_dist /= self.fast_move_steps
+    if total_move_dist <= step_dist:
+        return
+    steps = int(total_move_dist / step_dist)
+    self.x, self.y = self.last_x, self.last_y
+    for i in range(steps):
+        self.x += dir_x * step_dist
+        self.y += dir_y * step_dist
+        # (shipped version never moved its shapes, so never saw any hits)
+        self.collision.update_transform_from_object()
+        if len(self.get_collisions()) > 0:
+            return
+    self.x, self.y = final_x, final_y
+
+def time_fast_move(fast_move, speed, angles, start):
+    total = 0
+    for angle in angles:
+        world = wall_world()
+        # fire bullet with no fast_move, then time just the one we're testing
+        GameObject.fast_move, original = lambda self: None, GameObject.fast_move
+        try:
+            bullet = fire(world, start[0], start[1], speed, math.radians(angle))
+        finally:
+            GameObject.fast_move = original
+        start_time = time.perf_counter()
+        fast_move(bullet)
+        total += time.perf_counter() - start_time
+    return total / len(angles)
+
+def main():
+    sweep_fast_move = GameObject.fast_move
+    for label, angles, start in [('open space', range(181, 201), (-2, 50)),
+                                 ('hitting wall', range(-30, 30, 3), (-10, 40))]:
+        print('per fast_move call, %s:' % label)
+        for speed in [100, 1000, 1e4, 1e5]:
+            stepped = time_fast_move(step_loop_fast_move, speed, angles, start)
+            swept = time_fast_move(sweep_fast_move, speed, angles, start)
+            print('  %7d units/s: step loop %8.3f ms, sweep %6.3f ms (%.1fx)' % (
+                speed, stepped * 1000, swept * 1000, stepped / swept))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+Tests run headless: no window, GL context or audio. Where PyOpenGL, PySDL2 or
+appdirs aren't installed, modules importing them at top level get stand-ins
+so the GL-free parts (collision, physics, conversion etc) can still be tested.
+"""
+
+import os, sys, types
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if not REPO_DIR in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+
+class StandInModule(types.ModuleType):
+    "Module whose every attribute is 0, enough for import-time GL/SDL names."
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return 0
+
+
+def install_stand_in(name, submodules=()):
+    try:
+        __import__(name)
+        return
+    except ImportError:
+        pass
+    module = StandInModule(name)
+    sys.modules[name] = module
+    for submodule_name in submodules:
+        submodule = StandInModule('%s.%s' % (name, submodule_name))
+        sys.modules[submodule.__name__] = submodule
+        setattr(module, submodule_name, submodule)
+
+
+install_stand_in('OpenGL', ['GL'])
+install_stand_in('sdl2', ['ext', 'sdlmixer'])
+install_stand_in('appdirs')
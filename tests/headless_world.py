@@ -0,0 +1,112 @@
+"""
+Minimal GameWorld stand-in for collision and physics tests: objects are built
+without renderables so no GL context is needed.
+"""
+
+import collision
+from collision import Collideable, CST_CIRCLE, CT_GENERIC_DYNAMIC
+from game_object import GameObject, DEFAULT_STATE, GOF_FRONT
+from headless import HeadlessApp
+import physics
+
+
+class NoRenderable:
+    "Stands in for collision debug renderables, which need GL."
+    def __init__(self, *args, **kwargs):
+        pass
+    
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+for renderable_name in ['CircleCollisionRenderable', 'BoxCollisionRenderable',
+                        'TileBoxCollisionRenderable']:
+    setattr(collision, renderable_name, NoRenderable)
+
+
+class ArtRenderable:
+    "The parts of GameObjectRenderable that collision reads."
+    def __init__(self, art, frame=0):
+        self.art, self.frame = art, frame
+        self.width = art.width * art.quad_width
+        self.height = art.height * art.quad_height
+
+
+class HeadlessWorld:
+    "The parts of GameWorld that GameObject, CollisionLord and physics use."
+    collision_cell_size = 4.
+    vectorized_physics = False
+    paused = False
+    gravity_x = gravity_y = gravity_z = 0.
+    
+    def __init__(self, app=None):
+        self.app = app or HeadlessApp()
+        self.app.timestep = 1000 / 30
+        self.objects = {}
+        self.classes = {'GameObject': GameObject}
+        self.current_room = None
+        self.drag_objects = {}
+        self.selected_objects = []
+        self.updates = 0
+        self.cl = collision.CollisionLord(self)
+        self.physics = physics.PhysicsArrays(self)
+    
+    def try_object_method(self, obj, method, args=()):
+        return method(*args)
+    
+    def get_elapsed_time(self):
+        return self.updates * self.app.timestep
+    
+    def update(self):
+        "Same order as GameWorld.update for an unpaused world."
+        objects = list(self.objects.values())
+        for obj in objects:
+            obj.frame_begin()
+        self.physics.update()
+        for obj in objects:
+            for timer in list(obj.timer_functions_update.values()):
+                timer.update()
+            obj.update()
+        self.cl.update()
+        for obj in objects:
+            if obj.can_sleep:
+                obj.update_sleep()
+        self.updates += 1
+
+
+def make_object(world, name, x, y, shape=CST_CIRCLE, ctype=CT_GENERIC_DYNAMIC,
+                radius=0.5, width=1., height=1., art=None, obj_class=GameObject,
+                **kwargs):
+    """
+    Return a new object of given class in given world, with the state
+    GameObject.__init__ would give it minus renderables.
+    """
+    obj = object.__new__(obj_class)
+    obj.world, obj.app, obj.name = world, world.app, name
+    obj.x, obj.y, obj.z = float(x), float(y), 0.
+    obj.vel_x = obj.vel_y = obj.vel_z = 0.
+    obj.move_x = obj.move_y = 0
+    obj.last_x, obj.last_y, obj.last_z = obj.x, obj.y, 0.
+    obj.rooms, obj.state, obj.facing = {}, DEFAULT_STATE, GOF_FRONT
+    obj.last_state = None
+    obj.collision_shape_type, obj.collision_type = shape, ctype
+    obj.orig_collision_type = ctype
+    obj.col_radius, obj.col_width, obj.col_height = radius, width, height
+    obj.destroy_time = 0
+    obj.timer_functions_pre_update = {}
+    obj.timer_functions_update = {}
+    obj.timer_functions_post_update = {}
+    obj.should_destroy = False
+    obj.last_update_end = 0
+    obj.sleeping, obj.rest_updates = False, 0
+    obj.sleep_loc = obj.sleep_state = None
+    obj.last_sweep_hit = None
+    obj.attachments = []
+    for k, v in kwargs.items():
+        setattr(obj, k, v)
+    if art is None:
+        art = world.app.new_art('headless_object', 1, 1)
+    obj.art = art
+    obj.renderable = ArtRenderable(art)
+    obj.collision = Collideable(obj)
+    world.objects[name] = obj
+    return obj
@@ -0,0 +1,450 @@
+import glob, os, os.path
+
+import numpy as np
+import pytest
+
+import art as art_module
+from art import (ArtFromDisk, ArtInstance, VERT_STRIDE, ELEM_STRIDE,
+                 GEO_CACHE_MAX_SIZE, TILE_DTYPE, UV_NORMAL, geo_cache,
+                 get_geo_arrays, read_art_file, get_script_code,
+                 script_code_cache)
+from headless import HeadlessApp
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLED_ART = sorted(os.path.relpath(f, REPO_DIR) for f in
+                     glob.glob(REPO_DIR + '/art/*.psci') +
+                     glob.glob(REPO_DIR + '/games/*/art/*.psci'))
+
+
+def get_tiles(art, frame=0):
+    return [art.chars[frame].copy(), art.fg_colors[frame].copy(),
+            art.bg_colors[frame].copy(), art.uv_maps[frame].copy()]
+
+def tiles_equal(a, b):
+    return all((x == y).all() for x, y in zip(a, b))
+
+def loop_geo_arrays(width, height, layers, quad_width, quad_height):
+    "Art.build_geo before get_geo_arrays: a loop over every tile of every layer"
+    shape = (layers, height, width, VERT_STRIDE)
+    vert_array = np.empty(shape, dtype=np.float32)
+    elem_array = np.empty(shape=layers * width * height * ELEM_STRIDE,
+                          dtype=np.uint32)
+    vert_index = 0
+    elem_index = 0
+    for layer in range(layers):
+        for tile_y in range(height):
+            for tile_x in range(width):
+                left_x = tile_x * quad_width
+                top_y = tile_y * -quad_height
+                right_x = left_x + quad_width
+                bottom_y = top_y - quad_height
+                verts = [left_x, top_y, 0]
+                verts += [right_x, top_y, 0]
+                verts += [left_x, bottom_y, 0]
+                verts += [right_x, bottom_y, 0]
+                vert_array[layer][tile_y][tile_x] = verts
+                elements = [vert_index, vert_index+1, vert_index+2]
+                elements += [vert_index+1, vert_index+2, vert_index+3]
+                elem_array[elem_index:elem_index+ELEM_STRIDE] = elements
+                elem_index += ELEM_STRIDE
+                vert_index += 4
+    return vert_array, elem_array
+
+
+@pytest.fixture
+def source():
+    app = HeadlessApp()
+    art = app.new_art('instance_source', 8, 6)
+    art.add_frame_to_end(log=False)
+    for frame in range(art.frames):
+        for y in range(art.height):
+            for x in range(art.width):
+                art.set_tile_at(frame, 0, x, y, 1 + x + y * 8 + frame, 1 + x % 15,
+                                1 + y % 15)
+    art.update()
+    return art
+
+
+def test_source_stays_writable(source):
+    instances = [ArtInstance(source) for i in range(3)]
+    for array_list in [source.chars, source.fg_colors, source.bg_colors,
+                       source.uv_maps]:
+        for array in array_list:
+            assert array.flags.writeable
+    # instances share source's data until written
+    for instance in instances:
+        assert np.shares_memory(instance.chars[0], source.chars[0])
+        assert not instance.chars[0].flags.writeable
+    # writing through source's arrays directly doesn't raise
+    source.chars[0][0][0][0] = 3
+
+def test_instance_write_isolated(source):
+    before = get_tiles(source)
+    instance = ArtInstance(source)
+    sibling = ArtInstance(source)
+    instance.set_tile_at(0, 0, 2, 3, 99, 4, 5)
+    instance.set_char_transform_at(0, 0, 1, 1, 2)
+    assert instance.get_char_index_at(0, 0, 2, 3) == 99
+    assert tiles_equal(get_tiles(source), before)
+    assert tiles_equal(get_tiles(sibling), before)
+    # only the written frame is copied
+    assert not np.shares_memory(instance.chars[0], source.chars[0])
+    assert np.shares_memory(instance.chars[1], source.chars[1])
+
+def test_source_write_isolated_from_manual_instance(source):
+    instance = ArtInstance(source)
+    instance.update_when_source_changes = False
+    before = get_tiles(instance)
+    source.set_tile_at(0, 0, 0, 0, 77, 2, 3)
+    source.fill_region(0, 0, 4, 2, 6, 4, 12)
+    source.update()
+    assert source.get_char_index_at(0, 0, 0, 0) == 77
+    assert tiles_equal(get_tiles(instance), before)
+    # source writes to its new copy from here on, instance stays put
+    source.set_char_index_at(0, 0, 1, 0, 78)
+    assert tiles_equal(get_tiles(instance), before)
+
+def test_source_write_updates_instance(source):
+    instance = ArtInstance(source)
+    instance.set_tile_at(0, 0, 1, 1, 50, 1, 1)
+    source.set_tile_at(0, 0, 5, 5, 60, 2, 2)
+    source.update()
+    # restored from source: its write is gone and source's shows through
+    assert tiles_equal(get_tiles(instance), get_tiles(source))
+    assert instance.get_char_index_at(0, 0, 5, 5) == 60
+    assert np.shares_memory(instance.chars[0], source.chars[0])
+
+def test_restore_drops_private_copies(source):
+    instance = ArtInstance(source)
+    instance.set_tile_at(1, 0, 0, 0, 42, 3, 3)
+    assert not np.shares_memory(instance.chars[1], source.chars[1])
+    instance.restore_from_source()
+    assert tiles_equal(get_tiles(instance, 1), get_tiles(source, 1))
+    assert np.shares_memory(instance.chars[1], source.chars[1])
+
+
+@pytest.mark.parametrize('size', [(1, 1, 1, 1, 1), (8, 6, 1, 1, 1),
+                                  (40, 25, 3, 1, 1), (17, 9, 2, 1, 2),
+                                  (80, 50, 4, 1, 8 / 6), (13, 31, 5, 0.5, 1.25)])
+def test_geo_arrays_match_loop(size):
+    geo_cache.clear()
+    verts, elems = get_geo_arrays(*size)
+    loop_verts, loop_elems = loop_geo_arrays(*size)
+    assert verts.dtype == loop_verts.dtype and elems.dtype == loop_elems.dtype
+    assert verts.shape == loop_verts.shape and elems.shape == loop_elems.shape
+    assert verts.tobytes() == loop_verts.tobytes()
+    assert elems.tobytes() == loop_elems.tobytes()
+
+def test_geo_arrays_shared():
+    geo_cache.clear()
+    app = HeadlessApp()
+    a = app.new_art('geo_a', 12, 7)
+    b = app.new_art('geo_b', 12, 7)
+    assert a.vert_array is b.vert_array and a.elem_array is b.elem_array
+    assert not a.vert_array.flags.writeable
+    assert not a.elem_array.flags.writeable
+    c = app.new_art('geo_c', 7, 12)
+    assert c.vert_array is not a.vert_array
+    # cache doesn't grow without limit
+    for width in range(1, GEO_CACHE_MAX_SIZE * 2):
+        get_geo_arrays(width, 1, 1, 1, 1)
+    assert len(geo_cache) == GEO_CACHE_MAX_SIZE
+
+
+@pytest.fixture
+def layered():
+    "3 layer, 2 frame art: rows count down all layers, 0-5 6-11 12-17"
+    art = HeadlessApp().new_art('dirty_rows', 10, 6)
+    art.add_layer()
+    art.add_layer()
+    art.add_frame_to_end(log=False)
+    art.update()
+    return art
+
+def test_no_dirty_rows(layered):
+    assert layered.dirty_rows == {}
+    assert layered.get_dirty_byte_range(0, 8) is None
+
+def test_set_marks_tile_row(layered):
+    layered.set_char_index_at(0, 1, 3, 2, 5)
+    assert layered.dirty_rows == {0: [8, 8]}
+    # one row of 10 tiles at 8 bytes per tile
+    assert layered.get_dirty_byte_range(0, 8) == (8 * 80, 80)
+    layered.set_color_at(0, 2, 0, 4, 3, fg=False)
+    layered.set_char_transform_at(0, 0, 9, 1, 2)
+    assert layered.dirty_rows == {0: [1, 16]}
+    assert layered.get_dirty_byte_range(0, 32) == (1 * 320, 16 * 320)
+    # frames tracked separately
+    layered.set_tile_at(1, 0, 0, 5, 1, 2, 3)
+    assert layered.dirty_rows[1] == [5, 5]
+    # negative index is bottom row
+    layered.set_char_index_at(1, -1, 0, -1, 1)
+    assert layered.dirty_rows[1] == [5, 17]
+
+def test_fill_region_marks_rows(layered):
+    layered.fill_region(0, 1, 2, 1, 5, 3, char=7)
+    assert layered.dirty_rows == {0: [7, 8]}
+    # region past bottom edge only marks rows that exist
+    layered.fill_region(1, 2, 0, 4, 10, 99, fg=2)
+    assert layered.dirty_rows[1] == [16, 17]
+    # nor does a region entirely past it
+    layered.fill_region(1, 0, 0, 6, 10, 9, fg=2)
+    assert layered.dirty_rows[1] == [16, 17]
+
+def test_frame_changed_marks_all_rows(layered):
+    layered.set_char_index_at(0, 1, 0, 0, 1)
+    layered.mark_frame_changed(0)
+    assert layered.dirty_rows == {0: [0, 17]}
+    assert layered.get_dirty_byte_range(0, 8) == (0, 18 * 80)
+    # ...and stay so whatever else changes
+    layered.set_char_index_at(0, 1, 0, 0, 1)
+    assert layered.dirty_rows == {0: [0, 17]}
+
+def test_update_clears_dirty_rows(layered):
+    layered.set_char_index_at(1, 1, 0, 0, 1)
+    layered.update()
+    assert layered.dirty_rows == {}
+
+
+def save_copy(art, filename, as_json):
+    art.set_filename(filename)
+    art.save_as_json = as_json
+    art.save_to_file()
+    return ArtFromDisk(filename, art.app)
+
+def assert_same_art(a, b):
+    assert (a.width, a.height, a.frames, a.layers) == (b.width, b.height, b.frames, b.layers)
+    assert a.charset is b.charset and a.palette is b.palette
+    assert a.layers_z == b.layers_z
+    assert a.layers_visibility == b.layers_visibility
+    assert a.layer_names == b.layer_names
+    assert a.frame_delays == b.frame_delays
+    for frame in range(a.frames):
+        for x, y in zip(get_tiles(a, frame), get_tiles(b, frame)):
+            assert x.dtype == y.dtype
+            assert (x == y).all()
+
+@pytest.mark.parametrize('filename', BUNDLED_ART)
+def test_save_round_trip(filename, tmp_path):
+    # games' art can use charsets and palettes from their game's dir
+    game_dir = os.path.dirname(os.path.dirname(os.path.join(REPO_DIR, filename)))
+    app = HeadlessApp(documents_dir=game_dir + '/')
+    original = ArtFromDisk(os.path.join(REPO_DIR, filename), app)
+    assert original.valid
+    # keep a copy, as saving changes original's filename
+    json_art = save_copy(original, str(tmp_path / 'v1.psci'), True)
+    binary_art = save_copy(original, str(tmp_path / 'v2.psci'), False)
+    assert read_art_file(json_art.filename)['version'] == 1
+    assert read_art_file(binary_art.filename)['version'] == 2
+    assert json_art.valid and binary_art.valid
+    assert_same_art(original, json_art)
+    assert_same_art(original, binary_art)
+
+@pytest.fixture
+def saved_art(tmp_path):
+    "Return (v1 JSON, v2 binary) filenames of a saved multi-frame art."
+    app = HeadlessApp()
+    art = app.new_art('round_trip', 12, 7)
+    art.add_layer(name='top')
+    art.add_frame_to_end(log=False)
+    art.layers_visibility[1] = False
+    art.frame_delays[1] = 0.5
+    art.fill_region(1, 1, 2, 2, 9, 5, char=33, fg=4, bg=7, xform=3)
+    filenames = []
+    for as_json, name in [(True, 'v1.psci'), (False, 'v2.psci')]:
+        art.set_filename(str(tmp_path / name))
+        art.save_as_json = as_json
+        art.save_to_file()
+        filenames.append(art.filename)
+    return filenames
+
+def test_save_round_trip_edited(saved_art):
+    app = HeadlessApp()
+    json_art, binary_art = [ArtFromDisk(f, app) for f in saved_art]
+    assert json_art.valid and binary_art.valid
+    assert_same_art(json_art, binary_art)
+    assert binary_art.layers_visibility == [True, False]
+    assert binary_art.layer_names[1] == 'top'
+    assert binary_art.frame_delays[1] == 0.5
+    assert binary_art.get_tile_at(1, 1, 3, 3) == (33, 4, 7, 3)
+
+@pytest.mark.parametrize('version', [0, 1])
+def test_corrupt_file_fails_cleanly(saved_art, tmp_path, version):
+    data = open(saved_art[version], 'rb').read()
+    bad_files = {
+        'truncated': data[:len(data) * 3 // 4],
+        'header_only': data[:40],
+        'empty': b'',
+        'garbage': data[:len(data) // 2] + bytes(range(256)) * 4,
+    }
+    if version == 1:
+        # future version, and a frame whose data doesn't fit art's size
+        bad_files['future_version'] = data[:4] + bytes([99, 0]) + data[6:]
+        header_size = int.from_bytes(data[6:10], 'little')
+        header = data[10:10 + header_size].replace(b'"width": 12', b'"width": 13')
+        bad_files['wrong_size'] = data[:10] + header + data[10 + header_size:]
+    app = HeadlessApp()
+    for name, bad_data in bad_files.items():
+        filename = str(tmp_path / ('%s.psci' % name))
+        open(filename, 'wb').write(bad_data)
+        art = ArtFromDisk(filename, app)
+        assert not art.valid, name
+        assert app.load_art(filename) is None, name
+
+
+def write_script(filename, source, mod_time=None):
+    "Write given script source, with given (or current + 1s) modified time."
+    open(filename, 'w').write(source)
+    mod_time = mod_time or os.path.getmtime(filename) + 1
+    os.utime(filename, (mod_time, mod_time))
+    return str(filename)
+
+@pytest.fixture
+def compiles(monkeypatch):
+    "Return list of filenames compile() is called on in art module."
+    filenames = []
+    def counting_compile(source, filename, mode):
+        filenames.append(filename)
+        return compile(source, filename, mode)
+    monkeypatch.setattr(art_module, 'compile', counting_compile, raising=False)
+    return filenames
+
+def test_script_code_cached(tmp_path, compiles):
+    script = write_script(tmp_path / 'fill.arsc', 'self.fill_region(0, 0, 0, 0, 2, 2, char=5)\n')
+    code = get_script_code(script)
+    assert get_script_code(script) is code
+    assert compiles == [script]
+    art = HeadlessApp().new_art('script_cache', 4, 4)
+    for i in range(3):
+        art.run_script(script, log=False)
+    assert compiles == [script]
+    assert art.get_char_index_at(0, 0, 1, 1) == 5
+
+def test_script_code_invalidated(tmp_path, compiles):
+    script = write_script(tmp_path / 'fill.arsc', 'self.fill_region(0, 0, 0, 0, 2, 2, char=5)\n')
+    code = get_script_code(script)
+    # same size, only modified time tells them apart
+    write_script(script, 'self.fill_region(0, 0, 0, 0, 2, 2, char=6)\n',
+                 os.path.getmtime(script) + 2)
+    assert get_script_code(script) is not code
+    assert compiles == [script, script]
+    art = HeadlessApp().new_art('script_reload', 4, 4)
+    art.run_script(script, log=False)
+    assert art.get_char_index_at(0, 0, 1, 1) == 6
+    assert script_code_cache[script][1] is get_script_code(script)
+
+def test_script_update_function(tmp_path, compiles):
+    script = write_script(tmp_path / 'count.arsc', '''setup_runs = self.setup_runs = getattr(self, 'setup_runs', 0) + 1
+def update(art):
+    art.set_char_index_at(0, 0, 0, 0, art.get_char_index_at(0, 0, 0, 0) + 1)
+''')
+    art = HeadlessApp().new_art('script_update', 4, 4)
+    art.run_script_every(script, 0)
+    for i in range(3):
+        art.run_script_tick(0)
+    # setup ran once, update every tick
+    assert art.setup_runs == 1
+    assert art.get_char_index_at(0, 0, 0, 0) == 3
+    # changed script runs its setup again
+    write_script(script, '''self.setup_runs += 10
+def update(art):
+    art.set_char_index_at(0, 0, 0, 0, 0)
+''')
+    art.run_script_tick(0)
+    assert art.setup_runs == 11
+    assert art.get_char_index_at(0, 0, 0, 0) == 0
+    assert compiles == [script, script]
+
+def test_script_error_reports_line(tmp_path):
+    script = write_script(tmp_path / 'broken.arsc', '''x = 1
+def update(art):
+    art.set_char_index_at(0, 0, 0, 0, 1)
+    return art.no_such_attribute
+''')
+    app = HeadlessApp()
+    art = app.new_art('script_error', 4, 4)
+    art.run_script(script)
+    assert 'Error executing %s:' % script in app.log_lines
+    assert any('File "%s", line 4, in update' % script in line for line in app.log_lines)
+    assert any('no_such_attribute' in line for line in app.log_lines)
+    # traceback starts in script, not in Art
+    assert not any('art.py' in line for line in app.log_lines)
+    # running script reports the same and is stopped
+    app.log_lines = []
+    art.run_script_every(script, 0)
+    art.update_scripts()
+    assert any('File "%s", line 4, in update' % script in line for line in app.log_lines)
+    assert not art.is_script_running(script)
+
+def test_script_syntax_error_reports_line(tmp_path):
+    script = write_script(tmp_path / 'typo.arsc', 'x = 1\ny = (2\nz = 3 +\n')
+    app = HeadlessApp()
+    art = app.new_art('script_syntax', 4, 4)
+    art.run_script(script)
+    assert 'Error executing %s:' % script in app.log_lines
+    assert any('File "%s", line 2' % script in line for line in app.log_lines)
+    assert any('SyntaxError' in line for line in app.log_lines)
+
+
+def write_json_art(filename, width, height, layers, frames, seed=0):
+    """
+    Write a version 1 (JSON) art of given size with random tiles. Some
+    tiles have no xform, and the last layer's tile lists stop short.
+    Written a layer at a time, as large arts' JSON is big.
+    """
+    rng = np.random.default_rng(seed)
+    f = open(filename, 'w')
+    f.write('{"width": %s, "height": %s, "charset": "c64_petscii", '
+            '"palette": "c64_original", "camera": [0, 0, 10], "frames": [' % (width, height))
+    for frame in range(frames):
+        f.write('%s{"delay": %s, "layers": [' % (',' if frame else '', 0.1 * (frame + 1)))
+        for layer in range(layers):
+            f.write('%s{"z": %s, "visible": %s, "name": "L%s", "tiles": [' % (
+                ',' if layer else '', layer * 0.05, layer % 2, layer))
+            tiles = width * height
+            if layer == layers - 1:
+                tiles -= width + 3
+            values = rng.integers(0, [256, 16, 16, 8], (tiles, 4))
+            has_xform = rng.random(tiles) < 0.8
+            f.write(','.join(
+                '{"char": %s, "fg": %s, "bg": %s, "xform": %s}' % tuple(v) if x else
+                '{"char": %s, "fg": %s, "bg": %s}' % tuple(v[:3])
+                for v, x in zip(values.tolist(), has_xform.tolist())))
+            f.write(']}')
+        f.write(']}')
+    f.write(']}')
+    f.close()
+    return str(filename)
+
+def loop_frame_tile_data(width, height, layers, frame):
+    "ArtFromDisk.init_frames' tile data before it was vectorized, one tile at a time"
+    shape = (layers, height, width)
+    chars = np.zeros(shape, dtype=TILE_DTYPE)
+    fg_colors, bg_colors, uv_maps = chars.copy(), chars.copy(), chars.copy()
+    for layer_index,layer in enumerate(frame['layers']):
+        x, y = 0, 0
+        for tile in layer['tiles']:
+            chars[layer_index][y][x] = tile['char']
+            fg_colors[layer_index][y][x] = tile['fg']
+            bg_colors[layer_index][y][x] = tile['bg']
+            uv_maps[layer_index][y][x] = tile.get('xform', UV_NORMAL)
+            x += 1
+            if x >= width:
+                x = 0
+                y += 1
+    return chars, fg_colors, bg_colors, uv_maps
+
+def check_json_load(filename):
+    "Load given JSON art and check its tiles match the per-tile loader's."
+    art = ArtFromDisk(filename, HeadlessApp())
+    assert art.valid
+    for frame_index, frame in enumerate(art.loaded_data['frames']):
+        expected = loop_frame_tile_data(art.width, art.height, art.layers, frame)
+        for loaded, loop in zip(get_tiles(art, frame_index), expected):
+            assert loaded.dtype == loop.dtype
+            assert (loaded == loop).all()
+    return art
+
+def test_json_load_matches_tile_loop(tmp_path):
+    # 500x300, 5 layers, 10 frames: 7.5M tiles
+    check_json_load(write_json_art(tmp_path / 'big.psci', 500, 300, 5, 10))
@@ -0,0 +1,84 @@
+import glob, os, shutil, time
+
+import numpy as np
+from PIL import Image
+
+from charset import CharacterSet, CharacterSetLord, CHARSET_DIR
+from headless import HeadlessApp, APP_DIR
+
+# seconds, well over the ~0.2 it takes to load the largest charset (3.5 when
+# its image was processed a pixel at a time)
+LOAD_TIME_LIMIT = 1.5
+
+
+def get_largest_charset():
+    "name of bundled charset with the most image pixels"
+    def pixels(char_filename):
+        image_name = open(char_filename, encoding='utf-8').readline().strip()
+        image_filename = HeadlessApp().find_filename_path(image_name, CHARSET_DIR, 'png')
+        if not image_filename:
+            return 0
+        width, height = Image.open(image_filename).size
+        return width * height
+    filenames = glob.glob(APP_DIR + CHARSET_DIR + '*.char')
+    return os.path.splitext(os.path.basename(max(filenames, key=pixels)))[0]
+
+def get_cell(charset, image_array, char_index):
+    "given char's cell of given image array, as a view"
+    y, x = divmod(char_index, charset.map_width)
+    h, w = charset.char_height, charset.char_width
+    return image_array[y * h:(y + 1) * h, x * w:(x + 1) * w]
+
+def test_largest_charset_load_time():
+    name = get_largest_charset()
+    app = HeadlessApp()
+    start_time = time.perf_counter()
+    charset = CharacterSet(app, name, False)
+    load_time = time.perf_counter() - start_time
+    assert charset.init_success
+    assert load_time < LOAD_TIME_LIMIT, '%s took %.2fs to load' % (name, load_time)
+    # tables cover every char
+    chars = charset.map_width * charset.map_height
+    shape = (chars, charset.char_height, charset.char_width)
+    assert charset.glyph_masks.shape == charset.conversion_masks.shape == shape
+    assert charset.glyph_densities.shape == (chars,)
+    # and agree with image's alpha
+    alpha = np.asarray(charset.image_data)[:, :, 3]
+    for char_index in range(0, chars, 97):
+        solid = np.count_nonzero(get_cell(charset, alpha, char_index))
+        assert charset.get_solid_pixels_in_char(char_index) == solid
+        assert charset.glyph_densities[char_index] * charset.glyph_masks[0].size == solid
+
+def test_hot_reload_rebuilds_tables(tmp_path):
+    os.makedirs(tmp_path / CHARSET_DIR)
+    for filename in ['c64_petscii.char', 'c64_petscii.png']:
+        shutil.copy(APP_DIR + CHARSET_DIR + filename, tmp_path / CHARSET_DIR)
+    app = HeadlessApp(documents_dir=str(tmp_path) + '/')
+    charset = app.load_charset('c64_petscii')
+    assert charset.image_filename.startswith(str(tmp_path))
+    lord = CharacterSetLord(app)
+    lord.hot_reload_check_interval = 0
+    old_masks, old_conversion_masks = charset.glyph_masks, charset.conversion_masks
+    old_densities = charset.glyph_densities.copy()
+    # char 1 solid white, char 2 solid dark gray, char 3 empty
+    pixels = np.array(Image.open(charset.image_filename).convert('RGB'))
+    get_cell(charset, pixels, 1)[:] = 255
+    get_cell(charset, pixels, 2)[:] = 60
+    get_cell(charset, pixels, 3)[:] = 0
+    Image.fromarray(pixels).save(charset.image_filename)
+    future = time.time() + 10
+    os.utime(charset.image_filename, (future, future))
+    lord.check_hot_reload()
+    assert 'CharacterSetLord: success reloading %s' % charset.filename in app.log_lines
+    assert charset.glyph_masks is not old_masks
+    assert charset.conversion_masks is not old_conversion_masks
+    assert charset.glyph_masks[1].all() and charset.conversion_masks[1].all()
+    # gray is solid, but closer to black than white for conversion
+    # (dithered, so a sparse pattern)
+    assert charset.glyph_masks[2].all() and charset.conversion_masks[2].mean() < 0.5
+    assert not charset.glyph_masks[3].any() and not charset.conversion_masks[3].any()
+    assert list(charset.glyph_densities[1:4]) == [1, 1, 0]
+    # other chars are as they were
+    assert (charset.glyph_masks[4:] == old_masks[4:]).all()
+    assert (charset.conversion_masks[4:] == old_conversion_masks[4:]).all()
+    assert (charset.glyph_densities[4:] == old_densities[4:]).all()
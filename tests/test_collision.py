@@ -0,0 +1,246 @@
+import gc, hashlib, os, random, subprocess, sys
+
+import numpy as np
+
+import collision
+from art import ArtInstance
+from collision import (CST_CIRCLE, CST_AABB, CST_TILE, CT_GENERIC_STATIC,
+                       get_merged_tile_boxes)
+from headless_world import HeadlessWorld, make_object
+
+
+def build_world(num_objects, use_spatial_hash=True, skip_resolved_shapes=True,
+                can_sleep=False, seed=1):
+    "Return world with num_objects crowded into a walled room with pillars."
+    world = HeadlessWorld()
+    world.cl.use_spatial_hash = use_spatial_hash
+    world.cl.skip_resolved_shapes = skip_resolved_shapes
+    rng = random.Random(seed)
+    side = num_objects ** 0.5 * 1.6
+    wall_tiles = int(side) + 4
+    art = world.app.new_art('collision_walls', wall_tiles, wall_tiles)
+    art.layer_names[0] = 'collision'
+    for i in range(wall_tiles):
+        for x, y in [(i, 0), (i, wall_tiles - 1), (0, i), (wall_tiles - 1, i)]:
+            art.set_char_index_at(0, 0, x, y, 1)
+    for i in range(6):
+        x, y = rng.randrange(3, wall_tiles - 3), rng.randrange(3, wall_tiles - 3)
+        art.set_char_index_at(0, 0, x, y, 1)
+    make_object(world, 'walls', -2, wall_tiles - 2, shape=CST_TILE,
+                ctype=CT_GENERIC_STATIC, art=art)
+    for i in range(max(4, num_objects // 25)):
+        make_object(world, 'static%d' % i, rng.uniform(0, side),
+                    rng.uniform(0, side), shape=CST_CIRCLE if i % 2 else CST_AABB,
+                    ctype=CT_GENERIC_STATIC, radius=0.7, width=1.5, height=0.8)
+    for i in range(num_objects):
+        obj = make_object(world, 'obj%d' % i, rng.uniform(0, side),
+                          rng.uniform(0, side),
+                          shape=CST_CIRCLE if i % 2 else CST_AABB,
+                          radius=rng.uniform(0.3, 0.6), width=rng.uniform(0.5, 1.2),
+                          height=rng.uniform(0.5, 1.2), mass=rng.uniform(0.5, 2),
+                          can_sleep=can_sleep, ground_friction=3.)
+        obj.vel_x, obj.vel_y = rng.uniform(-5, 5), rng.uniform(-5, 5)
+    return world
+
+def get_state(world):
+    return [(obj.x, obj.y, obj.vel_x, obj.vel_y, obj.sleeping,
+             tuple(sorted(obj.collision.contacts)))
+            for obj in world.objects.values()]
+
+def run_world(world, ticks):
+    "Update world for given ticks, return hash of its state after each."
+    states = hashlib.sha1()
+    for tick in range(ticks):
+        for obj in world.objects.values():
+            obj.frame_begin()
+        world.update()
+        states.update(repr(get_state(world)).encode())
+    return states.hexdigest()
+
+
+def test_skip_resolved_shapes_matches_checking_all():
+    for can_sleep in (False, True):
+        checked = build_world(150, skip_resolved_shapes=False,
+                              can_sleep=can_sleep)
+        skipped = build_world(150, can_sleep=can_sleep)
+        assert run_world(skipped, 60) == run_world(checked, 60)
+        # and skipping actually happened
+        assert skipped.cl.shape_checks < checked.cl.shape_checks
+
+def test_repeated_runs_identical():
+    first = run_world(build_world(150, can_sleep=True), 90)
+    assert run_world(build_world(150, can_sleep=True), 90) == first
+    # in a new process, where shapes hash and sets iterate differently
+    code = 'import conftest, test_collision as t; ' \
+           'print(t.run_world(t.build_world(150, can_sleep=True), 90))'
+    env = dict(os.environ, PYTHONHASHSEED='123')
+    output = subprocess.check_output([sys.executable, '-c', code], env=env,
+                                     cwd=os.path.dirname(__file__))
+    assert output.decode().strip() == first
+
+def test_sleep_and_wake():
+    world = build_world(100, can_sleep=True)
+    for tick in range(300):
+        run_world(world, 1)
+    sleepers = [obj for obj in world.objects.values() if obj.sleeping]
+    assert len(sleepers) > 50
+    for obj in sleepers:
+        assert obj.vel_x == obj.vel_y == 0
+        assert obj.sleep_state == obj.get_sleep_state()
+    # sleeping objects don't move, and keep their contacts
+    state = dict(zip(world.objects.values(), get_state(world)))
+    run_world(world, 10)
+    still_asleep = 0
+    for obj, after in zip(world.objects.values(), get_state(world)):
+        if obj in sleepers and obj.sleeping:
+            assert state[obj] == after
+            still_asleep += 1
+    assert still_asleep > 50
+    # given a velocity: wakes next update
+    pushed = sleepers[0]
+    pushed.vel_x = 20.
+    run_world(world, 1)
+    assert not pushed.sleeping and pushed.rest_updates == 0
+    # moved: wakes next update
+    moved = sleepers[1]
+    moved.x += 0.25
+    run_world(world, 1)
+    assert not moved.sleeping
+    # pushed by something overlapping it: wakes that update
+    touched = sleepers[2]
+    make_object(world, 'ball', touched.x - 0.2, touched.y)
+    run_world(world, 1)
+    assert not touched.sleeping
+
+def test_sleep_delay():
+    world = HeadlessWorld()
+    obj = make_object(world, 'sleeper', 0, 0, can_sleep=True, sleep_delay=5)
+    obj.vel_x = 0.5
+    run_world(world, 1)
+    # still moving faster than sleep_velocity
+    assert obj.rest_updates == 0
+    obj.vel_x = 0
+    run_world(world, 4)
+    assert obj.rest_updates == 4 and not obj.sleeping
+    run_world(world, 1)
+    assert obj.sleeping
+    obj.wake()
+    assert not obj.sleeping and obj.rest_updates == 0 and obj.sleep_loc is None
+
+def test_touched_wakes_and_sleeps_again():
+    world = HeadlessWorld()
+    sleeper = make_object(world, 'sleeper', 0, 0, can_sleep=True,
+                          ground_friction=3.)
+    ball = make_object(world, 'ball', -5, 0, can_sleep=True, ground_friction=3.)
+    run_world(world, sleeper.sleep_delay)
+    assert sleeper.sleeping and ball.sleeping
+    ball.vel_x = 20.
+    for tick in range(30):
+        run_world(world, 1)
+        if not sleeper.sleeping:
+            break
+    assert not sleeper.sleeping and sleeper.name in ball.collision.contacts
+    run_world(world, 300)
+    assert sleeper.sleeping and ball.sleeping
+    assert sleeper.x != 0
+
+def test_spatial_hash_matches_brute_force():
+    for num_objects, ticks in [(100, 30), (500, 4)]:
+        hashed = build_world(num_objects)
+        brute_force = build_world(num_objects, use_spatial_hash=False)
+        assert run_world(hashed, ticks) == run_world(brute_force, ticks)
+        # and objects were actually colliding
+        assert any(obj.collision.contacts for obj in hashed.objects.values())
+
+
+def greedy_tile_boxes(solid):
+    "CST_TILE box merge before get_merged_tile_boxes: one tile at a time"
+    height, width = solid.shape
+    covered = set()
+    def tile_available(x, y):
+        return solid[y][x] and not (x, y) in covered
+    def tile_range_available(start_x, end_x, start_y, end_y):
+        for y in range(start_y, end_y + 1):
+            for x in range(start_x, end_x + 1):
+                if not tile_available(x, y):
+                    return False
+        return True
+    boxes = []
+    for y in range(height):
+        for x in range(width):
+            if not tile_available(x, y):
+                continue
+            end_x = x
+            while end_x < width - 1 and tile_available(end_x + 1, y):
+                end_x += 1
+            end_y = y
+            while end_y < height - 1 and tile_range_available(x, end_x, y, end_y + 1):
+                end_y += 1
+            for tile_y in range(y, end_y + 1):
+                for tile_x in range(x, end_x + 1):
+                    covered.add((tile_x, tile_y))
+            boxes.append((x, y, end_x, end_y))
+    return boxes
+
+def random_masks(count, seed=3):
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        height, width = rng.integers(1, 24, 2)
+        yield rng.random((height, width)) < rng.uniform(0, 1)
+    # edge cases: empty, full, single tile
+    yield np.zeros((5, 7), dtype=bool)
+    yield np.ones((5, 7), dtype=bool)
+    yield np.ones((1, 1), dtype=bool)
+
+def test_merged_tile_boxes_cover_solid_tiles():
+    for solid in random_masks(200):
+        coverage = np.zeros(solid.shape, dtype=int)
+        for x, y, end_x, end_y in get_merged_tile_boxes(solid):
+            assert x <= end_x and y <= end_y
+            coverage[y:end_y + 1, x:end_x + 1] += 1
+        # every solid tile exactly once, nothing else
+        assert (coverage == solid).all()
+
+def test_merged_tile_boxes_match_greedy_merge():
+    for solid in random_masks(400, seed=7):
+        assert get_merged_tile_boxes(solid) == greedy_tile_boxes(solid)
+
+def test_tile_box_cache_cleared_on_reset():
+    world = build_world(4)
+    walls = world.objects['walls']
+    assert collision.tile_box_cache
+    # edited chars re-merge, unchanged ones reuse cached boxes
+    solid, boxes = collision.tile_box_cache[walls.art][(0, 0)]
+    walls.collision.create_shapes()
+    assert collision.tile_box_cache[walls.art][(0, 0)][1] is boxes
+    walls.art.set_char_index_at(0, 0, 2, 2, 1)
+    walls.collision.create_shapes()
+    assert collision.tile_box_cache[walls.art][(0, 0)][1] is not boxes
+    world.cl.reset()
+    assert not collision.tile_box_cache
+
+def test_tile_box_cache_drops_spawned_instances():
+    world = HeadlessWorld()
+    art = world.app.new_art('spawned_walls', 8, 8)
+    art.layer_names[0] = 'collision'
+    art.fill_region(0, 0, 0, 0, 8, 1, char=1)
+    collision.tile_box_cache.clear()
+    for i in range(20):
+        obj = make_object(world, 'spawned%d' % i, 0, 0, shape=CST_TILE,
+                          ctype=CT_GENERIC_STATIC, art=ArtInstance(art))
+        assert obj.art in collision.tile_box_cache
+        # destroyed objects' shapes and art go with them
+        obj.collision.destroy()
+        world.objects.pop(obj.name)
+        del obj
+        gc.collect()
+        assert len(collision.tile_box_cache) <= 1
+        assert len(art.instances) <= 1
+    # instances still in use are updated when source changes
+    kept = make_object(world, 'kept', 0, 0, shape=CST_TILE,
+                       ctype=CT_GENERIC_STATIC, art=ArtInstance(art))
+    gc.collect()
+    assert list(art.instances) == [kept.art]
+    art.set_char_index_at(0, 0, 0, 4, 2)
+    art.update()
+    assert kept.art.chars[0][0][4, 0] == 2
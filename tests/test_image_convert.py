@@ -0,0 +1,332 @@
+import glob, multiprocessing, os.path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import image_convert
+from formats.in_bitmap_sequence import ImageSequenceConverter
+from headless import HeadlessApp
+
+CHARSET, PALETTE = 'c64_petscii', 'c64_original'
+CHARSETS = sorted(os.path.splitext(os.path.basename(f))[0]
+                  for f in glob.glob(os.path.join(os.path.dirname(__file__),
+                                                  '../charsets/*.char')))
+
+
+def make_image(filename, seed=0, size=(64, 48)):
+    "Save a noisy gradient test image to given filename."
+    rng = np.random.default_rng(seed)
+    w, h = size
+    gradient = np.linspace(0, 255, w)[np.newaxis, :, np.newaxis] * np.ones((h, 1, 3))
+    gradient[..., 1] = np.linspace(255, 0, h)[:, np.newaxis]
+    pixels = np.clip(gradient + rng.normal(0, 40, gradient.shape), 0, 255)
+    Image.fromarray(pixels.astype(np.uint8)).save(filename)
+    return filename
+
+def make_pattern_image(filename, seed=0, size=(128, 96), block=(8, 8), patterns=4,
+                       palette=PALETTE):
+    """
+    Save an image of given # of random blocks, repeated in random order.
+    Blocks use only given palette's colors, so dithering leaves them alone.
+    """
+    rng = np.random.default_rng(seed)
+    (w, h), (bw, bh) = size, block
+    colors = np.array([c[:3] for c in HeadlessApp().load_palette(palette).colors[1:]],
+                      dtype=np.uint8)
+    blocks = colors[rng.integers(0, len(colors), (patterns, bh, bw))]
+    order = rng.integers(0, patterns, (h // bh, w // bw))
+    pixels = blocks[order].transpose(0, 2, 1, 3, 4).reshape(h, w, 3)
+    Image.fromarray(pixels).save(filename)
+    return filename
+
+def make_sequence(dirname, frames, changed=0.1, seed=0, size=(128, 96), block=(8, 8),
+                  palette=PALETTE):
+    """
+    Save given # of frames starting from a repeated-block image, each
+    replacing given fraction of previous frame's blocks with new random ones.
+    Returns frames' filenames, in order.
+    """
+    rng = np.random.default_rng(seed)
+    (w, h), (bw, bh) = size, block
+    colors = np.array([c[:3] for c in HeadlessApp().load_palette(palette).colors[1:]],
+                      dtype=np.uint8)
+    first = make_pattern_image(os.path.join(dirname, 'frame000.png'), seed, size,
+                               block, palette=palette)
+    pixels = np.array(Image.open(first).convert('RGB'))
+    filenames = [first]
+    for i in range(1, frames):
+        blocks = pixels.reshape(h // bh, bh, w // bw, bw, 3)
+        for index in rng.choice(blocks.shape[0] * blocks.shape[2],
+                                round(blocks.shape[0] * blocks.shape[2] * changed),
+                                replace=False):
+            y, x = divmod(int(index), blocks.shape[2])
+            blocks[y, :, x] = colors[rng.integers(0, len(colors), (bh, bw))]
+        filenames.append(os.path.join(dirname, 'frame%03d.png' % i))
+        Image.fromarray(pixels).save(filenames[-1])
+    return filenames
+
+def convert_sequence(filenames, width, height):
+    "Return art converted from given image sequence, and converter that did it."
+    app = HeadlessApp()
+    art = app.new_art('sequence', width, height, CHARSET, PALETTE)
+    while art.frames < len(filenames):
+        art.add_frame_to_end(log=False)
+    app.converter = ImageSequenceConverter(app, list(filenames), art, False)
+    converter = app.converter
+    app.finish_conversion()
+    return art, converter
+
+def convert(filename, width, height):
+    "Return art converted from given image, and converter that did it."
+    app = HeadlessApp()
+    art = app.new_art('converted', width, height, CHARSET, PALETTE)
+    converter = image_convert.ImageConverter(app, filename, art)
+    app.finish_conversion()
+    return art, converter
+
+def get_tiles(art, frame=0, layer=0):
+    return art.chars[frame][layer].copy(), art.fg_colors[frame][layer].copy(), \
+        art.bg_colors[frame][layer].copy()
+
+def get_char_array(charset):
+    "charset image quantized to 0 (black) and 1 (white), as conversion did"
+    char_img = charset.image_data.copy().convert('RGB')
+    bw_pal_img = Image.new('P', (1, 1))
+    bw_pal = [0, 0, 0, 255, 255, 255]
+    while len(bw_pal) < 256 * 3:
+        bw_pal.append(0)
+    bw_pal_img.putpalette(tuple(bw_pal))
+    char_img = char_img.quantize(palette=bw_pal_img)
+    char_array = np.frombuffer(char_img.tobytes(), dtype=np.uint8)
+    return np.reshape(char_array, (charset.image_height, charset.image_width))
+
+def loop_best_tile(src_block, color_diffs, charset, char_array):
+    "ImageConverter.get_best_tile_for_block before it was vectorized"
+    char_w, char_h = charset.char_width, charset.char_height
+    char_blocks = []
+    for char_y in range(charset.map_height):
+        for char_x in range(charset.map_width):
+            x0, y0 = char_x * char_w, char_y * char_h
+            char_blocks.append((x0, y0, x0 + char_w, y0 + char_h))
+    colors, counts = np.unique(src_block, return_counts=True)
+    if len(colors) == 1:
+        return (0, 0, colors[0])
+    color_counts = []
+    for i,color in enumerate(colors):
+        color_counts += [(color, counts[i])]
+    color_counts.sort(key=lambda item: item[1], reverse=True)
+    combos = []
+    for color1,count1 in color_counts:
+        for color2,count2 in color_counts:
+            if color1 == color2:
+                continue
+            if (color1, color2) in combos:
+                continue
+            combos.append((color1, color2))
+    best_char = 0
+    best_diff = 9999999999999
+    best_fg, best_bg = 0, 0
+    for bg,fg in combos:
+        char_index = 0
+        char_array_copy = char_array.copy()
+        char_array_copy[char_array_copy == 0] = bg
+        char_array_copy[char_array_copy == 1] = fg
+        for (x0, y0, x1, y1) in char_blocks:
+            char_block = char_array_copy[y0:y1, x0:x1]
+            diff = color_diffs[src_block, char_block].sum()
+            if diff == 0:
+                return (char_index, fg, bg)
+            if diff < best_diff:
+                best_diff = diff
+                best_char = char_index
+                best_fg, best_bg = fg, bg
+            char_index += 1
+    return (best_char, best_fg, best_bg)
+
+def get_test_blocks(charset, palette, count, seed=0):
+    """
+    Return blocks of a fixed test image for given charset: noise of 2-4
+    colors, and glyphs drawn in 2 colors, some with a few pixels changed.
+    """
+    rng = np.random.default_rng(seed)
+    w, h = charset.char_width, charset.char_height
+    num_colors = len(palette.colors)
+    blocks = []
+    for i in range(count):
+        colors = rng.choice(np.arange(1, num_colors), rng.integers(2, 5), replace=False)
+        if i % 2:
+            block = rng.choice(colors, (h, w))
+        else:
+            mask = charset.conversion_masks[rng.integers(len(charset.conversion_masks))]
+            block = np.where(mask, colors[0], colors[1])
+            noise = rng.random((h, w)) < 0.1 * (i % 4)
+            block[noise] = colors[-1]
+        blocks.append(block.astype(np.uint16))
+    return blocks
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    "Set ImageConverter.workers for a test, default restored after."
+    def set_workers(count):
+        monkeypatch.setattr(image_convert.ImageConverter, 'workers', count)
+    return set_workers
+
+
+def test_convert_image(tmp_path):
+    filename = make_image(tmp_path / 'gradient.png')
+    art = image_convert.convert_image(str(filename), CHARSET, PALETTE, 16, 12)
+    assert (art.width, art.height) == (16, 12)
+    assert art.charset.name == CHARSET and art.palette.name == PALETTE
+    chars, fgs, bgs = get_tiles(art)
+    # noisy image uses many chars and colors, and no color index 0
+    assert len(np.unique(chars)) > 10
+    assert len(np.unique(bgs)) > 3
+    assert fgs.min() > 0 and bgs.min() > 0
+
+def test_convert_solid_image(tmp_path):
+    filename = tmp_path / 'solid.png'
+    Image.new('RGB', (32, 32), (255, 255, 255)).save(filename)
+    art = image_convert.convert_image(str(filename), CHARSET, PALETTE, 4, 4)
+    chars, fgs, bgs = get_tiles(art)
+    white = art.palette.get_closest_color_index(255, 255, 255)
+    assert (chars == 0).all() and (bgs == white).all()
+
+def test_convert_missing_image(tmp_path):
+    assert image_convert.convert_image(str(tmp_path / 'none.png'), CHARSET,
+                                       PALETTE, 8, 8) is None
+
+@pytest.mark.parametrize('charset_name', CHARSETS)
+def test_best_tile_matches_loop(charset_name):
+    app = HeadlessApp()
+    charset = app.load_charset(charset_name)
+    if not charset:
+        pytest.skip("charset %s doesn't load (missing image)" % charset_name)
+    palette = app.load_palette(PALETTE)
+    color_diffs = image_convert.get_color_diffs(palette)
+    char_array = get_char_array(charset)
+    for block in get_test_blocks(charset, palette, 12):
+        tile = image_convert.get_best_tile(block, color_diffs, charset.conversion_masks)
+        assert tuple(int(t) for t in tile) == \
+            tuple(int(t) for t in loop_best_tile(block, color_diffs, charset, char_array))
+
+def test_block_cache_exact_output(tmp_path, monkeypatch):
+    matched = []
+    get_best_tile = image_convert.get_best_tile
+    def counting_get_best_tile(block, *args):
+        matched.append(block.tobytes())
+        return get_best_tile(block, *args)
+    monkeypatch.setattr(image_convert, 'get_best_tile', counting_get_best_tile)
+    for filename in [make_image(tmp_path / 'gradient.png', size=(128, 96)),
+                     make_pattern_image(tmp_path / 'pattern.png')]:
+        results = {}
+        for cache_blocks in (False, True):
+            monkeypatch.setattr(image_convert.ImageConverter, 'cache_blocks', cache_blocks)
+            matched.clear()
+            art, converter = convert(str(filename), 16, 12)
+            results[cache_blocks] = get_tiles(art), converter, len(matched)
+        for a, b in zip(results[False][0], results[True][0]):
+            assert (a == b).all()
+        converter, matches = results[True][1:]
+        # every block scored without cache, only unique ones with it
+        assert results[False][2] == 16 * 12
+        assert matches == len(set(matched))
+        assert converter.cache_hits == 16 * 12 - matches
+    # pattern image only has 4 unique blocks
+    assert matches == 4
+    assert image_convert.get_cache_report(188, 192) in converter.app.log_lines
+
+def test_convert_image_workers_match(tmp_path, workers):
+    filename = str(make_image(tmp_path / 'gradient.png'))
+    workers(1)
+    in_app = get_tiles(image_convert.convert_image(filename, CHARSET, PALETTE, 16, 12))
+    workers(2)
+    pooled = get_tiles(image_convert.convert_image(filename, CHARSET, PALETTE, 16, 12))
+    for a, b in zip(in_app, pooled):
+        assert (a == b).all()
+
+def test_sequence_shares_row_pool(tmp_path, workers, monkeypatch):
+    filenames = [str(make_image(tmp_path / ('frame%d.png' % i), seed=i))
+                 for i in range(4)]
+    pools = []
+    new_pool = multiprocessing.Pool
+    def pool(*args, **kwargs):
+        pools.append(new_pool(*args, **kwargs))
+        return pools[-1]
+    monkeypatch.setattr(image_convert.multiprocessing, 'Pool', pool)
+    sequences = {}
+    for count in (1, 2):
+        workers(count)
+        art = convert_sequence(filenames, 16, 12)[0]
+        sequences[count] = [get_tiles(art, frame) for frame in range(art.frames)]
+    # one pool for the whole sequence, stopped once it's done
+    assert len(pools) == 1
+    assert pools[0]._state != 'RUN'
+    for frame, pooled in zip(sequences[1], sequences[2]):
+        for a, b in zip(frame, pooled):
+            assert (a == b).all()
+
+
+def test_sequence_temporal_coherence_exact(tmp_path, monkeypatch):
+    filenames = make_sequence(str(tmp_path), 6, changed=0.1)
+    results = {}
+    for coherence in (False, True):
+        monkeypatch.setattr(ImageSequenceConverter, 'temporal_coherence', coherence)
+        art, converter = convert_sequence(filenames, 16, 12)
+        results[coherence] = [get_tiles(art, frame) for frame in range(art.frames)], converter
+    for frame, coherent in zip(results[False][0], results[True][0]):
+        for a, b in zip(frame, coherent):
+            assert (a == b).all()
+    # first frame converted in full, ~90% of each later one copied
+    converter = results[True][1]
+    changed = round(16 * 12 * 0.1)
+    assert converter.tiles_unchanged == (16 * 12 - changed) * 5
+    assert converter.tiles_done == 16 * 12 + changed * 5
+    assert results[False][1].tiles_unchanged == 0
+
+
+class FakeClock:
+    "Clock that advances given seconds each time it's read."
+    def __init__(self, tick):
+        self.time, self.tick = 0, tick
+    
+    def __call__(self):
+        self.time += self.tick
+        return self.time
+
+def test_run_for_stops_at_budget():
+    calls = []
+    def step():
+        calls.append(1)
+        return True
+    # first read sets deadline, each step reads once more
+    assert image_convert.run_for(step, 0.05, FakeClock(0.01)) == 5
+    assert len(calls) == 5
+
+def test_run_for_stops_when_done():
+    remaining = [3]
+    def step():
+        remaining[0] -= 1
+        return remaining[0] > 0
+    assert image_convert.run_for(step, 10, FakeClock(0.01)) == 3
+
+def test_run_for_runs_at_least_once():
+    assert image_convert.run_for(lambda: True, 0, FakeClock(1)) == 1
+    assert image_convert.run_for(lambda: True, -1, FakeClock(1)) == 1
+
+def test_pool_results_set_within_budget(tmp_path, workers, monkeypatch):
+    filename = str(make_image(tmp_path / 'gradient.png'))
+    workers(2)
+    # no time for more than one row each update
+    monkeypatch.setattr(image_convert.ImageConverter, 'frame_budget_ms', 0)
+    app = HeadlessApp()
+    art = app.new_art('budget', 16, 12, CHARSET, PALETTE)
+    converter = image_convert.ImageConverter(app, filename, art)
+    tiles_done = []
+    while not converter.finished:
+        converter.update()
+        assert converter.pool or converter.finished
+        tiles_done.append(converter.tiles_done)
+    # one 16 tile row per update
+    assert tiles_done == list(range(16, 16 * 13, 16))
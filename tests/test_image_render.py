@@ -0,0 +1,103 @@
+"""
+Golden image tests for the software renderer. After an intended change to
+its output, regenerate the images with: python tests/test_image_render.py
+"""
+
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import conftest
+from art import uv_types
+from headless import HeadlessApp
+from image_render import get_render_layers, render_frame_array
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden/')
+
+
+def make_layered_art(app):
+    """
+    Return art with a layer of assorted chars, colors and transforms, a
+    layer over it with transparent BG and FG tiles, and a hidden layer.
+    """
+    art = app.new_art('render_layers', 6, 4, 'c64_petscii', 'c64_original')
+    for y in range(art.height):
+        for x in range(art.width):
+            i = y * art.width + x
+            art.set_tile_at(0, 0, x, y, 1 + i * 7 % 120, 1 + i % 15,
+                            1 + i * 5 % 15, i % len(uv_types))
+    art.add_layer(name='over')
+    for x in range(3):
+        art.set_tile_at(0, 1, x, 1, 81, 2, 0)
+    art.set_tile_at(0, 1, 4, 2, 81, 0, 5)
+    art.add_layer(name='hidden')
+    for y in range(art.height):
+        for x in range(art.width):
+            art.set_tile_at(0, 2, x, y, 160, 1, 2)
+    art.layers_visibility[2] = False
+    return art
+
+def get_cases(app):
+    "Return {golden image name: (art, frame, render_frame_array kwargs)}."
+    hello = app.load_art('hello1')
+    layered = make_layered_art(app)
+    return {
+        'hello1_frame0': (hello, 0, {}),
+        'hello1_frame3_scale2': (hello, 3, {'scale': 2}),
+        'hello1_frame5_bg': (hello, 5, {'bg_color': (0.2, 0.4, 0.6, 1)}),
+        'layers': (layered, 0, {}),
+        'layers_show_hidden': (layered, 0, {'show_hidden': True}),
+        'layers_reversed': (layered, 0, {'layers': [1, 0]}),
+    }
+
+def write_golden_images():
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    for name, (art, frame, kwargs) in get_cases(HeadlessApp()).items():
+        pixels = render_frame_array(art, frame, **kwargs)
+        Image.fromarray(pixels, 'RGBA').save('%s%s.png' % (GOLDEN_DIR, name))
+        print('wrote %s%s.png' % (GOLDEN_DIR, name))
+
+
+@pytest.fixture(scope='module')
+def app():
+    return HeadlessApp()
+
+@pytest.mark.parametrize('name', ['hello1_frame0', 'hello1_frame3_scale2',
+                                  'hello1_frame5_bg', 'layers',
+                                  'layers_show_hidden', 'layers_reversed'])
+def test_golden_images(app, name):
+    art, frame, kwargs = get_cases(app)[name]
+    pixels = render_frame_array(art, frame, **kwargs)
+    golden = np.asarray(Image.open('%s%s.png' % (GOLDEN_DIR, name)).convert('RGBA'))
+    assert pixels.shape == golden.shape
+    assert (pixels == golden).all()
+
+def test_hidden_layers_skipped(app):
+    art = make_layered_art(app)
+    assert get_render_layers(art) == [0, 1]
+    assert get_render_layers(art, [2, 1, 0]) == [1, 0]
+    assert get_render_layers(art, 2) == []
+    assert get_render_layers(art, [2, 1, 0], show_hidden=True) == [2, 1, 0]
+    assert get_render_layers(art, 2, show_hidden=True) == [2]
+    # explicitly listed hidden layers don't show up in renders either
+    visible = render_frame_array(art, 0, layers=[0, 1])
+    assert (render_frame_array(art, 0, layers=[0, 1, 2]) == visible).all()
+    assert not render_frame_array(art, 0, layers=2).any()
+    assert render_frame_array(art, 0, layers=2, show_hidden=True).any()
+
+def test_solid_tile_colors(app):
+    art = app.new_art('render_solid', 2, 1, 'c64_petscii', 'c64_original')
+    # char 0 is blank: tile is all BG color
+    art.set_tile_at(0, 0, 0, 0, 0, 1, 5)
+    # FG and BG both transparent: nothing drawn
+    art.set_tile_at(0, 0, 1, 0, 0, 0, 0)
+    pixels = render_frame_array(art, 0)
+    cw = art.charset.char_width
+    assert (pixels[:, :cw] == art.palette.colors[5]).all()
+    assert not pixels[:, cw:].any()
+
+
+if __name__ == '__main__':
+    write_golden_images()
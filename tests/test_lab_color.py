@@ -0,0 +1,53 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from lab_color import rgb_to_lab, lab_color_diff, rgb_to_lab_array, lab_distance_matrix
+
+SEEDS = range(5)
+
+
+def random_rgb(seed, count=2000):
+    "count random RGB colors, plus every corner of the RGB cube and the grays"
+    rng = np.random.default_rng(seed)
+    corners = np.array(list(itertools.product([0, 255], repeat=3)))
+    grays = np.repeat(np.arange(256)[:, np.newaxis], 3, axis=1)
+    return np.concatenate([rng.integers(0, 256, (count, 3)), corners, grays])
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_rgb_to_lab_array_matches_scalar(seed):
+    rgb = random_rgb(seed)
+    labs = rgb_to_lab_array(rgb)
+    assert labs.shape == rgb.shape
+    for color, lab in zip(rgb, labs):
+        # numpy's vectorized ** can differ from math's pow in the last bit
+        assert lab == pytest.approx(rgb_to_lab(*map(int, color)), rel=1e-12, abs=1e-9)
+
+def test_rgb_to_lab_array_shapes():
+    rgb = random_rgb(0, 56).reshape(4, 80, 3)
+    labs = rgb_to_lab_array(rgb)
+    assert labs.shape == (4, 80, 3)
+    assert (labs == rgb_to_lab_array(rgb.reshape(-1, 3)).reshape(4, 80, 3)).all()
+    # lists and single colors work too
+    assert rgb_to_lab_array([255, 128, 0]) == pytest.approx(rgb_to_lab(255, 128, 0),
+                                                            rel=1e-12, abs=1e-9)
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_lab_distance_matrix_matches_scalar(seed):
+    labs1 = rgb_to_lab_array(random_rgb(seed, 200))
+    labs2 = rgb_to_lab_array(random_rgb(seed + len(SEEDS), 50))
+    distances = lab_distance_matrix(labs1, labs2)
+    assert distances.shape == (len(labs1), len(labs2))
+    for i, j in itertools.product(range(0, len(labs1), 7), range(len(labs2))):
+        assert distances[i, j] == pytest.approx(lab_color_diff(*labs1[i], *labs2[j]),
+                                                rel=1e-12, abs=1e-12)
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_lab_distance_matrix_self(seed):
+    labs = rgb_to_lab_array(random_rgb(seed, 100))
+    distances = lab_distance_matrix(labs)
+    assert (distances == lab_distance_matrix(labs, labs)).all()
+    assert (distances == distances.T).all()
+    assert (np.diag(distances) == 0).all()
+    assert (distances >= 0).all()
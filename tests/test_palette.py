@@ -0,0 +1,129 @@
+import glob, os.path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import image_convert
+import palette as palette_module
+from headless import HeadlessApp
+from lab_color import rgb_to_lab_array
+
+REPO_DIR = os.path.join(os.path.dirname(__file__), '..')
+BUNDLED_PALETTES = sorted(os.path.relpath(f, REPO_DIR) for f in
+                          glob.glob(os.path.join(REPO_DIR, 'palettes/*')) +
+                          glob.glob(os.path.join(REPO_DIR, 'games/*/palettes/*')))
+
+
+def load_bundled_palette(filename):
+    # game palettes are found in their game's dir
+    game_dir = os.path.dirname(os.path.dirname(os.path.join(REPO_DIR, filename)))
+    app = HeadlessApp(documents_dir=game_dir + '/' if filename.startswith('games') else '')
+    return app.load_palette(os.path.basename(filename))
+
+def get_brute_force_indices(palette, colors):
+    "index of closest color to each of given colors, comparing against all"
+    labs = rgb_to_lab_array(colors)
+    distances = ((palette.get_lab_colors()[np.newaxis] - labs[:, np.newaxis])**2).sum(axis=-1)
+    return np.argmin(distances, axis=1)
+
+def test_lookup_bins_bound_every_color():
+    centers, radii = palette_module.get_lookup_bins()
+    size = 2 ** palette_module.LOOKUP_BITS
+    step = 256 // size
+    centers = centers.reshape(size, size, size, 3)
+    radii = radii.reshape(size, size, size)
+    values = np.arange(256)
+    # every RGB color, one red bin's worth at a time
+    for r in range(size):
+        rgb = np.stack(np.meshgrid(np.arange(r * step, (r + 1) * step), values, values,
+                                   indexing='ij'), axis=-1)
+        labs = rgb_to_lab_array(rgb).reshape(step, size, step, size, step, 3)
+        deltas = labs - centers[r][np.newaxis, :, np.newaxis, :, np.newaxis]
+        farthest = np.sqrt((deltas**2).sum(axis=-1)).max(axis=(0, 2, 4))
+        assert (farthest <= radii[r]).all()
+
+@pytest.mark.parametrize('filename', BUNDLED_PALETTES)
+def test_closest_color_matches_brute_force(filename):
+    palette = load_bundled_palette(filename)
+    assert palette
+    rng = np.random.default_rng(len(palette.colors))
+    own = np.array([color[:3] for color in palette.colors])
+    # random colors, palette's own colors, and colors just off them
+    colors = np.concatenate([rng.integers(0, 256, (20000, 3)), own,
+                             np.clip(own + rng.integers(-3, 4, own.shape), 0, 255)])
+    indices = palette.get_closest_color_indices(colors)
+    assert (indices == get_brute_force_indices(palette, colors)).all()
+
+def make_palette_image(filename, count, seed=0, width=32):
+    """
+    Save a palette image of given # of unique random opaque colors, plus
+    transparent and repeated pixels that don't count towards it.
+    """
+    rng = np.random.default_rng(seed)
+    packed = rng.choice(2 ** 24, count, replace=False)
+    colors = np.stack([packed >> 16, (packed >> 8) & 255, packed & 255,
+                       np.full(count, 255)], axis=-1).astype(np.uint8)
+    transparent = np.zeros((1, 4), dtype=np.uint8)
+    pixels = np.concatenate([colors, transparent, colors[:width - 1]])
+    height = -(-len(pixels) // width)
+    padding = np.zeros((width * height - len(pixels), 4), dtype=np.uint8)
+    Image.fromarray(np.concatenate([pixels, padding]).reshape(height, width, 4)).save(filename)
+    return [(0, 0, 0, 0)] + [tuple(int(c) for c in color) for color in colors]
+
+def test_load_max_colors(tmp_path):
+    filename = str(tmp_path / 'big.png')
+    colors = make_palette_image(filename, palette_module.MAX_COLORS - 1)
+    app = HeadlessApp()
+    palette = app.load_palette(filename)
+    assert palette and palette.init_success
+    # transparent color 0 + 1023 colors, in image order
+    assert palette.colors == colors
+    luminosities = [c[0] * 0.21 + c[1] * 0.72 + c[2] * 0.07 for c in colors[1:]]
+    assert palette.darkest_index == np.argmin(luminosities) + 1
+    assert palette.lightest_index == np.argmax(luminosities) + 1
+
+def test_load_too_many_colors(tmp_path):
+    filename = str(tmp_path / 'too_big.png')
+    make_palette_image(filename, palette_module.MAX_COLORS)
+    app = HeadlessApp()
+    palette = palette_module.Palette(app, filename, False)
+    assert not palette.init_success
+    assert palette.load_image() is False
+    assert app.load_palette(filename) is None
+    assert any('1024 unique colors, more than the maximum of 1023' in line
+               for line in app.log_lines)
+
+def test_palettized_image_modes(tmp_path):
+    app = HeadlessApp()
+    filename = str(tmp_path / 'big.png')
+    colors = make_palette_image(filename, 1000)
+    big = app.load_palette(filename)
+    small = app.load_palette('c64_original')
+    # image of every big palette color, and transparent color at the end
+    pixels = np.array([c[:3] for c in colors[1:]] + [(0, 0, 0)] * 8,
+                      dtype=np.uint8).reshape(-1, 16, 3)
+    src_img = Image.fromarray(pixels)
+    img = big.get_palettized_image(src_img)
+    assert img.mode == 'I'
+    indices = np.asarray(img).ravel()
+    assert (indices[:1000] == np.arange(1, 1001)).all()
+    assert (indices[1000:] == 0).all()
+    # transparent color can be turned off or changed
+    no_transparency = np.asarray(big.get_palettized_image(src_img, force_no_transparency=True))
+    assert (no_transparency.ravel()[1000:] == big.get_closest_color_index(0, 0, 0)).all()
+    assert (np.asarray(big.get_palettized_image(src_img, colors[5][:3])).ravel()[4] == 0)
+    # 8-bit images for <= 256 colors
+    assert big.get_palettized_image(src_img, max_colors=256).mode == 'P'
+    assert small.get_palettized_image(src_img).mode == 'P'
+
+def test_convert_with_max_colors(tmp_path):
+    filename = str(tmp_path / 'big.png')
+    make_palette_image(filename, palette_module.MAX_COLORS - 1)
+    rng = np.random.default_rng(0)
+    image_filename = str(tmp_path / 'noise.png')
+    Image.fromarray(rng.integers(0, 256, (24, 32, 3), dtype=np.uint8)).save(image_filename)
+    art = image_convert.convert_image(image_filename, 'c64_petscii', filename, 4, 3)
+    assert art
+    # color indices past 8 bits survive conversion
+    assert max(art.fg_colors[0][0].max(), art.bg_colors[0][0].max()) > 255
@@ -0,0 +1,142 @@
+import random
+
+from collision import (CST_CIRCLE, CST_AABB, CST_TILE, CT_GENERIC_STATIC,
+                       CT_GENERIC_DYNAMIC, CT_PLAYER)
+from game_object import GameObject, TIMER_UPDATE
+from game_util_objects import Player
+from headless_world import HeadlessWorld, make_object
+
+
+class Pusher(GameObject):
+    "Overrides update, and moves another object from it."
+    def update(self):
+        if self.target and random.random() < 0.2:
+            self.target.move(1, -1)
+        # set outright: changes relative to current values land on top of
+        # PhysicsArrays' step instead, see its docstring
+        if self.target and random.random() < 0.05:
+            self.target.x, self.target.y = self.x + 1, self.y
+            self.target.vel_y = -3
+        GameObject.update(self)
+
+class Floaty(GameObject):
+    "Overrides a physics method, so always runs its own apply_move."
+    def is_on_ground(self):
+        return False
+
+class TimedMover(GameObject):
+    "Moves itself from a timer in the update slot."
+    def start_timer(self):
+        self.set_timer_function('nudge', self.nudge, 0.1, repeats=-1,
+                                slot=TIMER_UPDATE)
+
+    def nudge(self):
+        self.move(-1, 0.5)
+
+
+def build_world(num_objects=100, seed=4):
+    world = HeadlessWorld()
+    rng = random.Random(seed)
+    side = 30
+    # walls around the edge of a side x side room
+    art = world.app.new_art('physics_walls', side + 4, side + 4)
+    art.layer_names[0] = 'collision'
+    for i in range(side + 4):
+        for x, y in [(i, 0), (i, side + 3), (0, i), (side + 3, i)]:
+            art.set_char_index_at(0, 0, x, y, 1)
+    make_object(world, 'walls', side / 2, side / 2, shape=CST_TILE,
+                ctype=CT_GENERIC_STATIC, art=art)
+    classes = [GameObject, Player, Pusher, GameObject, Floaty, TimedMover]
+    for i in range(num_objects):
+        obj_class = classes[i % len(classes)]
+        kwargs = {'mass': rng.uniform(0.5, 2)}
+        if i % 5 == 0:
+            kwargs['ground_friction'] = rng.uniform(2, 20)
+        if i % 7 == 0:
+            kwargs['can_sleep'] = True
+        if i % 9 == 0:
+            kwargs['fast_move_steps'] = 1
+        obj = make_object(world, 'obj%d' % i, rng.uniform(2, side - 2),
+                          rng.uniform(2, side - 2),
+                          shape=CST_CIRCLE if i % 4 < 2 else CST_AABB,
+                          ctype=CT_PLAYER if obj_class is Player else CT_GENERIC_DYNAMIC,
+                          radius=rng.uniform(0.3, 0.6), width=rng.uniform(0.5, 1.2),
+                          height=rng.uniform(0.5, 1.2), obj_class=obj_class,
+                          **kwargs)
+        obj.vel_x, obj.vel_y = rng.uniform(-10, 10), rng.uniform(-10, 10)
+    # pushers move the object after them, which updates later
+    objects = list(world.objects.values())
+    for obj, next_obj in zip(objects, objects[1:] + [None]):
+        if type(obj) is Pusher:
+            obj.target = next_obj
+        elif type(obj) is TimedMover:
+            obj.start_timer()
+    return world
+
+def get_state(world):
+    return [(obj.x, obj.y, obj.z, obj.vel_x, obj.vel_y, obj.vel_z, obj.sleeping)
+            for obj in world.objects.values()]
+
+def run_world(vectorized, ticks=600, switch_ticks=()):
+    "Run world, returning its state after each tick."
+    world = build_world()
+    world.vectorized_physics = vectorized
+    # same input and object randomness for each run
+    input_rng = random.Random(11)
+    random.seed(5)
+    states = []
+    integrated = 0
+    for tick in range(ticks):
+        if tick in switch_ticks:
+            world.vectorized_physics = not world.vectorized_physics
+        for obj in world.objects.values():
+            obj.frame_begin()
+        # player input, which arrives before the world updates
+        for obj in world.objects.values():
+            if input_rng.random() < 0.1:
+                obj.move(input_rng.choice([-1, 0, 1]),
+                         input_rng.choice([-1, 0, 0.5, 1]))
+        world.update()
+        integrated += len(world.physics.objects) if world.vectorized_physics else 0
+        states.append(get_state(world))
+    return states, integrated
+
+def test_vectorized_physics_matches_apply_move():
+    states, _ = run_world(False)
+    vectorized_states, integrated = run_world(True)
+    assert integrated > 0
+    for tick, (state, vectorized_state) in enumerate(zip(states, vectorized_states)):
+        assert state == vectorized_state, 'diverged at tick %s' % tick
+
+def test_switching_backend_mid_run():
+    states, _ = run_world(False, ticks=300)
+    switched_states, _ = run_world(True, ticks=300, switch_ticks=(100, 200))
+    assert states == switched_states
+
+def test_update_timer_objects_not_integrated():
+    world = build_world(24)
+    world.vectorized_physics = True
+    world.update()
+    integrated = set(world.physics.objects)
+    assert integrated
+    for obj in world.objects.values():
+        if obj.timer_functions_update or type(obj) in (Pusher, Floaty):
+            assert not obj in integrated
+
+def test_eligible_classes():
+    world = HeadlessWorld()
+    class Mixin:
+        pass
+    class MixedIn(Mixin, GameObject):
+        pass
+    class MixedInUpdate(Mixin, GameObject):
+        def update(self):
+            GameObject.update(self)
+    class OptedOut(GameObject):
+        allow_vectorized_physics = False
+    assert world.physics.can_integrate_class(GameObject)
+    assert world.physics.can_integrate_class(Player)
+    assert world.physics.can_integrate_class(MixedIn)
+    assert not world.physics.can_integrate_class(MixedInUpdate)
+    assert not world.physics.can_integrate_class(Floaty)
+    assert not world.physics.can_integrate_class(OptedOut)
@@ -0,0 +1,108 @@
+import pytest
+
+from headless import HeadlessApp
+from renderable import TileRenderable
+
+CHAR_BUFFER, UV_BUFFER, FG_BUFFER, BG_BUFFER = 1, 2, 3, 4
+
+
+class RecordingRenderable(TileRenderable):
+    "TileRenderable with no GL: records uploads instead of making them."
+    def __init__(self, art):
+        self.app, self.art = art.app, art
+        self.frame = 0
+        self.log_buffer_updates = False
+        self.char_buffer, self.uv_buffer = CHAR_BUFFER, UV_BUFFER
+        self.fg_buffer, self.bg_buffer = FG_BUFFER, BG_BUFFER
+        self.buffer_sizes = {}
+        self.uploads = []
+        for buffer_index, data in [(CHAR_BUFFER, self.get_vertex_data(art.chars)),
+                                   (FG_BUFFER, self.get_vertex_data(art.fg_colors)),
+                                   (BG_BUFFER, self.get_vertex_data(art.bg_colors)),
+                                   (UV_BUFFER, self.get_uv_data())]:
+            self.update_buffer(buffer_index, data, None, None, None, None, None)
+        self.uploads = []
+
+    def update_buffer(self, buffer_index, array, target, buffer_type, data_type,
+                      attrib_name, attrib_size):
+        self.buffer_sizes[buffer_index] = array.nbytes
+        self.uploads.append((buffer_index, None, array.nbytes))
+
+    def update_buffer_range(self, buffer_index, array, offset):
+        self.uploads.append((buffer_index, offset, array.nbytes))
+
+    def update_from_art(self):
+        "upload tile data changed since last update, as Art.update does"
+        art = self.art
+        rows = art.dirty_rows.get(self.frame)
+        self.update_tile_buffers(art.char_changed_frames.get(self.frame),
+                                 art.uv_changed_frames.get(self.frame),
+                                 art.fg_changed_frames.get(self.frame),
+                                 art.bg_changed_frames.get(self.frame), rows)
+        uploads, self.uploads = self.uploads, []
+        art.update()
+        return uploads
+
+
+@pytest.fixture
+def art():
+    art = HeadlessApp().new_art('partial_upload', 10, 6)
+    art.add_layer()
+    art.update()
+    return art
+
+def test_partial_upload_byte_ranges(art):
+    r = RecordingRenderable(art)
+    tile_nbytes, uv_nbytes = r.get_tile_buffer_nbytes()
+    art.set_char_index_at(0, 1, 0, 2, 5)
+    art.set_char_index_at(0, 1, 9, 3, 5)
+    # rows 8-9 of 12, counting down through both layers
+    assert r.update_from_art() == [(CHAR_BUFFER, 8 * 10 * tile_nbytes,
+                                    2 * 10 * tile_nbytes)]
+    art.set_tile_at(0, 0, 4, 0, fg=2, bg=3, transform=1)
+    offset, size = art.get_dirty_byte_range(0, uv_nbytes)
+    assert (offset, size) == (0, 10 * uv_nbytes)
+    assert sorted(r.update_from_art()) == [(UV_BUFFER, offset, size),
+                                           (FG_BUFFER, 0, 10 * tile_nbytes),
+                                           (BG_BUFFER, 0, 10 * tile_nbytes)]
+
+def test_partial_upload_data(art):
+    r = RecordingRenderable(art)
+    art.set_char_index_at(0, 1, 3, 4, 77)
+    rows = art.dirty_rows[0]
+    data = r.get_vertex_data(art.chars, rows)
+    full = r.get_vertex_data(art.chars).reshape(-1, 10 * 4)
+    # same values full upload would put at that byte range
+    offset, size = art.get_dirty_byte_range(0, r.get_tile_buffer_nbytes()[0])
+    assert data.nbytes == size
+    assert data.tobytes() == full.tobytes()[offset:offset + size]
+    assert 77 in data
+
+def test_full_upload_past_max_fraction(art):
+    r = RecordingRenderable(art)
+    tile_nbytes = r.get_tile_buffer_nbytes()[0]
+    full_size = 12 * 10 * tile_nbytes
+    # 6 of 12 rows: exactly max fraction, still partial
+    art.fill_region(0, 0, 0, 0, 10, 6, char=1)
+    assert r.update_from_art() == [(CHAR_BUFFER, 0, full_size // 2)]
+    # 7 rows: full upload
+    art.fill_region(0, 0, 0, 0, 10, 6, char=2)
+    art.set_char_index_at(0, 1, 0, 0, 2)
+    assert r.update_from_art() == [(CHAR_BUFFER, None, full_size)]
+    # threshold is configurable
+    r.partial_update_max_fraction = 0
+    art.set_char_index_at(0, 1, 0, 0, 3)
+    assert r.update_from_art() == [(CHAR_BUFFER, None, full_size)]
+    # whole frame changed
+    r.partial_update_max_fraction = TileRenderable.partial_update_max_fraction
+    art.mark_frame_changed(0)
+    uploads = r.update_from_art()
+    assert len(uploads) == 4
+    assert all(offset is None for b, offset, size in uploads)
+
+def test_full_upload_after_resize(art):
+    r = RecordingRenderable(art)
+    art.add_layer()
+    # buffers are sized for 2 layers, so even a 1 row change replaces them
+    r.update_tile_buffers(True, False, False, False, [0, 0])
+    assert r.uploads == [(CHAR_BUFFER, None, 18 * 10 * r.get_tile_buffer_nbytes()[0])]
@@ -0,0 +1,186 @@
+import math, random
+
+import pytest
+
+from collision import (box_sweep_box, circle_sweep_box, circle_sweep_circle,
+                       CircleCollisionShape, AABBCollisionShape, CST_CIRCLE,
+                       CST_AABB, CST_TILE, CT_GENERIC_STATIC, SWEEP_FLUSH_DEPTH)
+from headless_world import HeadlessWorld, make_object
+
+
+def test_thin_wall():
+    # 0.1 wide box, circle moving far past it in one update
+    assert circle_sweep_box(0, 0, 1000, 0, 0.2, 5, 0, 0.05, 2) == ((5 - 0.05 - 0.2) / 1000, -1, 0)
+    t, nx, ny = box_sweep_box(0, 0, 0, -1e6, 0.5, 0.5, 0, -100, 10, 0.01)
+    assert (nx, ny) == (0, 1)
+    assert t * 1e6 == pytest.approx(100 - 0.51)
+
+def test_corners():
+    # circle hits box's rounded corner, not its grown box's corner
+    t, nx, ny = circle_sweep_box(-2, -2, 4, 4, 0.5, 0, 0, 0.5, 0.5)
+    assert t == pytest.approx((2 - 0.5 - 0.5 / math.sqrt(2)) / 4)
+    assert (nx, ny) == pytest.approx((-1 / math.sqrt(2), -1 / math.sqrt(2)))
+    # crosses grown box's corner but misses rounded one
+    assert circle_sweep_box(-1.4, -0.5, 1, -1, 0.5, 0, 0, 0.5, 0.5) is None
+    # box vs box: diagonal into a corner hits, only touching a corner doesn't
+    assert box_sweep_box(-2, -2, 4, 4, 0.5, 0.5, 1, 1, 0.5, 0.5) is not None
+    assert box_sweep_box(0, 1, 2, -2, 0.5, 0.5, 2, 1, 0.5, 0.5) is None
+
+def test_sliding_and_moving_away():
+    # sliding along a touching face isn't a hit, moving into it is at time 0
+    assert box_sweep_box(0, 1, 5, 0, 0.5, 0.5, 2, 0, 5, 0.5) is None
+    assert box_sweep_box(0, 1, 5, -0.1, 0.5, 0.5, 2, 0, 5, 0.5) == (0, 0, 1)
+    assert circle_sweep_box(0, 2, 0, 5, 0.5, 0, 0, 1, 1) is None
+    assert circle_sweep_circle(0, 2, 0, 5, 0, 0, 1) is None
+
+def test_flush_start():
+    # float rounding can leave a shape resolved flush against another just
+    # inside it: moving further in must still hit
+    for depth in [0, 1e-15, 1e-12, SWEEP_FLUSH_DEPTH / 2]:
+        x = 2 - 1 + depth
+        hit = box_sweep_box(x, 0, 5, 0, 0.5, 0.5, 2, 0, 0.5, 0.5)
+        assert hit == pytest.approx((0, -1, 0))
+        hit = circle_sweep_box(x, 0, 5, 0, 0.5, 2, 0, 0.5, 0.5)
+        assert hit == pytest.approx((0, -1, 0))
+        t, nx, ny = circle_sweep_circle(x, 0, 5, 0, 2, 0, 1)
+        assert (t, nx, ny) == pytest.approx((0, -1, 0))
+        # moving away from it is fine
+        assert box_sweep_box(x, 0, -5, 0, 0.5, 0.5, 2, 0, 0.5, 0.5) is None
+        assert circle_sweep_circle(x, 0, -5, 0, 2, 0, 1) is None
+    # really inside: left to collision resolution
+    assert box_sweep_box(0, 0, 5, 0, 0.5, 0.5, 0, 0, 1, 1) is None
+    assert circle_sweep_box(0, 0, 5, 0, 0.5, 0, 0, 1, 1) is None
+    assert circle_sweep_circle(0, 0, 5, 0, 0.5, 0, 1) is None
+
+def test_sweeps_match_dense_sampling():
+    rng = random.Random(3)
+    def make_shape(kind, x, y):
+        if kind == 'c':
+            return CircleCollisionShape(x, y, rng.uniform(0.1, 1), None)
+        return AABBCollisionShape(x, y, rng.uniform(0.05, 1),
+                                  rng.uniform(0.05, 1), None)
+    steps = 2000
+    for trial in range(1000):
+        kinds = rng.choice(['cc', 'cb', 'bb', 'bc'])
+        mover = make_shape(kinds[0], 0, 0)
+        other = make_shape(kinds[1], rng.uniform(-3, 3), rng.uniform(-3, 3))
+        sx, sy = rng.uniform(-6, 6), rng.uniform(-6, 6)
+        dx, dy = rng.uniform(-12, 12), rng.uniform(-12, 12)
+        mover.x, mover.y = sx, sy
+        if mover.get_overlap(other).dist < 0:
+            continue
+        hit = mover.get_sweep_hit(other, sx, sy, dx, dy)
+        sampled = None
+        for i in range(steps + 1):
+            mover.x, mover.y = sx + dx * i / steps, sy + dy * i / steps
+            if mover.get_overlap(other).dist < -1e-9:
+                sampled = i / steps
+                break
+        # grazing contacts can differ
+        if sampled is None or hit is None:
+            assert sampled is None or sampled > 0.99 or hit is not None
+            continue
+        assert hit.time <= sampled + 1e-9
+        assert sampled - hit.time < 0.01
+        # normal is unit length and faces the move
+        assert math.hypot(hit.x, hit.y) == pytest.approx(1)
+        assert hit.x * dx + hit.y * dy < 0
+
+
+def wall_world():
+    "Return world with a tile object: a 1-tile wall at x 0-1 and an L corner."
+    world = HeadlessWorld()
+    art = world.app.new_art('sweep_walls', 40, 40)
+    art.layer_names[0] = 'collision'
+    for y in range(40):
+        art.set_char_index_at(0, 0, 20, y, 1)
+    for x in range(5, 12):
+        art.set_char_index_at(0, 0, x, 30, 1)
+    for y in range(30, 38):
+        art.set_char_index_at(0, 0, 5, y, 1)
+    make_object(world, 'walls', 0, 40, shape=CST_TILE,
+                ctype=CT_GENERIC_STATIC, art=art)
+    return world
+
+def fire(world, x, y, speed, angle, shape=CST_CIRCLE, size=0.25):
+    "Move a bullet one update from given point and return it after fast_move."
+    bullet = make_object(world, 'bullet', x, y, shape=shape, radius=size,
+                         width=size * 2, height=size * 2, fast_move_steps=1)
+    world.cl.update()
+    bullet.vel_x = math.cos(angle) * speed
+    bullet.vel_y = math.sin(angle) * speed
+    bullet.x += bullet.vel_x * world.app.timestep / 1000
+    bullet.y += bullet.vel_y * world.app.timestep / 1000
+    bullet.fast_move()
+    return bullet
+
+@pytest.mark.parametrize('shape', [CST_CIRCLE, CST_AABB])
+@pytest.mark.parametrize('speed', [500, 1e4, 1e6])
+def test_fast_move_thin_wall(shape, speed):
+    for angle in range(-40, 41, 10):
+        world = wall_world()
+        bullet = fire(world, -10, 40, speed, math.radians(angle), shape)
+        assert bullet.last_sweep_hit is not None
+        assert bullet.x < 0.5
+        # velocity is left for collision resolution to bounce
+        assert bullet.vel_x == pytest.approx(math.cos(math.radians(angle)) * speed)
+        assert bullet.vel_y == pytest.approx(math.sin(math.radians(angle)) * speed)
+
+@pytest.mark.parametrize('speed', [200, 1e4, 1e6])
+def test_fast_move_corner(speed):
+    # fire from inside the L into its corner
+    for angle in range(100, 171, 7):
+        world = wall_world()
+        bullet = fire(world, -11.5, 25.5, speed, math.radians(angle))
+        assert bullet.last_sweep_hit is not None
+        assert bullet.x > -14.5 and bullet.y < 29.5
+
+def test_fast_move_flush_start():
+    world = HeadlessWorld()
+    make_object(world, 'wall', 2, 0, shape=CST_AABB, ctype=CT_GENERIC_STATIC,
+                width=1, height=4)
+    # resolved flush against wall but for rounding
+    bullet = make_object(world, 'bullet', 1 + 1e-13, 0, shape=CST_AABB,
+                         fast_move_steps=1)
+    world.cl.update()
+    for update in range(3):
+        bullet.last_x, bullet.last_y = bullet.x, bullet.y
+        bullet.vel_x = 3000
+        bullet.x += 100
+        bullet.fast_move()
+        assert bullet.last_sweep_hit is not None
+        assert bullet.x < 1 + SWEEP_FLUSH_DEPTH
+        bullet.collision.update()
+        world.cl.update()
+
+def run_updates(world, updates):
+    for update in range(updates):
+        for obj in world.objects.values():
+            obj.frame_begin()
+        world.update()
+
+@pytest.mark.parametrize('shape', [CST_CIRCLE, CST_AABB])
+@pytest.mark.parametrize('speed', [500, 1e4])
+def test_fast_move_bounces(shape, speed):
+    world = wall_world()
+    bullet = make_object(world, 'bullet', -10, 40, shape=shape, radius=0.25,
+                         width=0.5, height=0.5, fast_move_steps=1,
+                         bounciness=1)
+    bullet.vel_x = speed
+    run_updates(world, 3)
+    # bounced back off wall with what speed drag left it
+    assert bullet.vel_x < -speed / 10
+    assert bullet.x < 0.5
+
+def test_fast_move_passes_momentum():
+    world = HeadlessWorld()
+    bullet = make_object(world, 'bullet', -10, 0, shape=CST_CIRCLE,
+                         radius=0.25, fast_move_steps=1)
+    ball = make_object(world, 'ball', 5, 0, shape=CST_CIRCLE, radius=0.5)
+    bullet.vel_x = 1e4
+    run_updates(world, 2)
+    # hit ball rather than passing through it, and gave it its share of
+    # bullet's momentum, see resolve_collision_momentum
+    assert bullet.x < 5
+    assert abs(ball.vel_x) > 1e4 / 20
+    assert ball.vel_x == pytest.approx(bullet.vel_x)
@@ -76,9 +76,8 @@ class UIButton:
         elif self.y + self.height > self.element.art.height:
             return
         fg, bg = self.get_state_colors(self.state)
-        for y in range(self.height):
-            for x in range(self.width):
-                self.element.art.set_tile_at(0, 0, self.x + x, self.y + y, None, fg, bg)
+        self.element.art.fill_region(0, 0, self.x, self.y, self.x + self.width,
+                                     self.y + self.height, fg=fg, bg=bg)
     
     def hover(self):
         self.log_event('hovered')
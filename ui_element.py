@@ -427,7 +427,7 @@ class GameSelectionLabel(GameLabel):
             x /= len(self.ui.app.gw.selected_objects)
             y /= len(self.ui.app.gw.selected_objects)
             z /= len(self.ui.app.gw.selected_objects)
-        self.art.clear_line(0, 0, 0, self.ui.colors.white, -1)
+        self.art.clear_line(0, 0, 0, self.ui.colors.white, 0)
         self.art.write_string(0, 0, 0, 0, text)
         self.x, self.y = vector.world_to_screen_normalized(self.ui.app, x, y, z)
         self.reset_loc()
@@ -446,7 +446,7 @@ class GameHoverLabel(GameLabel):
         obj = self.ui.app.gw.hovered_focus_object
         text = obj.name[:self.tile_width-1]
         x, y, z = obj.x, obj.y, obj.z
-        self.art.clear_line(0, 0, 0, self.ui.colors.white, -1)
+        self.art.clear_line(0, 0, 0, self.ui.colors.white, 0)
         self.art.write_string(0, 0, 0, 0, text)
         self.x, self.y = vector.world_to_screen_normalized(self.ui.app, x, y, z)
         self.reset_loc()
@@ -1,5 +1,5 @@
 
-import os, time, json
+import os, time
 
 from PIL import Image
 
@@ -7,7 +7,7 @@ from texture import Texture
 from ui_chooser_dialog import ChooserDialog, ChooserItem, ChooserItemButton
 from ui_console import OpenCommand, LoadCharSetCommand, LoadPaletteCommand
 from ui_art_dialog import PaletteFromFileDialog, ImportOptionsDialog
-from art import ART_DIR, ART_FILE_EXTENSION, THUMBNAIL_CACHE_DIR, SCRIPT_FILE_EXTENSION, ART_SCRIPT_DIR
+from art import ART_DIR, ART_FILE_EXTENSION, THUMBNAIL_CACHE_DIR, SCRIPT_FILE_EXTENSION, ART_SCRIPT_DIR, read_art_file
 from palette import Palette, PALETTE_DIR, PALETTE_EXTENSIONS
 from charset import CharacterSet, CHARSET_DIR, CHARSET_FILE_EXTENSION
 from image_export import write_thumbnail
@@ -171,7 +171,7 @@ class ArtChooserItem(BaseFileChooserItem):
         # get file's hash for unique thumbnail name
         self.art_hash = app.get_file_hash(self.name)
         # rather than load the entire art, just get some high level stats
-        d = json.load(open(self.name))
+        d = read_art_file(self.name, load_tiles=False)
         self.art_width, self.art_height = d['width'], d['height']
         self.art_frames = len(d['frames'])
         self.art_layers = len(d['frames'][0]['layers'])
@@ -390,9 +390,8 @@ class ToolPopup(UIElement):
     def draw_tool_tab(self):
         self.art.clear_frame_layer(0, 0, self.bg_color, self.fg_color)
         # fill tool bar with dimmer color, highlight selected tool
-        for y in range(self.art.height):
-            for x in range(TOOL_PANE_WIDTH):
-                self.art.set_color_at(0, 0, x, y, self.ui.colors.medgrey, False)
+        self.art.fill_region(0, 0, 0, 0, TOOL_PANE_WIDTH, self.art.height,
+                             bg=self.ui.colors.medgrey)
         # set selected tool BG lighter
         y = self.tab_height + 1
         for i,tool in enumerate(self.ui.tools):
@@ -100,6 +100,7 @@ class StatusBarUI(UIElement):
     layer_label = 'layer:'
     frame_label = 'frame:'
     zoom_label = '%'
+    convert_label = 'converting:'
     right_items_width = len(tile_label) + len(layer_label) + len(frame_label) + (len('X/Y') + 2) * 2 + len('XX/YY') + 2 + len(zoom_label) + 10
     button_names = {
         CharToggleButton: 'char_toggle',
@@ -407,6 +408,18 @@ class StatusBarUI(UIElement):
         self.frame_cycle_button.x = x
         # frame label
         self.art.write_string(0, 0, x, 0, self.frame_label, dark, light, True)
+        # image conversion progress, if there's room
+        if self.ui.app.converter:
+            done, eta = self.ui.app.converter.get_progress()
+            progress = '%s%%' % int(done * 100)
+            if eta is not None:
+                eta = int(eta)
+                progress += ' ETA %s:%02d' % (eta // 60, eta % 60)
+            x -= padding + len(self.frame_label)
+            if x - len(self.convert_label + progress) - 1 > self.left_items_width:
+                self.art.write_string(0, 0, x, 0, progress, dark, light, True)
+                x -= len(progress) + 1
+                self.art.write_string(0, 0, x, 0, self.convert_label, dark, light, True)
     
     def render(self):
         if not self.ui.active_art:
@@ -146,9 +146,8 @@ class CharacterSetSwatch(UISwatch):
         self.shade.x, self.shade.y = self.x, self.y
     
     def set_xform(self, new_xform):
-        for y in range(self.art.height):
-            for x in range(self.art.width):
-                self.art.set_char_transform_at(0, 0, x, y, new_xform)
+        self.art.fill_region(0, 0, 0, 0, self.art.width, self.art.height,
+                             xform=new_xform)
     
     def is_selection_index_valid(self, index):
         return index < self.art.charset.last_index